@@ -0,0 +1,254 @@
+import io
+
+from flask import Blueprint, Response, abort, current_app, request, stream_with_context
+
+from models import db, Venue, Artist, Show
+from genres import genre_filter
+from geo import nearby_arguments, nearby_venues
+from bookings import free_slot_arguments, free_slots
+from matching import matching_available, recommend
+from queries import encode_cursor, filter_shows, show_filters
+from bulk_import import IMPORT_KINDS, check_database, read_records, import_records
+from export import EXPORT_MIMETYPES, EXPORT_SERIALIZERS, export_formats, export_rows
+from serializers import ModelSerializer, dumps
+from routing import router
+
+#----------------------------------------------------------------------------#
+# JSON API.
+#----------------------------------------------------------------------------#
+
+api = Blueprint('api', __name__, url_prefix='/api/v1')
+
+venue_serializer = ModelSerializer(Venue)
+artist_serializer = ModelSerializer(Artist)
+show_serializer = ModelSerializer(Show, extra_columns={
+    'venue_name': Venue.name,
+    'venue_image_link': Venue.image_link,
+    'artist_name': Artist.name,
+    'artist_image_link': Artist.image_link,
+})
+
+
+def json_response(data, status=200):
+    return Response(dumps(data), status=status, mimetype='application/json')
+
+
+def _requested_fields(serializer):
+    try:
+        return serializer.fields(request.args.get('fields'))
+    except ValueError as error:
+        abort(400, description=str(error))
+
+
+def _limit():
+    limit = request.args.get('limit', current_app.config['API_PAGE_SIZE'], type=int)
+    return min(max(limit, 1), current_app.config['API_MAX_PAGE_SIZE'])
+
+
+def _list_entities(model, serializer):
+    fields = _requested_fields(serializer)
+    limit = _limit()
+    query = db.session.query(*serializer.select(fields))
+    after = request.args.get('after', type=int)
+    if after is not None:
+        query = query.filter(model.id > after)
+    if request.args.get('genre'):
+        query = query.filter(genre_filter(model, request.args['genre']))
+    # fetch one extra row to learn whether there is a next page
+    rows = query.order_by(model.id).limit(limit + 1).all()
+    next_cursor = str(rows[limit - 1][0]) if len(rows) > limit else None
+    return json_response({'data': serializer.dump_rows(fields, rows[:limit]), 'next_cursor': next_cursor})
+
+
+def _get_entity(model, serializer, entity_id):
+    fields = _requested_fields(serializer)
+    row = db.session.query(*serializer.select(fields)).filter(model.id == entity_id).first()
+    if row is None:
+        abort(404)
+    return json_response({'data': serializer.dump_rows(fields, [row])[0]})
+
+
+def _matches(model, entity_id):
+    if not matching_available():
+        abort(501, description='Matching needs NumPy to be installed')
+    limit = request.args.get('limit', current_app.config['MATCHING_RESULTS'], type=int)
+    matches = recommend(model, entity_id, min(max(limit, 1), current_app.config['API_MAX_PAGE_SIZE']))
+    if matches is None:
+        abort(404)
+    return json_response({'data': matches})
+
+
+@api.route('/venues')
+@router.read_only
+def list_venues():
+    """Lists venues by ID, paged with ?after=<cursor>&limit=, filtered by ?genre= and trimmed to ?fields=."""
+    return _list_entities(Venue, venue_serializer)
+
+
+@api.route('/venues/nearby')
+@router.read_only
+def list_nearby_venues():
+    """Lists the venues within ?radius= kilometres of ?lat= and ?lon=, nearest first, with their distances."""
+    try:
+        latitude, longitude, radius = nearby_arguments(request.args)
+    except ValueError as error:
+        abort(400, description=str(error))
+    venues = nearby_venues(latitude, longitude, radius, limit=_limit())
+    return json_response({'data': venues})
+
+
+@api.route('/venues/<int:venue_id>')
+@router.read_only
+def get_venue(venue_id):
+    """Returns one venue, trimmed to ?fields=."""
+    return _get_entity(Venue, venue_serializer, venue_id)
+
+
+@api.route('/venues/<int:venue_id>/free-slots')
+@router.read_only
+def list_free_slots(venue_id):
+    """Lists when a venue is free between ?start= and ?end= for at least ?duration= minutes."""
+    try:
+        start_time, end_time, duration = free_slot_arguments(request.args)
+    except ValueError as error:
+        abort(400, description=str(error))
+    if db.session.query(Venue.id).filter(Venue.id == venue_id).first() is None:
+        abort(404)
+    return json_response({'data': free_slots(venue_id, start_time, end_time, duration)})
+
+
+@api.route('/venues/<int:venue_id>/matches')
+@router.read_only
+def list_venue_matches(venue_id):
+    """Recommends up to ?limit= artists seeking venues for a venue, best match first."""
+    return _matches(Venue, venue_id)
+
+
+@api.route('/artists')
+@router.read_only
+def list_artists():
+    """Lists artists by ID, paged with ?after=<cursor>&limit=, filtered by ?genre= and trimmed to ?fields=."""
+    return _list_entities(Artist, artist_serializer)
+
+
+@api.route('/artists/<int:artist_id>')
+@router.read_only
+def get_artist(artist_id):
+    """Returns one artist, trimmed to ?fields=."""
+    return _get_entity(Artist, artist_serializer, artist_id)
+
+
+@api.route('/artists/<int:artist_id>/matches')
+@router.read_only
+def list_artist_matches(artist_id):
+    """Recommends up to ?limit= venues seeking talent for an artist, best match first."""
+    return _matches(Artist, artist_id)
+
+
+@api.route('/shows')
+@router.read_only
+def list_shows():
+    """Lists shows by start time, with the same filters as the /shows page.
+
+    Paged with ?after=<cursor>&limit= and trimmed to ?fields=, which may also name
+    venue_name, venue_image_link, artist_name and artist_image_link; the venue and
+    artist are only joined when one of their fields is requested.
+    """
+    fields = _requested_fields(show_serializer)
+    limit = _limit()
+    # the keyset columns ride along after the requested fields
+    query = db.session.query(*show_serializer.select(fields) + [Show.start_time, Show.id])
+    if any(field.startswith('venue_') and field != 'venue_id' for field in fields):
+        query = query.join(Venue, Show.venue_id == Venue.id)
+    if any(field.startswith('artist_') and field != 'artist_id' for field in fields):
+        query = query.join(Artist, Show.artist_id == Artist.id)
+    try:
+        query = filter_shows(query, after=request.args.get('after'), **show_filters(request.args))
+    except ValueError as error:
+        abort(400, description=str(error))
+
+    rows = query.order_by(Show.start_time, Show.id).limit(limit + 1).all()
+    next_cursor = encode_cursor(rows[limit - 1][-2], rows[limit - 1][-1]) if len(rows) > limit else None
+    return json_response({'data': show_serializer.dump_rows(fields, rows[:limit]), 'next_cursor': next_cursor})
+
+
+@api.route('/import/<kind>', methods=['POST'])
+def import_data(kind):
+    """Imports venues, artists or shows from a CSV or NDJSON request body.
+
+    The body is streamed and written in chunks, so it is never held in memory whole.
+    The format is taken from ?format= or the Content-Type (text/csv or
+    application/x-ndjson); after a failure, the import is resumed by posting the
+    same body again with ?resume_from=<last_record>.
+    """
+    if kind not in IMPORT_KINDS:
+        abort(404)
+    try:
+        check_database(current_app.config['SQLALCHEMY_DATABASE_URI'])
+    except ValueError as error:
+        abort(501, description=str(error))
+    data_format = request.args.get('format')
+    if data_format is None:
+        data_format = 'ndjson' if 'ndjson' in (request.mimetype or '') else 'csv'
+    if data_format not in ('csv', 'ndjson'):
+        abort(400, description='Unknown import format: {}'.format(data_format))
+    resume_from = request.args.get('resume_from', 0, type=int)
+
+    errors = []
+    committed = {'last_record': resume_from}
+    max_errors = current_app.config['IMPORT_MAX_REPORTED_ERRORS']
+
+    def report_error(number, record_errors):
+        if len(errors) < max_errors:
+            errors.append({'record': number, 'errors': record_errors})
+
+    def record_chunk(number):
+        committed['last_record'] = number
+
+    stream = io.TextIOWrapper(request.stream, encoding='utf-8', newline='')
+    try:
+        summary = import_records(kind, read_records(stream, data_format),
+                                 chunk_size=current_app.config['IMPORT_CHUNK_SIZE'],
+                                 resume_from=resume_from, on_error=report_error, on_chunk=record_chunk)
+    except (ValueError, UnicodeDecodeError) as error:
+        # a line that cannot be parsed at all; the chunks before it are committed
+        return json_response({'error': str(error), 'last_record': committed['last_record'], 'errors': errors}, 400)
+    summary['errors'] = errors
+    return json_response(summary)
+
+
+@api.route('/export/<kind>')
+@router.read_only
+def export_data(kind):
+    """Streams every venue, artist or show as CSV, NDJSON or Parquet, chosen with ?format=.
+
+    Shows carry the names of their venue and artist and take the same filters as the
+    /shows page. The response is generated batch by batch while the rows are read,
+    so memory stays flat however large the export is.
+    """
+    if kind not in EXPORT_SERIALIZERS:
+        abort(404)
+    data_format = request.args.get('format', 'csv')
+    if data_format not in export_formats():
+        abort(400, description='Unknown export format: {}'.format(data_format))
+    try:
+        filters = show_filters(request.args) if kind == 'shows' else {}
+    except ValueError as error:
+        abort(400, description=str(error))
+
+    chunks = export_rows(kind, data_format, filters, batch_size=current_app.config['EXPORT_BATCH_SIZE'])
+    response = Response(stream_with_context(chunks), mimetype=EXPORT_MIMETYPES[data_format])
+    response.headers['Content-Disposition'] = 'attachment; filename={}.{}'.format(kind, data_format)
+    return response
+
+
+@api.errorhandler(400)
+@api.errorhandler(404)
+@api.errorhandler(501)
+def api_error(error):
+    return json_response({'error': error.description}, error.code)
+
+
+@api.teardown_request
+def close_session(exception=None):
+    db.session.close()
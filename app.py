@@ -3,53 +3,75 @@
 #----------------------------------------------------------------------------#
 
 import json
+import os
 import sys
+import time
 import dateutil.parser
-import babel
-from flask import Flask, render_template, request, Response, flash, redirect, url_for
+import click
+from flask import Flask, Blueprint, render_template, request, Response, flash, redirect, url_for, abort, jsonify, current_app
 from flask_moment import Moment
-from flask_sqlalchemy import SQLAlchemy
 import logging
 from logging import Formatter, FileHandler
 from flask_wtf import Form
 from forms import *
 from flask_migrate import Migrate
 from models import *
+from queries import venue_areas, venue_detail, artist_detail, shows_page, show_filters
+from search import search
+from genres import genre_facets, genre_filter
+from geo import nearby_arguments, nearby_venues, geocode_venues
+from counters import refresh_counters, sweep_past_shows, reconcile_counters
+from cache import cache
+from conditional import conditional, listing_validator, shows_validator, entity_validator
+from api import api
+from bulk_import import IMPORT_KINDS, check_database, read_records, import_records
+from export import EXPORT_SERIALIZERS, export_formats, export_rows
+from database import engine_options, bind_options, dispose_after_fork, enforce_foreign_keys, pool_stats
+from routing import router
+from profiler import profiler
+from async_db import async_db
+from dates import format_datetime, format_datetimes, to_utc
+from upcoming import refresh_upcoming_shows
+from archive import archive_shows
+from bookings import booking_conflicts, is_booking_conflict, lock_bookings, show_duration
+from templating import bytecode_cache, fragments, precompile_templates
+from sqlalchemy import exc
 from datetime import datetime
 #----------------------------------------------------------------------------#
 # App Config.
 #----------------------------------------------------------------------------#
 
-app = Flask(__name__)
-moment = Moment(app)
-app.config.from_object('config')
-db = SQLAlchemy(app)
-migrate = Migrate(app, db)
-
-# TODO: connect to a local postgresql database
+# the pages and commands, registered on the application by create_app()
+main = Blueprint('main', __name__, cli_group=None)
+moment = Moment()
+migrate = Migrate()
 
 #----------------------------------------------------------------------------#
 # Filters.
 #----------------------------------------------------------------------------#
 
+main.add_app_template_filter(format_datetime, 'datetime')
+
 
-def format_datetime(value, format='medium'):
-  date = dateutil.parser.parse(value)
-  if format == 'full':
-      format = "EEEE MMMM, d, y 'at' h:mma"
-  elif format == 'medium':
-      format = "EE MM, dd, y h:mma"
-  return babel.dates.format_datetime(date, format)
+def format_show_times(shows):
+  """Formats the start times of a page of shows at once, for the show tiles.
 
+  Arguments:
+      shows {list} -- The shows, as dictionaries with a start_time.
 
-app.jinja_env.filters['datetime'] = format_datetime
+  Returns:
+      list -- The same shows, each with its start_time_display.
+  """
+  for show, start_time_display in zip(shows, format_datetimes([show['start_time'] for show in shows], 'full')):
+    show['start_time_display'] = start_time_display
+  return shows
 
 #----------------------------------------------------------------------------#
 # Controllers.
 #----------------------------------------------------------------------------#
 
 
-@app.route('/')
+@main.route('/')
 def index():
   return render_template('pages/home.html')
 
@@ -57,74 +79,44 @@ def index():
 #  Venues
 #  ----------------------------------------------------------------
 
-@app.route('/venues')
+@main.route('/venues')
+@router.read_only
+@conditional(listing_validator(Venue))
+@cache.cached('listings')
 def venues():
-  """Displays all venues grouped by their city and state.
+  """Displays all venues grouped by their city and state, or only those of the ?genre= genre.
 
   Returns:
       template -- An HTML template/page with all venues returned from the database query for all venues.
   """
+  data = []
+  genres = []
+  genre = request.args.get('genre') or None
   try:
-    # create a new data list
-    data = []
-    # select all distinct cities and states from the venues table
-    distinct_state_and_cities = Venue.query.distinct(Venue.city, Venue.state).all()
-
-    for index, distinct_venue in enumerate(distinct_state_and_cities):
-      # loop through the results of the distinct values and create a dictionary for every city/state
-      venue_details = { 'venues': [] }
-      venue_details['city'] = distinct_state_and_cities[index].city
-      venue_details['state'] = distinct_state_and_cities[index].state
-      # get all venues for a city/state in a list
-      venues = Venue.query.filter(Venue.city == distinct_state_and_cities[index].city, Venue.state == distinct_state_and_cities[index].state).all()
-      for venue in venues:
-        # loop through the list of venues and create a venue object that contains the number of upcoming shows for each venue
-        current_time = datetime.now()
-        venue_dict = {}
-        venue_dict['id'] = venue.id
-        venue_dict['name'] = venue.name
-        venue_dict['upcoming_shows'] = Venue.query.filter(Venue.id == venue.id, Show.venue_id == venue.id, Show.start_time > current_time).count()
-
-        venue_details['venues'].append(venue_dict)
-      data.append(venue_details)
+    data = venue_areas(genre=genre)
+    genres = genre_facets(Venue)
   except:
     db.session.rollback()
   finally:
     db.session.close()
 
-  # TODO: replace with real venues data.
-  #       num_shows should be aggregated based on number of upcoming shows per venue.
-  return render_template('pages/venues.html', areas=data)
+  return render_template('pages/venues.html', areas=data, genres=genres, genre=genre)
 
 
-@app.route('/venues/search', methods=['POST'])
+@main.route('/venues/search', methods=['POST'])
+@router.read_only
 def search_venues():
   """shows a venue search result page with the given search term.
 
   Returns:
       template -- An HTML template that displays the venues that match the search term entered.
   """
+  response = {}
   try:
     search_term = request.form['search_term']
-    keywords = '%{}%'.format(search_term)
-    data = []
-    response = {}
-    # query the venue table to get venues whose names match the search term regardless of the character casing
-    count = Venue.query.filter(Venue.name.ilike(keywords)).count()
-    venues = Venue.query.filter(Venue.name.ilike(keywords)).all()
-    current_time = datetime.now()
-
-    for index, venue in enumerate(venues):
-      # loop through the list of venues and create a venue object for each venue,
-      # that contains the number of upcoming shows for each venue
-      venue_dict = {}
-      upcoming_shows_count = Venue.query.filter(Venue.id == venue.id, Show.venue_id == venue.id, Show.start_time > current_time).count()
-      venue_dict['id'] = venues[index].id
-      venue_dict['name'] = venues[index].name
-      venue_dict['upcoming_shows_count'] = upcoming_shows_count
-      data.append(venue_dict)
-    response['count'] = count
-    response['data'] = data
+    page = request.form.get('page', 1, type=int)
+    response = search(Venue, search_term, page=page, per_page=current_app.config['SEARCH_RESULTS_PER_PAGE'],
+                      genre=request.values.get('genre') or None)
   except:
     db.session.rollback()
   finally:
@@ -132,7 +124,32 @@ def search_venues():
   return render_template('pages/search_venues.html', results=response, search_term=request.form.get('search_term', ''))
 
 
-@app.route('/venues/<int:venue_id>')
+@main.route('/venues/nearby')
+@router.read_only
+def nearby_venues_page():
+  """Lists the venues within ?radius= kilometres of ?lat= and ?lon=, nearest first.
+
+  Returns:
+      template -- An HTML template/page with the venues found and their distances.
+  """
+  try:
+    latitude, longitude, radius = nearby_arguments(request.args)
+  except ValueError as error:
+    abort(400, description=str(error))
+  data = []
+  try:
+    data = nearby_venues(latitude, longitude, radius, limit=current_app.config['NEARBY_RESULTS'])
+  except:
+    db.session.rollback()
+  finally:
+    db.session.close()
+  return render_template('pages/venues_nearby.html', venues=data, latitude=latitude, longitude=longitude, radius=radius)
+
+
+@main.route('/venues/<int:venue_id>')
+@router.read_only
+@conditional(entity_validator(Venue, 'venue_id'))
+@cache.cached('venue:{venue_id}')
 def show_venue(venue_id):
   """shows the venue page with the given venue_id.
 
@@ -142,57 +159,33 @@ def show_venue(venue_id):
   Returns:
       template -- An HTML template/page that displays a venue matching the ID provided in the request.
   """
+  data = {}
   try:
-    data = {'upcoming_shows': [], 'past_shows': [],
-        'upcoming_shows_count': 0, 'past_shows_count': 0}
-    current_time = datetime.now()
-
-    # find the venue with the matching ID from the table
-    venue = Venue.query.get(venue_id)
-    for index, show in enumerate(venue.shows):
-      # get the all the shows for a venue and group them by upcoming and past events
-      if show.start_time > current_time:
-        show_data = {}
-        data['upcoming_shows_count'] = data['upcoming_shows_count'] + 1
-        show_data['artist_id'] = venue.shows[index].artist.id
-        show_data['artist_name'] = venue.shows[index].artist.name
-        show_data['artist_image_link'] = venue.shows[index].artist.image_link
-        show_data['start_time'] = format_datetime(str(show.start_time))
-        data['upcoming_shows'].append(show_data)
-      elif show.start_time < current_time:
-        show_data = {}
-        data['past_shows_count'] = data['past_shows_count'] + 1
-        show_data['artist_id'] = venue.shows[index].artist.id
-        show_data['artist_name'] = venue.shows[index].artist.name
-        show_data['artist_image_link'] = venue.shows[index].artist.image_link
-        show_data['start_time'] = format_datetime(str(show.start_time))
-        data['past_shows'].append(show_data)
-    data['id'] = venue.id
-    data['name'] = venue.name
-    data['genres'] = venue.genres
-    data['address'] = venue.address
-    data['city'] = venue.city
-    data['state'] = venue.state
-    data['phone'] = venue.phone
-    data['website'] = venue.website
-    data['facebook_link'] = venue.facebook_link
-    data['seeking_talent'] = venue.seeking_talent
-    data['seeking_description'] = venue.seeking_description
-    data['image_link'] = venue.image_link
+    # load the venue, its show counts and a page each of upcoming and past shows,
+    # at the same time when served over ASGI
+    data = venue_detail(venue_id,
+                        upcoming_page=request.args.get('upcoming_page', 1, type=int),
+                        past_page=request.args.get('past_page', 1, type=int),
+                        per_page=current_app.config['SHOWS_PER_PAGE'],
+                        execute_all=async_db.execute_all if async_db.enabled else None)
   except:
     db.session.rollback()
   finally:
-    return render_template('pages/show_venue.html', venue=data)
+    db.session.close()
+  if data is None:
+    abort(404)
+  format_show_times(data.get('upcoming_shows', []) + data.get('past_shows', []))
+  return render_template('pages/show_venue.html', venue=data)
 
 #  Create Venue
 #  ----------------------------------------------------------------
 
-@app.route('/venues/create', methods=['GET'])
+@main.route('/venues/create', methods=['GET'])
 def create_venue_form():
   form = VenueForm()
   return render_template('forms/new_venue.html', form=form)
 
-@app.route('/venues/create', methods=['POST'])
+@main.route('/venues/create', methods=['POST'])
 def create_venue_submission():
   """creates a new venue with data submitted from the frontend form.
 
@@ -200,6 +193,7 @@ def create_venue_submission():
       template -- An HTML template/page of the homepage with a flash message about the success or failure of the request.
   """
   error = False
+  duplicate = False
   body = {}
   try:
     name = request.form['name']
@@ -217,19 +211,26 @@ def create_venue_submission():
     db.session.commit()
 
     body = venue.as_dict()
+  except exc.IntegrityError:
+    # another venue has the same name, city and state (see the natural keys in models.py)
+    duplicate = True
+    db.session.rollback()
   except:
     error = True
     db.session.rollback()
   finally:
     db.session.close()
-    if error:
+    if duplicate:
+      flash('A venue named {} already exists in {}, {}'.format(request.form['name'], request.form['city'], request.form['state']))
+    elif error:
       flash('An error occured while creating the venue')
     else:
+      cache.invalidate('listings')
       flash('Venue ' + request.form['name'] + ' was successfully listed!')
     return render_template('pages/home.html')
 
 
-@app.route('/venues/<venue_id>', methods=['DELETE'])
+@main.route('/venues/<venue_id>', methods=['DELETE'])
 def delete_venue(venue_id):
   """Deletes a venue with the provided venue ID.
 
@@ -241,7 +242,10 @@ def delete_venue(venue_id):
   """
   error = False
   try:
+    # the venue's shows are deleted with it, so the counters of their artists are refreshed
+    artist_ids = [artist_id for artist_id, in db.session.query(Show.artist_id).filter(Show.venue_id == venue_id).distinct()]
     Venue.query.filter_by(id=venue_id).delete()
+    refresh_counters(db.session, Artist, artist_ids)
     db.session.commit()
   except:
     db.session.rollback()
@@ -252,65 +256,67 @@ def delete_venue(venue_id):
       flash('An error occured while trying to delete the venue')
       return render_template('pages/venues.html')
     else:
+      cache.invalidate('listings', 'shows', 'venue:{}'.format(venue_id), *['artist:{}'.format(artist_id) for artist_id in artist_ids])
       flash('Venue successfully deleted')
       return render_template('pages/home.html')
 
 #  Artists
 #  ----------------------------------------------------------------
-@app.route('/artists')
+@main.route('/artists')
+@router.read_only
+@conditional(listing_validator(Artist))
+@cache.cached('listings')
 def artists():
-  """Displays all artists with their names.
+  """Displays all artists with their names, or only those of the ?genre= genre.
 
   Returns:
       template -- An HTML template/page with all artists returned from the database query for all artists.
   """
+  genres = []
+  genre = request.args.get('genre') or None
   try:
     data = []
 
-    artists = Artist.query.order_by('id').all()
+    query = Artist.query
+    if genre:
+      query = query.filter(genre_filter(Artist, genre))
+    artists = query.order_by('id').all()
 
     for index, artist in enumerate(artists):
       artist_data = {}
       artist_data['id'] = artists[index].id
       artist_data['name'] = artists[index].name
       data.append(artist_data)
+    genres = genre_facets(Artist)
   except:
     db.session.rollback()
   finally:
-    return render_template('pages/artists.html', artists=data)
+    return render_template('pages/artists.html', artists=data, genres=genres, genre=genre)
 
-@app.route('/artists/search', methods=['POST'])
+@main.route('/artists/search', methods=['POST'])
+@router.read_only
 def search_artists():
   """shows an artists search result page with the given search term.
 
   Returns:
       template -- An HTML template that displays the venues that match the search term entered.
   """
+  response = {}
   try:
     search_term = request.form['search_term']
-    keywords = '%{}%'.format(search_term)
-    data = []
-    response = {}
-    count = Artist.query.filter(Artist.name.ilike(keywords)).count()
-    artists = Artist.query.filter(Artist.name.ilike(keywords)).all()
-    current_time = datetime.now()
-
-    for index, artist in enumerate(artists):
-      artist_dict = {}
-      upcoming_shows_count = Artist.query.filter(Artist.id == artist.id, Show.artist_id == artist.id, Show.start_time > current_time).count()
-      artist_dict['id'] = artists[index].id
-      artist_dict['name'] = artists[index].name
-      artist_dict['upcoming_shows_count'] = upcoming_shows_count
-      data.append(artist_dict)
-    response['count'] = count
-    response['data'] = data
+    page = request.form.get('page', 1, type=int)
+    response = search(Artist, search_term, page=page, per_page=current_app.config['SEARCH_RESULTS_PER_PAGE'],
+                      genre=request.values.get('genre') or None)
   except:
     db.session.rollback()
   finally:
     db.session.close()
   return render_template('pages/search_artists.html', results=response, search_term=request.form.get('search_term', ''))
 
-@app.route('/artists/<int:artist_id>')
+@main.route('/artists/<int:artist_id>')
+@router.read_only
+@conditional(entity_validator(Artist, 'artist_id'))
+@cache.cached('artist:{artist_id}')
 def show_artist(artist_id):
   """shows an artist's page with the given artist ID.
 
@@ -320,48 +326,25 @@ def show_artist(artist_id):
   Returns:
       template -- An HTML template/page that displays an artist matching the ID provided in the request.
   """
+  data = {}
   try:
-    data = {'upcoming_shows': [], 'past_shows': [],
-        'upcoming_shows_count': 0, 'past_shows_count': 0}
-    current_time = datetime.now()
-    artist = Artist.query.get(artist_id)
-
-    if len(artist.shows) > 0:
-      for index, show in enumerate(artist.shows):
-        if show.start_time > current_time:
-          show_data = {}
-          data['upcoming_shows_count'] = data['upcoming_shows_count'] + 1
-          show_data['venue_id'] = artist.shows[index].venue.id
-          show_data['venue_name'] = artist.shows[index].venue.name
-          show_data['venue_image_link'] = artist.shows[index].venue.image_link
-          show_data['start_time'] = format_datetime(str(show.start_time))
-          data['upcoming_shows'].append(show_data)
-        elif show.start_time < current_time:
-          show_data = {}
-          data['past_shows_count'] = data['past_shows_count'] + 1
-          show_data['venue_id'] = artist.shows[index].venue.id
-          show_data['venue_name'] = artist.shows[index].venue.name
-          show_data['venue_image_link'] = artist.shows[index].venue.image_link
-          show_data['start_time'] = format_datetime(str(show.start_time))
-          data['past_shows'].append(show_data)
-      data['id'] = artist.id
-      data['name'] = artist.name
-      data['genres'] = artist.genres
-      data['city'] = artist.city
-      data['state'] = artist.state
-      data['phone'] = artist.phone
-      data['facebook_link'] = artist.facebook_link
-      data['seeking_venue'] = artist.seeking_venue
-      data['seeking_description'] = artist.seeking_description
-      data['image_link'] = artist.image_link
+    data = artist_detail(artist_id,
+                         upcoming_page=request.args.get('upcoming_page', 1, type=int),
+                         past_page=request.args.get('past_page', 1, type=int),
+                         per_page=current_app.config['SHOWS_PER_PAGE'],
+                        execute_all=async_db.execute_all if async_db.enabled else None)
   except:
-    db.sesssion.rollback()
+    db.session.rollback()
   finally:
-    return render_template('pages/show_artist.html', artist=data)
+    db.session.close()
+  if data is None:
+    abort(404)
+  format_show_times(data.get('upcoming_shows', []) + data.get('past_shows', []))
+  return render_template('pages/show_artist.html', artist=data)
 
 #  Update
 #  ----------------------------------------------------------------
-@app.route('/artists/<int:artist_id>/edit', methods=['GET'])
+@main.route('/artists/<int:artist_id>/edit', methods=['GET'])
 def edit_artist(artist_id):
   """displays a page where an artists information can be updated.
 
@@ -375,7 +358,7 @@ def edit_artist(artist_id):
   artist = Artist.query.get(artist_id)
   return render_template('forms/edit_artist.html', form=form, artist=artist)
 
-@app.route('/artists/<int:artist_id>/edit', methods=['POST'])
+@main.route('/artists/<int:artist_id>/edit', methods=['POST'])
 def edit_artist_submission(artist_id):
   """Updates an artist's information.
 
@@ -386,6 +369,7 @@ def edit_artist_submission(artist_id):
       template -- An HTML page that shows the artist's page with the new information
   """
   error = False
+  duplicate = False
   try:
     artist = Artist.query.get(artist_id)
     artist.name = request.form['name'] if len(request.form['name']) > 0 else artist.name
@@ -396,18 +380,25 @@ def edit_artist_submission(artist_id):
     artist.image_link = request.form['image_link'] if len(request.form['image_link']) > 0 else artist.image_link
     artist.genres = request.form['genres'].split(', ') if len(request.form['genres']) > 0 else artist.genres
     db.session.commit()
+  except exc.IntegrityError:
+    # another artist has the same name, city and state (see the natural keys in models.py)
+    duplicate = True
+    db.session.rollback()
   except:
     error = True
     db.session.rollback()
   finally:
     db.session.close()
-    if error:
+    if duplicate:
+      flash('Another artist with the same name already exists in that city and state')
+    elif error:
       flash('An error occured while updating the artist')
     else:
+      cache.invalidate('listings', 'artist:{}'.format(artist_id))
       flash('Artist ' + request.form['name'] + ' was successfully updated!')
-    return redirect(url_for('show_artist', artist_id=artist_id))
+    return redirect(url_for('main.show_artist', artist_id=artist_id))
 
-@app.route('/venues/<int:venue_id>/edit', methods=['GET'])
+@main.route('/venues/<int:venue_id>/edit', methods=['GET'])
 def edit_venue(venue_id):
   """displays a page where a venue's information can be updated.
 
@@ -421,7 +412,7 @@ def edit_venue(venue_id):
   venue = Venue.query.get(venue_id)
   return render_template('forms/edit_venue.html', form=form, venue=venue)
 
-@app.route('/venues/<int:venue_id>/edit', methods=['POST'])
+@main.route('/venues/<int:venue_id>/edit', methods=['POST'])
 def edit_venue_submission(venue_id):
   """Updates a venue's information
 
@@ -432,6 +423,7 @@ def edit_venue_submission(venue_id):
       template -- An HTML page that shows the venue's page with the new information
   """
   error = False
+  duplicate = False
   try:
     venue = Venue.query.get(venue_id)
     venue.name = request.form['name'] if len(request.form['name']) > 0 else venue.name
@@ -443,21 +435,28 @@ def edit_venue_submission(venue_id):
     venue.image_link = request.form['image_link'] if len(request.form['image_link']) > 0 else venue.image_link
     venue.genres = request.form['genres'].split(', ') if len(request.form['genres']) > 0 else venue.genres
     db.session.commit()
+  except exc.IntegrityError:
+    # another venue has the same name, city and state (see the natural keys in models.py)
+    duplicate = True
+    db.session.rollback()
   except:
     error = True
     db.session.rollback()
   finally:
     db.session.close()
-    if error:
+    if duplicate:
+      flash('Another venue with the same name already exists in that city and state')
+    elif error:
       flash('An error occured while updating the venue')
     else:
+      cache.invalidate('listings', 'venue:{}'.format(venue_id))
       flash('Venue ' + request.form['name'] + ' was successfully updated!')
-  return redirect(url_for('show_venue', venue_id=venue_id))
+  return redirect(url_for('main.show_venue', venue_id=venue_id))
 
 #  Create Artist
 #  ----------------------------------------------------------------
 
-@app.route('/artists/create', methods=['GET'])
+@main.route('/artists/create', methods=['GET'])
 def create_artist_form():
   """dispays a page with a form where a new artist can be added
 
@@ -467,7 +466,7 @@ def create_artist_form():
   form = ArtistForm()
   return render_template('forms/new_artist.html', form=form)
 
-@app.route('/artists/create', methods=['POST'])
+@main.route('/artists/create', methods=['POST'])
 def create_artist_submission():
   """Creates a new artist with the data submitted from the frontend form.
 
@@ -475,6 +474,7 @@ def create_artist_submission():
       template -- An HTML template/page of the homepage with a flash message about the success or failure of the request
   """
   error = False
+  duplicate = False
   body = {}
   try:
     name = request.form['name']
@@ -489,15 +489,22 @@ def create_artist_submission():
     db.session.add(artist)
     db.session.commit()
     body = artist.as_dict()
+  except exc.IntegrityError:
+    # another artist has the same name, city and state (see the natural keys in models.py)
+    duplicate = True
+    db.session.rollback()
   except:
     error = True
     db.session.rollback()
   finally:
     db.session.close()
-    if error:
+    if duplicate:
+      flash('An artist named {} already exists in {}, {}'.format(request.form['name'], request.form['city'], request.form['state']))
+    elif error:
       flash('An error occured while creating the artist')
       return render_template('pages/home.html')
     else:
+      cache.invalidate('listings')
       flash('Artist ' + request.form['name'] + ' was successfully listed!')
     return render_template('pages/home.html')
 
@@ -505,85 +512,317 @@ def create_artist_submission():
 #  Shows
 #  ----------------------------------------------------------------
 
-@app.route('/shows')
+@main.route('/shows')
+@router.read_only
+@conditional(shows_validator)
+@cache.cached('listings')
 def shows():
-  """Displays a list of all shows with the venues and artists.
+  """Displays a page of shows with the venues and artists, optionally filtered
+  by ?from=, ?to=, ?venue_id=, ?artist_id= and ?upcoming=1 and continued from an ?after= cursor.
 
   Returns:
       template -- An HTML page that displays the shows listed
   """
+  # the filters are kept on the link to the next page
+  filters = {name: request.args[name] for name in ('from', 'to', 'venue_id', 'artist_id', 'upcoming') if request.args.get(name)}
+  data = {'shows': [], 'next_cursor': None}
   try:
-    data = []
-    shows = Show.query.all()
-
-    for show in shows:
-      venue = Venue.query.get(show.venue_id)
-      artist = Artist.query.get(show.artist_id)
-      show_data = {}
-      show_data['venue_id'] = show.venue_id
-      show_data['venue_name'] = venue.name
-      show_data['artist_id'] = artist.id
-      show_data['artist_name'] = artist.name
-      show_data['artist_image_link'] = artist.image_link
-      show_data['start_time'] = format_datetime(str(show.start_time))
-      data.append(show_data)
+    data = shows_page(after=request.args.get('after'), per_page=current_app.config['SHOWS_PER_PAGE'], **show_filters(filters))
+  except ValueError:
+    # a malformed filter or ?after= cursor
+    abort(400)
   except:
     db.session.rollback()
   finally:
     db.session.close()
-  return render_template('pages/shows.html', shows=data)
+  return render_template('pages/shows.html', shows=format_show_times(data['shows']), next_cursor=data['next_cursor'], filters=filters)
 
-@app.route('/shows/create')
+@main.route('/shows/create')
 def create_shows():
   # renders form. do not touch.
   form = ShowForm()
   return render_template('forms/new_show.html', form=form)
 
-@app.route('/shows/create', methods=['POST'])
+@main.route('/shows/create', methods=['POST'])
 def create_show_submission():
-  """Creates a show with the data submitted on the frontend form.
+  """Creates a show with the data submitted on the frontend form, unless its venue or artist is already booked then.
 
   Returns:
       template -- An HTML template/page of the homepage with a flash message about the success or failure of the request.
   """
   error = False
+  conflicts = []
   try:
-    artist_id = request.form['artist_id']
-    venue_id = request.form['venue_id']
-    start_time = request.form['start_time']
-
-    show = Show(artist_id=artist_id, venue_id=venue_id, start_time=start_time)
-    db.session.add(show)
-    db.session.commit()
+    artist_id = int(request.form['artist_id'])
+    venue_id = int(request.form['venue_id'])
+    # typed in the visitor's timezone, the one show times are displayed in
+    start_time = to_utc(dateutil.parser.parse(request.form['start_time']))
+    duration = show_duration(request.form.get('duration'))
+
+    # held from the check until the show is written, so no other request books the slot meanwhile
+    lock_bookings(venue_id, artist_id)
+    conflicts = booking_conflicts(venue_id, artist_id, start_time, duration)
+    if not conflicts:
+      # the venue and artist counters are updated in the same transaction (see counters.py)
+      show = Show(artist_id=artist_id, venue_id=venue_id, start_time=start_time, duration=duration)
+      db.session.add(show)
+      db.session.commit()
+  except exc.IntegrityError as integrity_error:
+    error = True
+    db.session.rollback()
+    if is_booking_conflict(integrity_error):
+      # booked by another request in the meantime (see bookings.py)
+      conflicts = booking_conflicts(venue_id, artist_id, start_time, duration)
   except:
     error = True
     db.session.rollback()
   finally:
     db.session.close()
-    if error:
+    if conflicts:
+      flash('The venue or the artist is already booked from {} to {}'.format(
+        format_datetime(conflicts[0]['start_time']), format_datetime(conflicts[0]['end_time'])))
+    elif error:
       flash('An error occured and the show could not be added')
     else:
+      cache.invalidate('listings', 'shows', 'venue:{}'.format(venue_id), 'artist:{}'.format(artist_id))
       flash('Show was successfully listed!')
   return render_template('pages/home.html')
 
-@app.errorhandler(404)
+#  Monitoring
+#  ----------------------------------------------------------------
+
+@main.route('/cache/stats')
+def cache_stats():
+  """Reports the response and fragment cache hit/miss counters of this worker process.
+
+  Returns:
+      json -- The cache counters and hit ratio, and those of the tile fragments.
+  """
+  stats = cache.stats()
+  stats['fragments'] = fragments.stats()
+  return jsonify(stats)
+
+@main.route('/pool/stats')
+def database_pool_stats():
+  """Reports the connection pool checkout waits and saturation of this worker process.
+
+  Returns:
+      json -- The pool counters and occupancy, and those of the async pools when served over ASGI.
+  """
+  stats = pool_stats(db.engine)
+  if async_db.enabled:
+    stats['async'] = async_db.stats()
+  return jsonify(stats)
+
+@main.route('/replicas/stats')
+def replica_stats():
+  """Reports where this worker process routed the reads of read-only pages, and the replica lag.
+
+  Returns:
+      json -- The routing counters and the last measured lag of every replica.
+  """
+  return jsonify(router.stats())
+
+@main.route('/debug/queries')
+def debug_queries():
+  """Lists the statement counts, database time, slowest and repeated statements of the latest requests.
+
+  Only available with QUERY_PROFILER enabled.
+
+  Returns:
+      json -- The query profiles of this worker process, newest first.
+  """
+  if not profiler.enabled:
+    abort(404)
+  return jsonify(profiler.history())
+
+@main.app_errorhandler(404)
 def not_found_error(error):
     return render_template('errors/404.html'), 404
 
-@app.errorhandler(500)
+@main.app_errorhandler(500)
 def server_error(error):
     return render_template('errors/500.html'), 500
 
 
-if not app.debug:
-    file_handler = FileHandler('error.log')
-    file_handler.setFormatter(
-        Formatter('%(asctime)s %(levelname)s: %(message)s [in %(pathname)s:%(lineno)d]')
-    )
-    app.logger.setLevel(logging.INFO)
-    file_handler.setLevel(logging.INFO)
-    app.logger.addHandler(file_handler)
-    app.logger.info('errors')
+#----------------------------------------------------------------------------#
+# Commands.
+#----------------------------------------------------------------------------#
+
+@main.cli.command('sweep-shows')
+def sweep_shows_command():
+  """Moves shows that have started from the upcoming to the past show counters.
+
+  Run it periodically (e.g. every minute from cron) to keep the listings current.
+  """
+  swept = sweep_past_shows()
+  db.session.commit()
+  for model_name, count in swept.items():
+    click.echo('{}: {} rolled over'.format(model_name, count))
+
+
+@main.cli.command('refresh-upcoming')
+@click.option('--full', is_flag=True, help='Rebuild the summary instead of applying the changes since the last refresh.')
+@click.option('--every', type=float, default=None, help='Keep refreshing, every this many seconds.')
+def refresh_upcoming_command(full, every):
+  """Refreshes the upcoming shows summary read by the upcoming show listings.
+
+  Run it periodically (e.g. every minute from cron, or with --every) well within
+  UPCOMING_SHOWS_MAX_STALENESS, or the listings fall back to querying the shows.
+  """
+  while True:
+    summary = refresh_upcoming_shows(full=full)
+    if summary is None:
+      click.echo('Another refresh is running')
+    else:
+      click.echo('{} expired, {} removed, {} copied{}'.format(
+        summary['expired'], summary['removed'], summary['copied'], ' (full)' if summary['full'] else ''))
+    if not every:
+      break
+    full = False
+    time.sleep(every)
+
+
+@main.cli.command('maintain-shows')
+@click.option('--archive-after', type=int, default=None, help='Archive the shows of months older than this many whole months.')
+@click.option('--months-ahead', type=int, default=None, help='Add the partitions of this many months after the current one.')
+def maintain_shows_command(archive_after, months_ahead):
+  """Moves old shows to the show archive and, on PostgreSQL, adds the partitions of the coming months.
+
+  Run it daily (e.g. from cron); shows starting past the last partition land in
+  the default partition until it runs.
+  """
+  summary = archive_shows(months_ahead=months_ahead, archive_after_months=archive_after)
+  if summary is None:
+    click.echo('Another maintenance run is in progress')
+    return
+  for name in summary['created']:
+    click.echo('Created partition {}'.format(name))
+  for name in summary['archived']:
+    click.echo('Archived partition {}'.format(name))
+  if summary['moved'] or summary['archived']:
+    cache.invalidate('shows')
+  click.echo('{} shows moved to the archive'.format(summary['moved']))
+
+
+@main.cli.command('geocode-venues')
+@click.option('--all', 'everything', is_flag=True, help='Geocode every venue again, not only those without coordinates.')
+def geocode_venues_command(everything):
+  """Fills in the coordinates of venues for the nearby search, e.g. after a bulk import."""
+  summary = geocode_venues(everything=everything)
+  click.echo('{} venues geocoded, {} addresses not found'.format(summary['geocoded'], summary['unknown']))
+
+
+@main.cli.command('reconcile-counters')
+@click.option('--dry-run', is_flag=True, help='Only report the drifted counters.')
+def reconcile_counters_command(dry_run):
+  """Verifies the show counters of every venue and artist and repairs any drift."""
+  drifted = reconcile_counters(repair=not dry_run)
+  db.session.commit()
+  for model_name, ids in drifted.items():
+    click.echo('{}: {} drifted {}'.format(model_name, len(ids), ids if ids else ''))
+
+
+@main.cli.command('import-data')
+@click.argument('kind', type=click.Choice(sorted(IMPORT_KINDS)))
+@click.argument('source', type=click.File('r', encoding='utf-8'))
+@click.option('--format', 'data_format', type=click.Choice(['csv', 'ndjson']), default='csv', show_default=True)
+@click.option('--chunk-size', type=int, default=None, help='Records written per transaction.')
+@click.option('--checkpoint', type=click.Path(dir_okay=False), help='File recording the last committed record, to resume from.')
+def import_data_command(kind, source, data_format, chunk_size, checkpoint):
+  """Imports venues, artists or shows from a CSV or NDJSON file, or - for stdin.
+
+  Rejected records are reported on stderr as they are met. With --checkpoint, an
+  interrupted import picks up after the last committed chunk when run again.
+  """
+  try:
+    check_database(current_app.config['SQLALCHEMY_DATABASE_URI'])
+  except ValueError as error:
+    raise click.ClickException(str(error))
+  resume_from = 0
+  if checkpoint and os.path.exists(checkpoint):
+    with open(checkpoint) as checkpoint_file:
+      resume_from = int(checkpoint_file.read().strip() or 0)
+    click.echo('Resuming after record {}'.format(resume_from))
+
+  def report_error(number, errors):
+    click.echo('Record {} rejected: {}'.format(number, json.dumps(errors)), err=True)
+
+  def save_checkpoint(number):
+    if checkpoint:
+      with open(checkpoint + '.tmp', 'w') as checkpoint_file:
+        checkpoint_file.write(str(number))
+      os.replace(checkpoint + '.tmp', checkpoint)
+
+  summary = import_records(kind, read_records(source, data_format),
+                           chunk_size=chunk_size or current_app.config['IMPORT_CHUNK_SIZE'],
+                           resume_from=resume_from, on_error=report_error, on_chunk=save_checkpoint)
+  click.echo('{read} read, {imported} imported, {rejected} rejected'.format(**summary))
+
+
+@main.cli.command('export-data')
+@click.argument('kind', type=click.Choice(sorted(EXPORT_SERIALIZERS)))
+@click.argument('destination', type=click.File('wb'), default='-')
+@click.option('--format', 'data_format', type=click.Choice(export_formats()), default='csv', show_default=True)
+def export_data_command(kind, destination, data_format):
+  """Streams every venue, artist or show to a file, or - for stdout."""
+  for chunk in export_rows(kind, data_format, batch_size=current_app.config['EXPORT_BATCH_SIZE']):
+    destination.write(chunk)
+
+
+@main.cli.command('compile-templates')
+def compile_templates_command():
+  """Compiles every template into the bytecode cache, so new worker processes skip parsing them."""
+  names = precompile_templates(current_app)
+  click.echo('{} templates compiled'.format(len(names)))
+
+#----------------------------------------------------------------------------#
+# App Factory.
+#----------------------------------------------------------------------------#
+
+def create_app(config_object='config'):
+  """Creates the application, with the one database object shared by every module.
+
+  Keyword Arguments:
+      config_object {string} -- The config module or object to load (default: {'config'})
+
+  Returns:
+      Flask -- The configured application.
+  """
+  app = Flask(__name__)
+  app.config.from_object(config_object)
+  app.config['SQLALCHEMY_ENGINE_OPTIONS'] = engine_options(app.config)
+  app.jinja_env.bytecode_cache = bytecode_cache(app.config)
+  router.init_app(app)
+  app.config['SQLALCHEMY_BINDS'] = bind_options(app.config)
+  db.init_app(app)
+  async_db.init_app(app)
+  migrate.init_app(app, db)
+  moment.init_app(app)
+  cache.init_app(app)
+  fragments.init_app(app)
+  profiler.init_app(app)
+  app.register_blueprint(main)
+  app.register_blueprint(api)
+
+  with app.app_context():
+    for engine in db.engines.values():
+      enforce_foreign_keys(engine)
+      dispose_after_fork(engine)
+
+  if not app.debug:
+      file_handler = FileHandler('error.log')
+      file_handler.setFormatter(
+          Formatter('%(asctime)s %(levelname)s: %(message)s [in %(pathname)s:%(lineno)d]')
+      )
+      app.logger.setLevel(logging.INFO)
+      file_handler.setLevel(logging.INFO)
+      app.logger.addHandler(file_handler)
+      app.logger.info('errors')
+  return app
+
+
+app = create_app()
 
 #----------------------------------------------------------------------------#
 # Launch.
@@ -0,0 +1,137 @@
+from datetime import date, datetime
+
+from flask import current_app
+from sqlalchemy import delete, func, insert, select, text
+
+from bookings import add_booking_constraints
+from database import partition_names
+from models import db, Show, ShowArchive
+
+#----------------------------------------------------------------------------#
+# Show partitions and archive.
+#----------------------------------------------------------------------------#
+
+# Shows that started more than SHOW_ARCHIVE_AFTER_MONTHS months ago are moved from
+# Show to ShowArchive by archive_shows() (see the maintain-shows command), so the
+# listings and the upcoming and recent past shows of the detail pages read a table
+# that only grows with the shows of the coming months. The detail pages only read
+# the archive when a visitor pages past the recent past shows (see queries.py).
+#
+# On PostgreSQL Show and ShowArchive are partitioned by the month of the start time,
+# with a partition per month named like "Show_202610". The maintenance adds the
+# partitions of the next SHOW_PARTITION_MONTHS_AHEAD months, and archives a month
+# by detaching its partition from Show and attaching it to ShowArchive, without
+# copying a row. Elsewhere the shows are copied over and deleted.
+
+# key of the advisory lock that keeps two maintenance runs from racing
+_MAINTENANCE_LOCK_KEY = 0x66797976  # 'fyyv'
+
+_COLUMNS = ['id', 'artist_id', 'venue_id', 'start_time', 'duration', 'updated_at']
+
+
+def month_start(value):
+    """The first day of the month of a date or datetime."""
+    return date(value.year, value.month, 1)
+
+
+def add_months(month, months):
+    """The first day of the month the given number of months after (or before) a month."""
+    index = month.year * 12 + month.month - 1 + months
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def partition_name(parent, month):
+    """The name of the partition of a table holding the shows of a month, e.g. Show_202610."""
+    return '{}_{:%Y%m}'.format(parent, month)
+
+
+def archive_cutoff(current_time=None, months=None):
+    """The start of the oldest month that is not archived yet; earlier shows belong in ShowArchive.
+
+    Keyword Arguments:
+        current_time {datetime} -- The current time (default: {now})
+        months {integer} -- How many whole months shows stay in Show (default: {SHOW_ARCHIVE_AFTER_MONTHS})
+
+    Returns:
+        datetime -- The first moment of that month.
+    """
+    if months is None:
+        months = current_app.config['SHOW_ARCHIVE_AFTER_MONTHS']
+    month = add_months(month_start(current_time or datetime.utcnow()), -months)
+    return datetime.combine(month, datetime.min.time())
+
+
+def archive_shows(months_ahead=None, archive_after_months=None, current_time=None):
+    """Adds the partitions of the coming months and moves the shows of old months to the archive.
+
+    Runs in one transaction. On PostgreSQL detaching and attaching partitions takes
+    a brief exclusive lock on Show and ShowArchive, so it is best run off-peak, e.g.
+    daily from cron.
+
+    Keyword Arguments:
+        months_ahead {integer} -- How many months after the current one get a partition (default: {SHOW_PARTITION_MONTHS_AHEAD})
+        archive_after_months {integer} -- How many whole months shows stay in Show (default: {SHOW_ARCHIVE_AFTER_MONTHS})
+        current_time {datetime} -- The current time (default: {now})
+
+    Returns:
+        dict -- The partitions created and archived and the number of shows copied over,
+        or None when another run holds the lock.
+    """
+    config = current_app.config
+    if months_ahead is None:
+        months_ahead = config['SHOW_PARTITION_MONTHS_AHEAD']
+    current_time = current_time or datetime.utcnow()
+    cutoff = archive_cutoff(current_time, archive_after_months)
+    summary = {'created': [], 'archived': [], 'moved': 0}
+
+    with db.engine.begin() as connection:
+        if db.engine.dialect.name == 'postgresql':
+            if not connection.execute(select(func.pg_try_advisory_xact_lock(_MAINTENANCE_LOCK_KEY))).scalar():
+                return None
+            _maintain_partitions(connection, month_start(current_time), months_ahead, cutoff.date(), summary)
+
+        # the shows left in the default partition, or every old show without partitions
+        shows = Show.__table__
+        old_shows = select(*[shows.c[name] for name in _COLUMNS]).where(shows.c.start_time < cutoff)
+        result = connection.execute(insert(ShowArchive.__table__).from_select(_COLUMNS, old_shows))
+        summary['moved'] = max(result.rowcount, 0)
+        connection.execute(delete(shows).where(shows.c.start_time < cutoff))
+    return summary
+
+
+def _maintain_partitions(connection, current_month, months_ahead, cutoff, summary):
+    parent, archive = Show.__tablename__, ShowArchive.__tablename__
+    existing = partition_names(connection, parent)
+
+    for name in sorted(existing):
+        suffix = name[len(parent) + 1:]
+        if not suffix.isdigit():
+            continue
+        month = datetime.strptime(suffix, '%Y%m').date()
+        if add_months(month, 1) > cutoff:
+            continue
+        archived_name = partition_name(archive, month)
+        connection.execute(text('ALTER TABLE "{}" DETACH PARTITION "{}"'.format(parent, name)))
+        connection.execute(text('ALTER TABLE "{}" RENAME TO "{}"'.format(name, archived_name)))
+        connection.execute(text('ALTER TABLE "{}" ATTACH PARTITION "{}" FOR VALUES FROM (\'{}\') TO (\'{}\')'.format(
+            archive, archived_name, month.isoformat(), add_months(month, 1).isoformat())))
+        summary['archived'].append(name)
+
+    for offset in range(months_ahead + 1):
+        month = add_months(current_month, offset)
+        name = partition_name(parent, month)
+        if name in existing:
+            continue
+        # a partition cannot be added while the default partition holds rows of its
+        # range, so they are set aside and inserted again once it exists
+        bounds = {'start': month, 'end': add_months(month, 1)}
+        connection.execute(text('CREATE TEMPORARY TABLE IF NOT EXISTS moved_shows (LIKE "{}") ON COMMIT DROP'.format(parent)))
+        connection.execute(text(
+            'WITH moved AS (DELETE FROM "{0}_default" WHERE start_time >= :start AND start_time < :end RETURNING {1}) '
+            'INSERT INTO moved_shows ({1}) SELECT {1} FROM moved'.format(parent, ', '.join(_COLUMNS))), bounds)
+        connection.execute(text('CREATE TABLE "{}" PARTITION OF "{}" FOR VALUES FROM (\'{}\') TO (\'{}\')'.format(
+            name, parent, bounds['start'].isoformat(), bounds['end'].isoformat())))
+        add_booking_constraints(connection, name)
+        connection.execute(text('INSERT INTO "{0}" ({1}) SELECT {1} FROM moved_shows'.format(parent, ', '.join(_COLUMNS))))
+        connection.execute(text('TRUNCATE moved_shows'))
+        summary['created'].append(name)
@@ -0,0 +1,147 @@
+import asyncio
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from tempfile import SpooledTemporaryFile
+
+from app import app
+from async_db import async_db
+
+#----------------------------------------------------------------------------#
+# ASGI serving.
+#----------------------------------------------------------------------------#
+
+
+class ASGIApp(object):
+    """Serves the Flask app from an ASGI server such as uvicorn.
+
+    Every request runs the app's views in a pool of ASGI_THREADS threads, so the
+    existing routes work unchanged. The server's event loop runs the async engines
+    (see async_db.py), which the read pages fan their independent queries out to:
+    a view waiting on its statements holds its thread, but neither the event loop
+    nor a database connection while another statement runs.
+
+        uvicorn asgi:application --workers 4
+    """
+
+    def __init__(self, app, threads=None):
+        self.app = app
+        self.executor = ThreadPoolExecutor(threads or app.config.get('ASGI_THREADS', 32), thread_name_prefix='fyyur-asgi')
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            await self._lifespan(receive, send)
+        elif scope['type'] == 'http':
+            await self._http(scope, receive, send)
+        else:
+            raise ValueError('Unsupported ASGI scope: {}'.format(scope['type']))
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                with self.app.app_context():
+                    started = async_db.start()
+                self.app.logger.info('Serving over ASGI, async reads %s', 'on' if started else 'off')
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                await async_db.stop()
+                self.executor.shutdown(wait=False)
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    async def _http(self, scope, receive, send):
+        with SpooledTemporaryFile(max_size=65536) as body:
+            while True:
+                message = await receive()
+                body.write(message.get('body', b''))
+                if not message.get('more_body'):
+                    break
+            body.seek(0)
+            loop = asyncio.get_running_loop()
+            await loop.run_in_executor(self.executor, self._run_wsgi, environ(scope, body), send, loop)
+
+    def _run_wsgi(self, wsgi_environ, send, loop):
+        # runs in a pool thread; the messages are sent from the event loop
+        def send_message(message):
+            asyncio.run_coroutine_threadsafe(send(message), loop).result()
+
+        started = []
+
+        def start_response(status, headers, exc_info=None):
+            started[:] = [int(status.split(' ', 1)[0]),
+                          [(name.lower().encode('latin1'), value.encode('latin1')) for name, value in headers]]
+
+        def start_message():
+            if started:
+                return {'type': 'http.response.start', 'status': started[0], 'headers': started[1]}
+            # WSGI requires start_response before the body, so whatever the app returned is dropped
+            self.app.logger.error('The WSGI app returned without calling start_response: %s', wsgi_environ['PATH_INFO'])
+            return {'type': 'http.response.start', 'status': 500,
+                    'headers': [(b'content-type', b'text/plain; charset=utf-8')]}
+
+        response = self.app(wsgi_environ, start_response)
+        try:
+            sent_start = False
+            for chunk in response:
+                if not sent_start:
+                    send_message(start_message())
+                    sent_start = True
+                    if not started:
+                        break
+                if chunk:
+                    send_message({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+            if not sent_start:
+                send_message(start_message())
+            send_message({'type': 'http.response.body', 'body': b''})
+        finally:
+            if hasattr(response, 'close'):
+                response.close()
+
+
+def environ(scope, body):
+    """Builds the WSGI environ of an ASGI HTTP request.
+
+    Arguments:
+        scope {dict} -- The ASGI connection scope.
+        body {file} -- The request body, read to the end.
+
+    Returns:
+        dict -- The WSGI environ.
+    """
+    script_name = scope.get('root_path', '')
+    path = scope['path']
+    if script_name and path.startswith(script_name):
+        path = path[len(script_name):]
+    server_name, server_port = scope.get('server') or ('localhost', 80)
+    wsgi_environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': script_name.encode('utf-8').decode('latin1'),
+        'PATH_INFO': path.encode('utf-8').decode('latin1'),
+        'QUERY_STRING': scope['query_string'].decode('ascii'),
+        'SERVER_NAME': server_name,
+        'SERVER_PORT': str(server_port),
+        'SERVER_PROTOCOL': 'HTTP/{}'.format(scope['http_version']),
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': body,
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': True,
+        'wsgi.run_once': False,
+    }
+    if scope.get('client'):
+        wsgi_environ['REMOTE_ADDR'] = scope['client'][0]
+        wsgi_environ['REMOTE_PORT'] = str(scope['client'][1])
+    for name, value in scope['headers']:
+        name = name.decode('latin1').upper().replace('-', '_')
+        value = value.decode('latin1')
+        if name == 'CONTENT_TYPE' or name == 'CONTENT_LENGTH':
+            wsgi_environ[name] = value
+            continue
+        key = 'HTTP_' + name
+        # repeated headers are joined the way a WSGI server joins them
+        wsgi_environ[key] = wsgi_environ[key] + ',' + value if key in wsgi_environ else value
+    return wsgi_environ
+
+
+application = ASGIApp(app)
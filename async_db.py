@@ -0,0 +1,133 @@
+import asyncio
+import logging
+
+from flask import g, has_request_context
+
+from database import async_engine_options
+
+try:
+    from sqlalchemy.ext.asyncio import create_async_engine
+except ImportError:
+    create_async_engine = None
+
+#----------------------------------------------------------------------------#
+# Async engine.
+#----------------------------------------------------------------------------#
+
+# the async drivers of the database URI schemes
+ASYNC_DRIVERS = {
+    'postgresql': 'postgresql+asyncpg',
+    'sqlite': 'sqlite+aiosqlite',
+}
+
+logger = logging.getLogger('fyyur.async_db')
+
+
+def async_uri(uri):
+    """The URI of the same database through its async driver, or None when it has none."""
+    scheme, separator, rest = uri.partition('://')
+    driver = ASYNC_DRIVERS.get(scheme.split('+')[0])
+    return driver + separator + rest if driver else None
+
+
+class AsyncDatabase(object):
+    """Async engines the read pages run their independent statements on at the same time.
+
+    The engines only exist while the app is served over ASGI (see asgi.py), which
+    starts them on the server's event loop. A view, running in one of the server's
+    threads, hands its statements to the loop with execute_all() and waits for the
+    rows; the loop runs them concurrently on pooled connections and stays free for
+    other requests meanwhile. Under a WSGI server the views keep running their
+    statements one after another on db.session.
+
+    Every bind of SQLALCHEMY_BINDS gets an async engine too, so the reads of
+    read-only views still go to the replica the router picked.
+    """
+
+    def __init__(self, app=None):
+        self.uris = {}
+        self.options = {}
+        self.engines = {}
+        self.loop = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        uris = {None: app.config.get('ASYNC_DATABASE_URI') or app.config['SQLALCHEMY_DATABASE_URI']}
+        for key, bind in (app.config.get('SQLALCHEMY_BINDS') or {}).items():
+            uris[key] = bind['url'] if isinstance(bind, dict) else bind
+        self.uris = {key: async_uri(uri) for key, uri in uris.items() if isinstance(uri, str)}
+        self.options = async_engine_options(app.config)
+        app.extensions['async_db'] = self
+
+    @property
+    def enabled(self):
+        return self.loop is not None
+
+    def start(self):
+        """Creates the engines on the running event loop; called when the ASGI server starts.
+
+        Returns:
+            boolean -- Whether the engines were created; without SQLAlchemy's asyncio
+            extension or an async driver for the database the views stay synchronous.
+        """
+        if create_async_engine is None or self.uris.get(None) is None:
+            logger.warning('No async driver for the database, the read pages run their queries one after another')
+            return False
+        try:
+            self.engines = {key: create_async_engine(uri, **self.options) for key, uri in self.uris.items() if uri}
+        except ImportError:
+            logger.warning('The async driver is not installed, the read pages run their queries one after another')
+            return False
+        self.loop = asyncio.get_running_loop()
+        return True
+
+    async def stop(self):
+        """Closes the pooled connections; called when the ASGI server shuts down."""
+        engines, self.engines, self.loop = self.engines, {}, None
+        for engine in engines.values():
+            await engine.dispose()
+
+    async def gather(self, statements, key=None):
+        """Runs the statements at the same time, each on its own pooled connection.
+
+        Arguments:
+            statements {list} -- The SELECT statements.
+
+        Keyword Arguments:
+            key {string} -- The bind to run them on (default: {the primary})
+
+        Returns:
+            list -- The rows of every statement, in the order of the statements.
+        """
+        engine = self.engines.get(key) or self.engines[None]
+
+        async def execute(statement):
+            async with engine.connect() as connection:
+                return (await connection.execute(statement)).all()
+        return await asyncio.gather(*[execute(statement) for statement in statements])
+
+    def execute_all(self, statements):
+        """Runs the statements concurrently on the event loop and waits for their rows.
+
+        Called from the thread of a request; the statements go to the replica picked
+        for it, unless it has written. The request context is carried over, so the
+        query profiler still counts them.
+
+        Arguments:
+            statements {list} -- The SELECT statements.
+
+        Returns:
+            list -- The rows of every statement, in the order of the statements.
+        """
+        key = None
+        if has_request_context() and not g.get('db_wrote'):
+            key = g.get('db_replica')
+        return asyncio.run_coroutine_threadsafe(self.gather(statements, key), self.loop).result()
+
+    def stats(self):
+        """The occupancy of the async pools, for monitoring."""
+        return {key or 'primary': engine.pool.status() for key, engine in self.engines.items()}
+
+
+async_db = AsyncDatabase()
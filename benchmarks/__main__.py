@@ -0,0 +1,174 @@
+import os
+import sys
+import tempfile
+
+import click
+
+import config
+from app import create_app
+from models import Venue, Artist, Show
+from benchmarks import load, micro, report, routes, seed
+
+#----------------------------------------------------------------------------#
+# Benchmark commands.
+#----------------------------------------------------------------------------#
+
+DEFAULT_DATABASE_URL = os.environ.get('BENCHMARK_DATABASE_URL') or \
+    'sqlite:///' + os.path.join(tempfile.gettempdir(), 'fyyur-benchmark.db')
+
+
+def benchmark_app(database_url, **overrides):
+    """Creates the app with the settings from config.py, bound to the benchmark database.
+
+    The response cache is off so that the database work is measured, and the query
+    profiler is on so that HTTP responses report their statement counts.
+    """
+    settings = {name: getattr(config, name) for name in dir(config) if name.isupper()}
+    settings.update({
+        'SQLALCHEMY_DATABASE_URI': database_url,
+        'DATABASE_REPLICA_URIS': [],
+        'CACHE_BACKEND': 'null',
+        'QUERY_PROFILER': True,
+        'DEBUG': False,
+    })
+    settings.update(overrides)
+    return create_app(type('BenchmarkConfig', (object,), settings))
+
+
+def _volumes(app):
+    with app.app_context():
+        return {'venues': Venue.query.count(), 'artists': Artist.query.count(), 'shows': Show.query.count()}
+
+
+@click.group()
+def cli():
+    """Seeds a benchmark database and measures every route against it.
+
+    \b
+        python -m benchmarks seed --venues 10000 --artists 50000 --shows 5000000
+        python -m benchmarks run --output benchmarks/results/$(git rev-parse --short HEAD).json
+        python -m benchmarks compare benchmarks/results/BASE.json benchmarks/results/HEAD.json
+
+    The database is BENCHMARK_DATABASE_URL (or --database-url), never the one of config.py.
+    """
+
+
+@cli.command('seed')
+@click.option('--database-url', default=DEFAULT_DATABASE_URL, show_default=True)
+@click.option('--venues', default=10000, show_default=True)
+@click.option('--artists', default=50000, show_default=True)
+@click.option('--shows', default=5000000, show_default=True)
+@click.option('--random-seed', default=0, show_default=True)
+@click.option('--chunk-size', default=50000, show_default=True)
+def seed_command(database_url, venues, artists, shows, random_seed, chunk_size):
+    """Creates the schema and fills it with synthetic venues, artists and shows."""
+    app = benchmark_app(database_url)
+    seed.schema(app)
+    with app.app_context():
+        if Venue.query.first() is not None:
+            raise click.ClickException('The benchmark database is not empty: {}'.format(database_url))
+
+        def progress(table, inserted):
+            click.echo('{}: {} rows'.format(table, inserted), err=True)
+
+        seed.seed(venues, artists, shows, random_seed=random_seed, chunk_size=chunk_size, progress=progress)
+    click.echo('Seeded {} venues, {} artists and {} shows'.format(venues, artists, shows))
+
+
+@cli.command('run')
+@click.option('--database-url', default=DEFAULT_DATABASE_URL, show_default=True)
+@click.option('--output', type=click.Path(dir_okay=False), help='Where to write the results as JSON.')
+@click.option('--iterations', default=50, show_default=True, help='Measured requests per route.')
+@click.option('--warmup', default=5, show_default=True, help='Unmeasured requests per route first.')
+@click.option('--scenario', 'names', multiple=True, help='Only run these route scenarios.')
+@click.option('--url', help='Send the HTTP load to this running server instead of a local one.')
+@click.option('--concurrency', default=8, show_default=True)
+@click.option('--duration', default=30.0, show_default=True, help='Seconds of HTTP load; 0 skips it.')
+@click.option('--asgi-threads', default=4, show_default=True,
+              help='View threads of the ASGI server the venue and artist pages are loaded on, with and without async reads; 0 skips it.')
+@click.option('--import-rows', default=10000, show_default=True, help='Shows imported by the bulk import benchmark; 0 skips it.')
+@click.option('--skip-micro', is_flag=True, help='Skip the search, nearby search, serializer, date formatting, import and export benchmarks.')
+def run_command(database_url, output, iterations, warmup, names, url, concurrency, duration, asgi_threads, import_rows,
+                skip_micro):
+    """Measures every route through the test client, then under concurrent HTTP load, then the micro benchmarks."""
+    app = benchmark_app(database_url)
+    volumes = _volumes(app)
+    if not volumes['venues'] or not volumes['artists']:
+        raise click.ClickException('Seed the benchmark database first: python -m benchmarks seed')
+    results = {'environment': report.environment(database_url), 'volumes': volumes, 'routes': {}, 'load': {}, 'micro': {}}
+
+    click.echo('Routes ({} requests each)...'.format(iterations), err=True)
+    results['routes'], uncovered = routes.run_routes(app, volumes, iterations=iterations, warmup=warmup, names=names)
+    if uncovered and not names:
+        click.echo('Routes without a scenario: {}'.format(', '.join(uncovered)), err=True)
+
+    if duration:
+        click.echo('HTTP load ({} connections for {}s)...'.format(concurrency, duration), err=True)
+        generators = routes.scenarios(volumes, lambda: [])
+        if url:
+            results['load']['mix'] = load.run_load(url, generators, concurrency, duration)
+        else:
+            with load.LocalServer(app) as server:
+                results['load']['mix'] = load.run_load(server.url, generators, concurrency, duration)
+
+    if duration and asgi_threads and load.uvicorn is not None:
+        # the same threads serving the detail pages, with their queries one after another and at the same time
+        click.echo('ASGI load ({} connections on {} threads for {}s each)...'.format(concurrency, asgi_threads, duration), err=True)
+        for name, async_reads in (('asgi_detail_sync', False), ('asgi_detail_async', True)):
+            with load.ASGIServer(app, asgi_threads, async_reads) as server:
+                results['load'][name] = load.run_load(server.url, routes.scenarios(volumes, lambda: []), concurrency,
+                                                      duration, mix=load.DETAIL_MIX)
+
+    if not skip_micro:
+        click.echo('Micro benchmarks...', err=True)
+        with app.app_context():
+            results['micro'].update(micro.bench_search())
+            results['micro'].update(micro.bench_nearby())
+            results['micro'].update(micro.bench_bookings())
+            results['micro'].update(micro.bench_matching())
+            results['micro'].update(micro.bench_serializers())
+            results['micro'].update(micro.bench_datetime_format())
+            results['micro'].update(micro.bench_export())
+            if import_rows:
+                results['micro'].update(micro.bench_import(volumes, import_rows))
+
+    _print_results(results)
+    if output:
+        report.save(results, output)
+        click.echo('Results written to {}'.format(output), err=True)
+
+
+def _print_results(results):
+    click.echo('{:<28} {:>9} {:>9} {:>9} {:>9} {:>10} {:>12} {:>7}'.format(
+        'scenario', 'p50 ms', 'p95 ms', 'p99 ms', 'queries', 'render ms', 'throughput', 'errors'))
+    for section in ('routes', 'load', 'micro'):
+        for name, summary in sorted(results[section].items()):
+            values = [summary.get(metric) for metric in
+                      ('p50_ms', 'p95_ms', 'p99_ms', 'queries_per_request', 'render_ms', 'throughput', 'errors')]
+            click.echo('{:<28} {:>9} {:>9} {:>9} {:>9} {:>10} {:>12} {:>7}'.format(
+                name, *['-' if value is None else value for value in values]))
+
+
+@cli.command('compare')
+@click.argument('baseline', type=click.Path(exists=True, dir_okay=False))
+@click.argument('candidate', type=click.Path(exists=True, dir_okay=False))
+@click.option('--tolerance', default=0.1, show_default=True, help='Relative change allowed before it is a regression.')
+def compare_command(baseline, candidate, tolerance):
+    """Compares two result files and exits with 1 when any metric regressed beyond the tolerance."""
+    baseline_results, candidate_results = report.load(baseline), report.load(candidate)
+    for key in ('database', 'cpus'):
+        if baseline_results['environment'].get(key) != candidate_results['environment'].get(key):
+            click.echo('Warning: the runs differ in {}, so they may not be comparable'.format(key), err=True)
+
+    regressions = 0
+    for section, scenario, metric, old, new, change, regressed in report.compare(baseline_results, candidate_results, tolerance):
+        regressions += regressed
+        click.echo('{} {:<8} {:<28} {:<20} {:>10} -> {:<10} {:+.1%}'.format(
+            '!' if regressed else ' ', section, scenario, metric, old, new, change))
+    if regressions:
+        click.echo('{} regressions'.format(regressions), err=True)
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    cli()
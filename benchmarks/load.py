@@ -0,0 +1,160 @@
+import http.client
+import re
+import socket
+import threading
+import time
+from urllib.parse import urlencode, urlsplit
+
+from werkzeug.serving import WSGIRequestHandler, make_server
+
+from asgi import ASGIApp
+from benchmarks.report import summarize
+
+try:
+    import uvicorn
+except ImportError:
+    uvicorn = None
+
+#----------------------------------------------------------------------------#
+# HTTP load.
+#----------------------------------------------------------------------------#
+
+# the read scenarios the load is made of, weighted roughly like real traffic
+LOAD_MIX = [
+    ('venues', 4), ('artists', 4), ('shows', 6), ('venue', 10), ('artist', 10),
+    ('venue_search', 2), ('artist_search', 2), ('api_shows', 2), ('api_venue', 1),
+]
+
+# the venue and artist pages, whose independent queries run at the same time over ASGI
+DETAIL_MIX = [('venue', 2), ('artist', 2), ('venue_busiest', 1), ('artist_busiest', 1)]
+
+_QUERY_COUNT = re.compile(r'desc="(\d+) queries"')
+_RENDER_TIME = re.compile(r'render;dur=([\d.]+)')
+
+
+class _QuietRequestHandler(WSGIRequestHandler):
+    def log_request(self, *args, **kwargs):
+        pass
+
+
+class LocalServer(object):
+    """Serves the app from a thread on a free local port, for when no URL of a running server is given."""
+
+    def __init__(self, app):
+        self.server = make_server('127.0.0.1', 0, app, threaded=True, request_handler=_QuietRequestHandler)
+        self.url = 'http://127.0.0.1:{}'.format(self.server.server_port)
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.server.shutdown()
+        self.thread.join()
+
+
+class ASGIServer(object):
+    """Serves the app with uvicorn from a thread, running the views in a fixed number of threads.
+
+    Without async reads the lifespan events are not sent, so the async engines are
+    never started and the pages run their queries one after another.
+    """
+
+    def __init__(self, app, threads, async_reads=True):
+        probe = socket.socket()
+        probe.bind(('127.0.0.1', 0))
+        port = probe.getsockname()[1]
+        probe.close()
+        self.url = 'http://127.0.0.1:{}'.format(port)
+        self.server = uvicorn.Server(uvicorn.Config(ASGIApp(app, threads), host='127.0.0.1', port=port,
+                                                    lifespan='on' if async_reads else 'off', log_level='warning'))
+        self.thread = threading.Thread(target=self.server.run, daemon=True)
+
+    def __enter__(self):
+        self.thread.start()
+        while not self.server.started and self.thread.is_alive():
+            time.sleep(0.01)
+        return self
+
+    def __exit__(self, *exc_info):
+        self.server.should_exit = True
+        self.thread.join()
+
+
+def _worker(base_url, next_request, deadline, samples, lock):
+    parts = urlsplit(base_url)
+    connection = http.client.HTTPConnection(parts.hostname, parts.port, timeout=30)
+    latencies, queries, render_times, errors = [], [], [], 0
+    while time.perf_counter() < deadline:
+        request = next_request()
+        body, headers = None, {}
+        if request.data is not None:
+            body = urlencode(request.data) if isinstance(request.data, dict) else request.data
+            headers['Content-Type'] = 'application/x-www-form-urlencoded'
+        started = time.perf_counter()
+        try:
+            connection.request(request.method, parts.path + request.url, body=body, headers=headers)
+            response = connection.getresponse()
+            response.read()
+        except (OSError, http.client.HTTPException):
+            errors += 1
+            connection.close()
+            continue
+        latencies.append(time.perf_counter() - started)
+        if response.status >= 400:
+            errors += 1
+        # the query count and render time are reported by the profiler when it is enabled on the server
+        timing = response.getheader('Server-Timing') or ''
+        match = _QUERY_COUNT.search(timing)
+        if match:
+            queries.append(int(match.group(1)))
+        match = _RENDER_TIME.search(timing)
+        if match:
+            render_times.append(float(match.group(1)) / 1000)
+    connection.close()
+    with lock:
+        samples['latencies'].extend(latencies)
+        samples['queries'].extend(queries)
+        samples['render_times'].extend(render_times)
+        samples['errors'] += errors
+
+
+def run_load(base_url, generators, concurrency=8, duration=30.0, mix=LOAD_MIX):
+    """Sends the read scenarios from concurrent keep-alive connections for a while and measures them together.
+
+    Arguments:
+        base_url {string} -- The root URL of the server under load.
+        generators {dict} -- The scenarios, as built by routes.scenarios().
+
+    Keyword Arguments:
+        concurrency {integer} -- How many connections send requests at the same time (default: {8})
+        duration {float} -- For how many seconds the load is sent (default: {30.0})
+        mix {list} -- The (scenario, weight) pairs the load is made of (default: {LOAD_MIX})
+
+    Returns:
+        dict -- The summary of all requests sent, with throughput over the whole run.
+    """
+    mix = [name for name, weight in mix for _ in range(weight)]
+    lock = threading.Lock()
+    position = [0]
+
+    def next_request():
+        with lock:
+            name = mix[position[0] % len(mix)]
+            position[0] += 1
+            return generators[name]()
+
+    samples = {'latencies': [], 'queries': [], 'render_times': [], 'errors': 0}
+    started = time.perf_counter()
+    deadline = started + duration
+    workers = [threading.Thread(target=_worker, args=(base_url.rstrip('/'), next_request, deadline, samples, lock))
+               for _ in range(concurrency)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    summary = summarize(samples['latencies'], samples['queries'], elapsed=time.perf_counter() - started,
+                        errors=samples['errors'], render_times=samples['render_times'])
+    summary['concurrency'] = concurrency
+    return summary
@@ -0,0 +1,255 @@
+import json
+import random
+import time
+from datetime import datetime, timedelta
+
+import babel.dates
+import dateutil.parser
+from flask import current_app
+from sqlalchemy import select
+
+from models import db, Venue, Artist
+from search import TrigramIndex, search, reset_fallback_index
+from serializers import ModelSerializer, dumps
+from bulk_import import import_records
+from export import export_rows
+from dates import NAMED_FORMATS, format_datetime, format_datetimes
+from geo import GridIndex, nearby_backend, nearby_venues, reset_grid_index
+from matching import FeatureStore, feature_store, matching_available, reset_feature_store
+from bookings import IntervalIndex, booking_backend, booking_conflicts, reset_booking_index, show_end
+from benchmarks.report import summarize
+from benchmarks.seed import CITIES, GENRES, STATES, WORDS, popular_id, show_rows, city_centres, show_start_time
+
+#----------------------------------------------------------------------------#
+# Micro benchmarks.
+#----------------------------------------------------------------------------#
+
+SEARCH_TERMS = ['blue', 'velvet room', 'echo', 'jazz', 'san francisco', 'park lounge', 'no such name', 'ca']
+
+
+def _timed(function, repeat):
+    latencies = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        function()
+        latencies.append(time.perf_counter() - started)
+    return latencies
+
+
+def bench_search(repeat=50, documents=100000, random_seed=0):
+    """Search latency: the in-process index alone over a synthetic set of venues, then every backend the seeded database supports.
+
+    The backends are the pg_trgm index and the in-process index, which is built on
+    first use; builds are timed on their own.
+    """
+    rng = random.Random(random_seed)
+    synthetic = [(number, '{} {} {}'.format(rng.choice(WORDS), rng.choice(WORDS), number), rng.choice(CITIES),
+                  rng.choice(STATES), rng.sample(GENRES, rng.randint(1, 3))) for number in range(1, documents + 1)]
+    index = TrigramIndex()
+
+    def build():
+        for document in synthetic:
+            index.add(*document)
+
+    results = {'search_index_build_{}'.format(documents): summarize(_timed(build, 1))}
+    terms = iter(SEARCH_TERMS * repeat)
+    results['search_index_{}'.format(documents)] = summarize(_timed(lambda: index.search(next(terms)), repeat))
+
+    backends = ['memory'] + (['trigram'] if db.engine.dialect.name == 'postgresql' else [])
+    configured = current_app.config.get('SEARCH_BACKEND')
+    try:
+        for backend in backends:
+            current_app.config['SEARCH_BACKEND'] = backend
+            if backend == 'memory':
+                reset_fallback_index(Venue)
+                results['search_memory_index_build'] = summarize(_timed(lambda: search(Venue, 'blue'), 1))
+            terms = iter(SEARCH_TERMS * repeat)
+            results['search_{}'.format(backend)] = summarize(_timed(lambda: search(Venue, next(terms)), repeat))
+            db.session.rollback()
+    finally:
+        current_app.config['SEARCH_BACKEND'] = configured
+    return results
+
+
+def bench_serializers(rows=2000, repeat=5):
+    """Serialising venues with ModelSerializer against Model.as_dict(), in instances per second.
+
+    Times the instances alone, then a whole API listing page from the query to the
+    JSON document: the serializer's selected rows encoded by dumps(), against loaded
+    instances through as_dict() and json.dumps().
+    """
+    venues = Venue.query.order_by(Venue.id).limit(rows).all()
+    serializer = ModelSerializer(Venue)
+    fields = serializer.fields()
+
+    def rows_document():
+        selected = db.session.execute(select(*serializer.select(fields)).order_by(Venue.id).limit(rows)).all()
+        return dumps({'data': serializer.dump_rows(fields, selected)})
+
+    def as_dict_document():
+        instances = Venue.query.order_by(Venue.id).limit(rows).all()
+        return json.dumps({'data': [venue.as_dict() for venue in instances]}, default=str)
+
+    results = {}
+    for name, timed in (('serializer_dump', lambda: [serializer.dump(venue) for venue in venues]),
+                        ('serializer_as_dict', lambda: [venue.as_dict() for venue in venues]),
+                        ('serializer_page', rows_document),
+                        ('serializer_as_dict_page', as_dict_document)):
+        latencies = _timed(timed, repeat)
+        summary = summarize(latencies)
+        summary['throughput'] = round(len(venues) * repeat / sum(latencies), 2)
+        results[name] = summary
+        db.session.rollback()
+    return results
+
+
+def bench_import(volumes, rows=10000, random_seed=0):
+    """Bulk import throughput of shows, in records per second, with counters refreshed after every chunk."""
+    rng = random.Random(random_seed)
+    start = datetime(2040, 1, 1)
+    records = ({'venue_id': str(rng.randint(1, volumes['venues'])), 'artist_id': str(rng.randint(1, volumes['artists'])),
+                'start_time': (start + timedelta(minutes=number)).isoformat(sep=' ')} for number in range(rows))
+    started = time.perf_counter()
+    summary = import_records('shows', records, chunk_size=current_app.config['IMPORT_CHUNK_SIZE'])
+    elapsed = time.perf_counter() - started
+    return {'import_shows': {'requests': summary['read'], 'errors': summary['rejected'],
+                             'throughput': round(summary['read'] / elapsed, 2)}}
+
+
+def bench_export():
+    """Streaming export throughput of all shows as CSV, in bytes per second."""
+    started = time.perf_counter()
+    size = sum(len(chunk) for chunk in export_rows('shows', 'csv', batch_size=current_app.config['EXPORT_BATCH_SIZE']))
+    elapsed = time.perf_counter() - started
+    db.session.rollback()
+    return {'export_shows_csv': {'requests': 1, 'errors': 0, 'throughput': round(size / elapsed, 2)}}
+
+
+def _format_datetime_by_parsing(value, format='full'):
+    # how the datetime filter formatted show times before it took datetimes
+    return babel.dates.format_datetime(dateutil.parser.parse(str(value)), NAMED_FORMATS.get(format, format))
+
+
+def bench_datetime_format(rows=5000, repeat=5):
+    """Formatting show times for a page: parsing their strings, then formatting the datetimes
+    one datetime at a time and a whole list at once.
+
+    Throughput is in formatted times per second.
+    """
+    start = datetime(2030, 1, 1, 20, 0)
+    values = [start + timedelta(hours=7 * number, seconds=number) for number in range(rows)]
+    results = {}
+    for name, format_all in (
+            ('datetime_format_parsed', lambda: [_format_datetime_by_parsing(value) for value in values]),
+            ('datetime_format', lambda: [format_datetime(value, 'full') for value in values]),
+            ('datetime_format_list', lambda: format_datetimes(values, 'full'))):
+        latencies = _timed(format_all, repeat)
+        summary = summarize(latencies)
+        summary['throughput'] = round(rows * repeat / sum(latencies), 2)
+        results[name] = summary
+    return results
+
+
+def bench_nearby(venues=100000, repeat=200, random_seed=0):
+    """Nearby venue search: the grid index alone over a synthetic set of venues, then nearby_venues() on the seeded database.
+
+    The synthetic venues are spread around the benchmark cities like the seeded ones,
+    and every search is within 5, 25 or 100 km of a point near one of them.
+    """
+    rng = random.Random(random_seed)
+    centres = sorted(city_centres().values())
+
+    def point():
+        latitude, longitude = rng.choice(centres)
+        return latitude + rng.gauss(0, 0.1), longitude + rng.gauss(0, 0.1), rng.choice([5, 25, 100])
+
+    index = GridIndex(current_app.config['NEARBY_GRID_DEGREES'])
+    for number in range(venues):
+        latitude, longitude = rng.choice(centres)
+        index.add(number, latitude + rng.gauss(0, 0.15), longitude + rng.gauss(0, 0.15))
+    results = {'nearby_grid_{}'.format(venues): summarize(_timed(lambda: index.nearby(*point()), repeat))}
+
+    backend = nearby_backend()
+    if backend == 'memory':
+        # the grid index of the seeded venues is built on first use, which is timed on its own
+        reset_grid_index()
+        results['nearby_memory_index_build'] = summarize(_timed(lambda: nearby_venues(*point()), 1))
+    results['nearby_{}'.format(backend)] = summarize(_timed(lambda: nearby_venues(*point()), repeat))
+    db.session.rollback()
+    return results
+
+
+def bench_bookings(shows=1000000, venues=10000, artists=50000, repeat=1000, random_seed=0):
+    """Booking conflict checks: the interval index alone over a million synthetic shows, then booking_conflicts() on the seeded database.
+
+    The synthetic shows are spread and shared out like the seeded ones, and every
+    check is for a show of a popular or a random venue and artist at a seeded time.
+    """
+    rng = random.Random(random_seed)
+    now = datetime.utcnow()
+    index = IntervalIndex()
+
+    synthetic = sorted(((number, row['venue_id'], row['artist_id'], row['start_time'],
+                         show_end(row['start_time'], row['duration']))
+                        for number, row in enumerate(show_rows(rng, venues, artists, shows, now), 1)),
+                       key=lambda booking: booking[3])
+    results = {'bookings_index_build_{}'.format(shows): summarize(_timed(lambda: index.load(synthetic), 1))}
+
+    def check(venues, artists):
+        start_time = show_start_time(rng, now)
+        return start_time, popular_id(rng, venues), popular_id(rng, artists)
+
+    def index_check():
+        start_time, venue_id, artist_id = check(venues, artists)
+        return index.conflicts(venue_id, artist_id, start_time, show_end(start_time, 120))
+    results['bookings_index_{}'.format(shows)] = summarize(_timed(index_check, repeat))
+
+    seeded = {'venues': db.session.query(Venue).count(), 'artists': db.session.query(Artist).count()}
+
+    def seeded_check():
+        start_time, venue_id, artist_id = check(seeded['venues'], seeded['artists'])
+        return booking_conflicts(venue_id, artist_id, start_time, 120)
+
+    backend = booking_backend()
+    if backend == 'memory':
+        # the interval index of the seeded shows is built on first use, which is timed on its own
+        reset_booking_index()
+        results['bookings_memory_index_build'] = summarize(_timed(seeded_check, 1))
+    results['bookings_{}'.format(backend)] = summarize(_timed(seeded_check, repeat))
+    db.session.rollback()
+    return results
+
+
+def bench_matching(artists=100000, venues=10000, repeat=200, random_seed=0):
+    """Venue and artist matching: rankings over a synthetic feature store of 100k artists, then over the seeded database.
+
+    The rankings over the seeded database are timed straight from the feature store,
+    since the recommendations themselves are cached.
+    """
+    if not matching_available():
+        return {}
+    rng = random.Random(random_seed)
+    store = FeatureStore()
+
+    synthetic = {model: [(id, rng.sample(GENRES, rng.randint(1, 3)), rng.choice(CITIES), rng.choice(STATES), rng.random() < 0.3)
+                         for id in range(1, count + 1)]
+                 for model, count in ((Venue, venues), (Artist, artists))}
+
+    def build():
+        for model, rows in synthetic.items():
+            store.load(model, rows)
+        for id in range(1, artists + 1):
+            store.count_show(None, id, rng.randint(0, 50))
+    results = {'matching_store_build_{}'.format(artists): summarize(_timed(build, 1))}
+    weights = current_app.config['MATCHING_WEIGHTS']
+    limit = current_app.config['MATCHING_RESULTS']
+    results['matching_rank_{}'.format(artists)] = summarize(_timed(
+        lambda: store.rank(Venue, rng.randint(1, venues), weights, limit), repeat))
+
+    reset_feature_store()
+    results['matching_store_build'] = summarize(_timed(feature_store, 1))
+    seeded = feature_store()
+    venue_ids = list(seeded.tables[Venue].rows)
+    results['matching_rank'] = summarize(_timed(lambda: seeded.rank(Venue, rng.choice(venue_ids), weights, limit), repeat))
+    db.session.rollback()
+    return results
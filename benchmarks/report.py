@@ -0,0 +1,125 @@
+import json
+import os
+import platform
+import subprocess
+from datetime import datetime
+
+#----------------------------------------------------------------------------#
+# Statistics.
+#----------------------------------------------------------------------------#
+
+# the metrics compared between runs, and whether a higher value is better
+COMPARED_METRICS = {
+    'p50_ms': False,
+    'p95_ms': False,
+    'p99_ms': False,
+    'queries_per_request': False,
+    'render_ms': False,
+    'throughput': True,
+}
+
+
+def percentile(sorted_values, fraction):
+    """The value below which the given fraction of the sorted values fall, interpolated between neighbours."""
+    if not sorted_values:
+        return None
+    position = (len(sorted_values) - 1) * fraction
+    lower = int(position)
+    upper = min(lower + 1, len(sorted_values) - 1)
+    return sorted_values[lower] + (sorted_values[upper] - sorted_values[lower]) * (position - lower)
+
+
+def summarize(latencies, queries=None, elapsed=None, errors=0, render_times=None):
+    """Summarises the latencies of a scenario.
+
+    Arguments:
+        latencies {list} -- The duration of every request, in seconds.
+
+    Keyword Arguments:
+        queries {list} -- The number of statements of every request, when known (default: {None})
+        elapsed {float} -- The wall clock time of the whole scenario, in seconds (default: {sum of latencies})
+        errors {integer} -- How many requests failed (default: {0})
+        render_times {list} -- The time every request spent rendering templates, in seconds, when known (default: {None})
+
+    Returns:
+        dict -- The request count, errors, mean and percentile latencies and mean render time in milliseconds, queries per request and requests per second.
+    """
+    ordered = sorted(latencies)
+    elapsed = elapsed if elapsed is not None else sum(ordered)
+    summary = {
+        'requests': len(ordered),
+        'errors': errors,
+        'mean_ms': round(sum(ordered) / len(ordered) * 1000, 3) if ordered else None,
+        'queries_per_request': round(sum(queries) / float(len(queries)), 2) if queries else None,
+        'render_ms': round(sum(render_times) / len(render_times) * 1000, 3) if render_times else None,
+        'throughput': round(len(ordered) / elapsed, 2) if elapsed else None,
+    }
+    for name, fraction in (('p50_ms', 0.5), ('p95_ms', 0.95), ('p99_ms', 0.99)):
+        value = percentile(ordered, fraction)
+        summary[name] = round(value * 1000, 3) if value is not None else None
+    return summary
+
+#----------------------------------------------------------------------------#
+# Results.
+#----------------------------------------------------------------------------#
+
+
+def current_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def environment(database_url):
+    """Describes where a run happened, so that only comparable results are compared."""
+    return {
+        'commit': current_commit(),
+        'timestamp': datetime.utcnow().isoformat() + 'Z',
+        'python': platform.python_version(),
+        'machine': platform.machine(),
+        'cpus': os.cpu_count(),
+        'database': database_url.split(':', 1)[0],
+    }
+
+
+def save(results, path):
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    with open(path, 'w') as results_file:
+        json.dump(results, results_file, indent=2, sort_keys=True)
+
+
+def load(path):
+    with open(path) as results_file:
+        return json.load(results_file)
+
+
+def compare(baseline, candidate, tolerance=0.1):
+    """Compares the metrics of every scenario of two runs, flagging the ones that got worse by more than the tolerance.
+
+    Arguments:
+        baseline {dict} -- The results of the reference run.
+        candidate {dict} -- The results of the run being checked.
+
+    Keyword Arguments:
+        tolerance {float} -- The relative change allowed before a change counts as a regression (default: {0.1})
+
+    Returns:
+        list -- The (section, scenario, metric, baseline value, candidate value, relative change, regressed) of every metric compared.
+    """
+    rows = []
+    for section in ('routes', 'load', 'micro'):
+        for scenario, metrics in sorted(candidate.get(section, {}).items()):
+            reference = baseline.get(section, {}).get(scenario)
+            if not reference:
+                continue
+            for metric, higher_is_better in COMPARED_METRICS.items():
+                old, new = reference.get(metric), metrics.get(metric)
+                if not old or new is None:
+                    continue
+                change = (new - old) / float(old)
+                worse = -change if higher_is_better else change
+                rows.append((section, scenario, metric, old, new, change, worse > tolerance))
+    return rows
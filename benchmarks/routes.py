@@ -0,0 +1,185 @@
+import itertools
+import json
+import random
+import time
+from collections import namedtuple
+from datetime import datetime, timedelta
+
+from models import db, Venue
+from profiler import profile_queries
+from benchmarks.report import summarize
+from benchmarks.seed import city_centres
+
+#----------------------------------------------------------------------------#
+# Route scenarios.
+#----------------------------------------------------------------------------#
+
+# A request sent by a scenario: the method, the URL and the form data.
+Request = namedtuple('Request', ['method', 'url', 'data'])
+
+# what the venues and artists created by the scenarios are called, unique per run
+BENCHMARK_NAME = 'Benchmark {:x}'.format(int(time.time()))
+
+# the rules the scenarios cannot reach: static files and the debug and monitoring pages
+SKIPPED_RULES = {'/static/<path:filename>', '/debug/queries', '/cache/stats', '/pool/stats', '/replicas/stats'}
+
+
+def _form(rng, number, **extra):
+    form = {
+        'name': '{} {}'.format(BENCHMARK_NAME, number), 'city': 'Austin', 'state': 'TX', 'address': '{} Bench St'.format(number),
+        'phone': '512-555-0100', 'website': 'https://bench.example.com', 'image_link': 'https://bench.example.com/a.jpg',
+        'facebook_link': 'https://www.facebook.com/bench', 'genres': ', '.join(rng.sample(['Jazz', 'Folk', 'Blues'], 2)),
+    }
+    form.update(extra)
+    return form
+
+
+def _import_body(rng, first_number, count=100):
+    return '\n'.join(json.dumps(_form(rng, number, genres=['Jazz'])) for number in range(first_number, first_number + count))
+
+
+def scenarios(volumes, created_venue_ids, random_seed=0):
+    """Builds a request generator for every route of the app, against a database seeded with the given volumes.
+
+    Entities are picked at random rather than always the first, so the pages of
+    busy and quiet venues and artists are both measured. The delete scenario removes
+    the venues created by the create scenario.
+
+    Arguments:
+        volumes {dict} -- How many venues, artists and shows were seeded.
+        created_venue_ids {function} -- Returns the IDs of the venues created so far by this run.
+
+    Keyword Arguments:
+        random_seed {integer} -- Makes the requests reproducible between runs (default: {0})
+
+    Returns:
+        dict -- The scenario names mapped to functions returning the next Request.
+    """
+    rng = random.Random(random_seed)
+    venue_id = lambda: rng.randint(1, volumes['venues'])
+    artist_id = lambda: rng.randint(1, volumes['artists'])
+    term = lambda: rng.choice(['blue', 'velvet room', 'echo', 'jazz', 'san francisco', 'no such name'])
+    centres = sorted(city_centres().values())
+    near = lambda: 'lat={:.4f}&lon={:.4f}&radius={}'.format(*[value + rng.gauss(0, 0.1) for value in rng.choice(centres)],
+                                                              rng.choice([5, 25, 100]))
+    created = itertools.count(1)
+    deletable = []
+
+    def free_period():
+        start = datetime.utcnow().date() + timedelta(days=rng.randint(0, 60))
+        return start.isoformat(), (start + timedelta(days=rng.choice([1, 7, 31]))).isoformat()
+
+    def delete_venue():
+        if not deletable:
+            deletable.extend(created_venue_ids())
+        return Request('DELETE', '/venues/{}'.format(deletable.pop(0) if deletable else 0), None)
+
+    return {
+        'index': lambda: Request('GET', '/', None),
+        'venues': lambda: Request('GET', '/venues', None),
+        'venue': lambda: Request('GET', '/venues/{}'.format(venue_id()), None),
+        'venue_busiest': lambda: Request('GET', '/venues/1', None),
+        'venue_search': lambda: Request('POST', '/venues/search', {'search_term': term()}),
+        'venues_nearby': lambda: Request('GET', '/venues/nearby?' + near(), None),
+        'venue_create_form': lambda: Request('GET', '/venues/create', None),
+        'venue_create': lambda: Request('POST', '/venues/create', _form(rng, next(created))),
+        'venue_edit_form': lambda: Request('GET', '/venues/{}/edit'.format(venue_id()), None),
+        'venue_edit': lambda: Request('POST', '/venues/{}/edit'.format(venue_id()), _form(rng, 0, name='')),
+        'venue_delete': delete_venue,
+        'artists': lambda: Request('GET', '/artists', None),
+        'artist': lambda: Request('GET', '/artists/{}'.format(artist_id()), None),
+        'artist_busiest': lambda: Request('GET', '/artists/1', None),
+        'artist_search': lambda: Request('POST', '/artists/search', {'search_term': term()}),
+        'artist_create_form': lambda: Request('GET', '/artists/create', None),
+        'artist_create': lambda: Request('POST', '/artists/create', _form(rng, next(created))),
+        'artist_edit_form': lambda: Request('GET', '/artists/{}/edit'.format(artist_id()), None),
+        'artist_edit': lambda: Request('POST', '/artists/{}/edit'.format(artist_id()), _form(rng, 0, name='')),
+        'shows': lambda: Request('GET', '/shows', None),
+        'shows_upcoming_of_venue': lambda: Request('GET', '/shows?upcoming=1&venue_id={}'.format(venue_id()), None),
+        'show_create_form': lambda: Request('GET', '/shows/create', None),
+        'show_create': lambda: Request('POST', '/shows/create', {
+            'venue_id': venue_id(), 'artist_id': artist_id(),
+            'start_time': '2030-{:02d}-{:02d} 20:{:02d}:{:02d}'.format(rng.randint(1, 12), rng.randint(1, 28),
+                                                                      rng.randint(0, 59), rng.randint(0, 59)),
+            'duration': rng.choice([60, 120])}),
+        'api_venues': lambda: Request('GET', '/api/v1/venues?limit=50', None),
+        'api_venue': lambda: Request('GET', '/api/v1/venues/{}'.format(venue_id()), None),
+        'api_venues_nearby': lambda: Request('GET', '/api/v1/venues/nearby?limit=20&' + near(), None),
+        'api_venue_free_slots': lambda: Request('GET', '/api/v1/venues/{}/free-slots?start={}&end={}'.format(
+            venue_id(), *free_period()), None),
+        'api_venue_matches': lambda: Request('GET', '/api/v1/venues/{}/matches'.format(venue_id()), None),
+        'api_artists': lambda: Request('GET', '/api/v1/artists?limit=50&fields=name,city', None),
+        'api_artist': lambda: Request('GET', '/api/v1/artists/{}'.format(artist_id()), None),
+        'api_artist_matches': lambda: Request('GET', '/api/v1/artists/{}/matches'.format(artist_id()), None),
+        'api_shows': lambda: Request('GET', '/api/v1/shows?limit=50&fields=start_time,venue_name,artist_name', None),
+        'api_export_venues': lambda: Request('GET', '/api/v1/export/venues?format=ndjson', None),
+        'api_import_artists': lambda: Request('POST', '/api/v1/import/artists?format=ndjson',
+                                              _import_body(rng, 1000000 + 100 * next(created))),
+    }
+
+
+def uncovered_rules(app, requests):
+    """The URL rules of the app that no scenario requests, so new routes do not go unmeasured."""
+    covered = {(rule.rule, method) for rule, method in _matched_rules(app, requests)}
+    missing = []
+    for rule in app.url_map.iter_rules():
+        if rule.rule in SKIPPED_RULES:
+            continue
+        for method in rule.methods - {'HEAD', 'OPTIONS'}:
+            if (rule.rule, method) not in covered:
+                missing.append('{} {}'.format(method, rule.rule))
+    return sorted(missing)
+
+
+def _matched_rules(app, requests):
+    adapter = app.url_map.bind('localhost')
+    for request in requests:
+        rule, arguments = adapter.match(request.url.split('?')[0], method=request.method, return_rule=True)
+        yield rule, request.method
+
+
+def run_routes(app, volumes, iterations=50, warmup=5, names=None, random_seed=0):
+    """Drives every scenario through the Flask test client and measures it.
+
+    Arguments:
+        app {Flask} -- The application, bound to the seeded database.
+        volumes {dict} -- How many venues, artists and shows were seeded.
+
+    Keyword Arguments:
+        iterations {integer} -- How many measured requests each scenario sends (default: {50})
+        warmup {integer} -- How many requests each scenario sends first, unmeasured (default: {5})
+        names {list} -- Only run these scenarios (default: {all})
+        random_seed {integer} -- Makes the requests reproducible between runs (default: {0})
+
+    Returns:
+        tuple -- The summary of every scenario, and the rules left uncovered.
+    """
+    def created_venue_ids():
+        with app.app_context():
+            return [id for id, in db.session.query(Venue.id).filter(Venue.name.like(BENCHMARK_NAME + ' %')).order_by(Venue.id)]
+
+    client = app.test_client()
+    generators = scenarios(volumes, created_venue_ids, random_seed)
+    results = {}
+    sent = []
+    for name, generator in generators.items():
+        if names and name not in names:
+            continue
+        latencies, queries, render_times, errors = [], [], [], 0
+        for iteration in range(warmup + iterations):
+            request = generator()
+            sent.append(request)
+            started = time.perf_counter()
+            with profile_queries() as profile:
+                response = client.open(request.url, method=request.method, data=request.data)
+                response.get_data()
+            duration = time.perf_counter() - started
+            if iteration < warmup:
+                continue
+            latencies.append(duration)
+            queries.append(profile.count)
+            render_times.append(profile.render_duration)
+            if response.status_code >= 400:
+                errors += 1
+        results[name] = summarize(latencies, queries, errors=errors, render_times=render_times)
+    return results, uncovered_rules(app, sent)
@@ -0,0 +1,160 @@
+import random
+from datetime import datetime, timedelta
+
+from flask_migrate import upgrade
+
+from config import GEOCODER_TABLE
+from models import db, Venue, Artist, Show
+from forms import VenueForm
+from counters import reconcile_counters
+from upcoming import refresh_upcoming_shows
+from geo import CityTableGeocoder
+
+#----------------------------------------------------------------------------#
+# Synthetic data.
+#----------------------------------------------------------------------------#
+
+STATES = [value for value, label in VenueForm.state.kwargs['choices']]
+GENRES = [value for value, label in VenueForm.genres.kwargs['choices']]
+CITIES = ['San Francisco', 'New York', 'Austin', 'Chicago', 'Seattle', 'Nashville', 'New Orleans',
+          'Los Angeles', 'Denver', 'Portland', 'Atlanta', 'Detroit', 'Boston', 'Miami', 'Memphis']
+# minutes the seeded shows last
+DURATIONS = [60, 90, 120, 120, 150, 180]
+WORDS = ['Blue', 'Velvet', 'Room', 'Hall', 'Echo', 'Park', 'Lounge', 'Garden', 'Theatre', 'Club',
+         'Wild', 'Cats', 'Sonic', 'Youth', 'Stone', 'Moon', 'Harbor', 'Lights', 'Brass', 'Union']
+
+
+def schema(app):
+    """Creates the schema on the primary: through the migrations on PostgreSQL, which need
+    its extensions, else from the models. Replicas get it by replicating the primary."""
+    with app.app_context():
+        if db.engine.dialect.name == 'postgresql':
+            upgrade()
+        else:
+            # every bind an app was set up with has a metadata in db, replicas included
+            db.create_all(bind_key=None)
+
+
+def _name(rng, number):
+    # numbered so that the natural keys stay unique
+    return '{} {} {}'.format(rng.choice(WORDS), rng.choice(WORDS), number)
+
+
+def _entity(rng, number, **extra):
+    row = {
+        'name': _name(rng, number),
+        'city': rng.choice(CITIES),
+        'state': rng.choice(STATES),
+        'phone': '{:03d}-{:03d}-{:04d}'.format(rng.randint(200, 999), rng.randint(0, 999), rng.randint(0, 9999)),
+        'image_link': 'https://images.example.com/{}.jpg'.format(number),
+        'facebook_link': 'https://www.facebook.com/{}'.format(number),
+        'genres': rng.sample(GENRES, rng.randint(1, 3)),
+    }
+    row.update(extra)
+    return row
+
+
+def city_centres():
+    """The coordinates of the CITIES, from the city table of the default geocoder."""
+    cities = {city: location for (city, state), location in CityTableGeocoder({'GEOCODER_TABLE': GEOCODER_TABLE}).cities.items()}
+    return {city: cities[city.lower()] for city in CITIES}
+
+
+def _venue(rng, number, centres):
+    row = _entity(rng, number, address='{} Main St'.format(number),
+                  website='https://venue{}.example.com'.format(number),
+                  seeking_talent=rng.random() < 0.3)
+    # spread around the centre of the city, about 15 km either way
+    latitude, longitude = centres[row['city']]
+    row.update(latitude=latitude + rng.gauss(0, 0.15), longitude=longitude + rng.gauss(0, 0.15))
+    return row
+
+
+def popular_id(rng, count):
+    """A venue or artist ID skewed so a few of them get most of the shows, like in a real catalogue."""
+    return (int(rng.paretovariate(1.16)) - 1) % count + 1
+
+
+def show_start_time(rng, now):
+    """A show time skewed like a real listing: mostly past shows, evenings, and busier weekends."""
+    days = -rng.expovariate(1 / 240.0) if rng.random() < 0.8 else rng.expovariate(1 / 60.0)
+    day = (now + timedelta(days=days)).replace(hour=0, minute=0, second=0, microsecond=0)
+    if day.weekday() < 4 and rng.random() < 0.4:
+        # push a share of the weekday shows to the weekend
+        day += timedelta(days=4 - day.weekday() + rng.randint(0, 2))
+    return day + timedelta(hours=rng.choice([18, 19, 19, 20, 20, 20, 21, 21, 22]), minutes=rng.choice([0, 0, 15, 30, 45]))
+
+
+def show_rows(rng, venues, artists, shows, now, attempts=8):
+    """Generates shows in order of their start time without double booking a venue or an artist.
+
+    A show goes to the first of a few drawn venue and artist pairs that are both
+    free at its start time, or starts once the soonest free pair is. Half of the
+    pairs are drawn uniformly, so the shows the busiest venues and artists have no
+    room for go elsewhere rather than later.
+    """
+    epoch = datetime(1970, 1, 1)
+    starts = sorted(int((show_start_time(rng, now) - epoch).total_seconds()) // 60 for number in range(shows))
+    venue_free, artist_free = {}, {}
+    for minute in starts:
+        start_time = epoch + timedelta(minutes=minute)
+        best = None
+        for attempt in range(attempts):
+            if attempt < attempts // 2:
+                venue_id, artist_id = popular_id(rng, venues), popular_id(rng, artists)
+            else:
+                venue_id, artist_id = rng.randint(1, venues), rng.randint(1, artists)
+            free_at = max(start_time, venue_free.get(venue_id, start_time), artist_free.get(artist_id, start_time))
+            if best is None or free_at < best[0]:
+                best = (free_at, venue_id, artist_id)
+            if free_at == start_time:
+                break
+        start_time, venue_id, artist_id = best
+        duration = rng.choice(DURATIONS)
+        venue_free[venue_id] = artist_free[artist_id] = start_time + timedelta(minutes=duration)
+        yield {'venue_id': venue_id, 'artist_id': artist_id, 'start_time': start_time, 'duration': duration}
+
+
+def seed(venues=10000, artists=50000, shows=5000000, random_seed=0, chunk_size=50000, now=None, progress=None):
+    """Fills an empty database with synthetic venues, artists and shows.
+
+    Rows are inserted in chunks through executemany, then the show counters of every
+    venue and artist are computed in one pass. No venue or artist is booked for two
+    shows at once, as the exclusion constraints on PostgreSQL require.
+
+    Keyword Arguments:
+        venues {integer} -- How many venues to create (default: {10000})
+        artists {integer} -- How many artists to create (default: {50000})
+        shows {integer} -- How many shows to create (default: {5000000})
+        random_seed {integer} -- Makes the data reproducible between runs (default: {0})
+        chunk_size {integer} -- How many rows are inserted per statement (default: {50000})
+        now {datetime} -- The point in time the shows are spread around (default: {now})
+        progress {function} -- Called with (table, rows inserted so far) after every chunk (default: {None})
+
+    Returns:
+        dict -- How many rows were inserted into each table.
+    """
+    rng = random.Random(random_seed)
+    now = now or datetime.utcnow()
+
+    def insert(model, rows_for):
+        inserted = 0
+        total = {Venue: venues, Artist: artists, Show: shows}[model]
+        while inserted < total:
+            rows = [rows_for(inserted + offset + 1) for offset in range(min(chunk_size, total - inserted))]
+            with db.engine.begin() as connection:
+                connection.execute(model.__table__.insert(), rows)
+            inserted += len(rows)
+            if progress is not None:
+                progress(model.__tablename__, inserted)
+
+    centres = city_centres()
+    insert(Venue, lambda number: _venue(rng, number, centres))
+    insert(Artist, lambda number: _entity(rng, number, seeking_venue=rng.random() < 0.3))
+    rows = show_rows(rng, venues, artists, shows, now)
+    insert(Show, lambda number: next(rows))
+
+    reconcile_counters(repair=True, current_time=now)
+    db.session.commit()
+    refresh_upcoming_shows(full=True, current_time=now)
+    return {'venues': venues, 'artists': artists, 'shows': shows}
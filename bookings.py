@@ -0,0 +1,433 @@
+import threading
+from bisect import bisect_left, bisect_right
+from datetime import datetime, timedelta, timezone
+
+import dateutil.parser
+from flask import current_app
+from sqlalchemy import event, or_, select, text
+from sqlalchemy.orm import Session
+
+from cache import cache
+from models import db, Venue, Artist, Show
+
+#----------------------------------------------------------------------------#
+# Bookings.
+#----------------------------------------------------------------------------#
+
+# A show books its venue and its artist from its start time for its duration in
+# minutes, and neither can be booked for two shows at once. New shows are checked
+# against the bookings of their venue and artist before they are written, either
+# with an indexed query on the shows ('query') or with an in-process interval index
+# of every show ('memory'), picked with BOOKING_BACKEND.
+#
+# Durations are at most SHOW_MAX_DURATION minutes, so the bookings overlapping a
+# time are among the shows of the venue or the artist starting less than that
+# before it, which the (venue_id, start_time) and (artist_id, start_time) indexes
+# find with a range scan.
+#
+# On PostgreSQL every partition of Show also carries exclusion constraints over the
+# time ranges of the shows (see migration 5a2e9c7d1b63 and add_booking_constraints()),
+# so two requests racing for the same slot cannot both succeed. A partitioned table
+# cannot have them itself, so a show running past midnight at the end of a month is
+# only checked against the next month's shows by the application.
+
+# SQLSTATE of an exclusion constraint violation
+_EXCLUSION_VIOLATION = '23P01'
+
+# the first keys of the advisory locks taken on a venue or an artist (see lock_bookings())
+_ADVISORY_LOCK_VENUE = 1
+_ADVISORY_LOCK_ARTIST = 2
+
+
+def show_end(start_time, duration):
+    """The time a show starting at a time and lasting a number of minutes ends."""
+    return start_time + timedelta(minutes=duration)
+
+
+def show_duration(value=None):
+    """Parses the duration of a show in minutes, defaulting to SHOW_DEFAULT_DURATION.
+
+    Raises:
+        ValueError -- When it is not a number of minutes between 1 and SHOW_MAX_DURATION.
+    """
+    config = current_app.config
+    if value in (None, ''):
+        return config['SHOW_DEFAULT_DURATION']
+    duration = int(value)
+    if not 1 <= duration <= config['SHOW_MAX_DURATION']:
+        raise ValueError('duration must be between 1 and {} minutes'.format(config['SHOW_MAX_DURATION']))
+    return duration
+
+
+def booking_backend():
+    """The configured overlap check, 'query' or 'memory', picked from the dialect when unset."""
+    backend = current_app.config.get('BOOKING_BACKEND')
+    if backend:
+        return backend
+    return 'query' if db.engine.dialect.name == 'postgresql' else 'memory'
+
+
+def booking_conflicts(venue_id, artist_id, start_time, duration, exclude=None):
+    """Finds the shows booking a venue or an artist at any time during a new show.
+
+    Arguments:
+        venue_id {integer} -- The venue of the new show.
+        artist_id {integer} -- The artist of the new show.
+        start_time {datetime} -- When it starts.
+        duration {integer} -- How many minutes it lasts.
+
+    Keyword Arguments:
+        exclude {integer} -- The ID of a show not to count, e.g. the one being moved (default: {None})
+
+    Returns:
+        list -- The conflicting shows as dictionaries with their id, venue_id, artist_id,
+        start_time and end_time, earliest first.
+    """
+    end_time = show_end(start_time, duration)
+    if booking_backend() == 'memory':
+        found = booking_index().conflicts(venue_id, artist_id, start_time, end_time, exclude)
+    else:
+        found = [row for row in overlapping_shows([venue_id], [artist_id], start_time, end_time) if row[0] != exclude]
+    return [{'id': id, 'venue_id': venue, 'artist_id': artist, 'start_time': start, 'end_time': end}
+            for id, venue, artist, start, end in sorted(found, key=lambda row: (row[3], row[0]))]
+
+
+def free_slots(venue_id, start_time, end_time, duration):
+    """The stretches of time a venue is not booked for, long enough for a show.
+
+    Arguments:
+        venue_id {integer} -- The venue.
+        start_time {datetime} -- The beginning of the period to look at.
+        end_time {datetime} -- Its end.
+        duration {integer} -- The shortest stretch worth listing, in minutes.
+
+    Returns:
+        list -- The free stretches as dictionaries with their start and end, earliest first.
+    """
+    if booking_backend() == 'memory':
+        bookings = booking_index().overlapping(('venue', venue_id), start_time, end_time)
+    else:
+        bookings = overlapping_shows([venue_id], None, start_time, end_time)
+    slots = []
+    free_from = start_time
+    for booking in sorted(bookings, key=lambda row: row[3]):
+        if booking[3] - free_from >= timedelta(minutes=duration):
+            slots.append({'start': free_from, 'end': booking[3]})
+        free_from = max(free_from, booking[4])
+    if end_time - free_from >= timedelta(minutes=duration):
+        slots.append({'start': free_from, 'end': end_time})
+    return slots
+
+
+def free_slot_arguments(args):
+    """Reads the period and the duration of a free slot search from request arguments.
+
+    Arguments:
+        args {dict} -- The arguments: start and end (ISO dates or times, default: the next 7 days)
+        and duration (minutes, default: SHOW_DEFAULT_DURATION).
+
+    Raises:
+        ValueError -- When an argument is malformed or the period is empty or too long.
+
+    Returns:
+        tuple -- The start, the end and the duration.
+    """
+    try:
+        start_time = dateutil.parser.isoparse(args['start']) if args.get('start') else \
+            datetime.utcnow().replace(second=0, microsecond=0)
+        end_time = dateutil.parser.isoparse(args['end']) if args.get('end') else start_time + timedelta(days=7)
+    except ValueError:
+        raise ValueError('start and end must be ISO 8601 dates or times')
+    duration = show_duration(args.get('duration'))
+    max_days = current_app.config['FREE_SLOTS_MAX_DAYS']
+    if not start_time < end_time <= start_time + timedelta(days=max_days):
+        raise ValueError('end must be after start and at most {} days later'.format(max_days))
+    return _utc(start_time), _utc(end_time), duration
+
+
+def _utc(value):
+    # show times are stored in UTC without a timezone
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+
+def is_booking_conflict(error):
+    """Whether a failed write broke a booking exclusion constraint, i.e. lost a race for a slot."""
+    return getattr(getattr(error, 'orig', None), 'pgcode', None) == _EXCLUSION_VIOLATION
+
+
+def lock_bookings(venue_id, artist_id):
+    """Keeps other transactions from booking a venue or an artist until the session's transaction ends.
+
+    Taken before checking a new show for conflicts and held until it is written, so
+    two requests cannot both find the same slot free. SQLite takes its write lock
+    right away (BEGIN IMMEDIATE); PostgreSQL takes transaction advisory locks on the
+    venue and the artist, always in that order so that two bookings cannot deadlock.
+
+    Arguments:
+        venue_id {integer} -- The venue of the new show.
+        artist_id {integer} -- The artist of the new show.
+    """
+    connection = db.session.connection()
+    if connection.dialect.name == 'sqlite':
+        # the driver only begins a transaction before a write, so none is open yet after reads
+        if not connection.connection.dbapi_connection.in_transaction:
+            connection.exec_driver_sql('BEGIN IMMEDIATE')
+    elif connection.dialect.name == 'postgresql':
+        for kind, id in ((_ADVISORY_LOCK_VENUE, venue_id), (_ADVISORY_LOCK_ARTIST, artist_id)):
+            connection.execute(text('SELECT pg_advisory_xact_lock(:kind, :id)'), {'kind': kind, 'id': id})
+
+
+def add_booking_constraints(connection, table):
+    """Adds the exclusion constraints keeping the shows of a partition of Show from overlapping.
+
+    Arguments:
+        connection {Connection} -- A PostgreSQL connection, with the btree_gist extension installed.
+        table {string} -- The name of the partition, e.g. Show_202610.
+    """
+    for column in ('venue_id', 'artist_id'):
+        connection.execute(text(
+            'ALTER TABLE "{0}" ADD CONSTRAINT "{0}_{1}_booking" EXCLUDE USING gist '
+            '({1} WITH =, tsrange(start_time, start_time + duration * interval \'1 minute\') WITH &&)'
+            .format(table, column)))
+
+
+def overlapping_shows(venue_ids, artist_ids, start_time, end_time, connection=None):
+    """Queries the shows of some venues or artists overlapping a period.
+
+    Arguments:
+        venue_ids {iterable} -- The venues, or None.
+        artist_ids {iterable} -- The artists, or None.
+        start_time {datetime} -- The beginning of the period.
+        end_time {datetime} -- Its end.
+
+    Keyword Arguments:
+        connection {Connection} -- The connection to query with (default: {the session})
+
+    Returns:
+        list -- The shows as (id, venue_id, artist_id, start_time, end_time) tuples.
+    """
+    shows = Show.__table__
+    earliest = start_time - timedelta(minutes=current_app.config['SHOW_MAX_DURATION'])
+    owners = []
+    if venue_ids:
+        owners.append(shows.c.venue_id.in_(list(venue_ids)))
+    if artist_ids:
+        owners.append(shows.c.artist_id.in_(list(artist_ids)))
+    query = select(shows.c.id, shows.c.venue_id, shows.c.artist_id, shows.c.start_time, shows.c.duration) \
+        .where(or_(*owners), shows.c.start_time > earliest, shows.c.start_time < end_time)
+    rows = (connection or db.session).execute(query)
+    found = [(id, venue, artist, start, show_end(start, duration)) for id, venue, artist, start, duration in rows]
+    return [row for row in found if row[4] > start_time]
+
+#----------------------------------------------------------------------------#
+# In-process interval index.
+#----------------------------------------------------------------------------#
+
+
+class _Timeline(object):
+    # the bookings of one venue or artist, sorted by start time, and the longest of them
+
+    __slots__ = ('starts', 'ends', 'ids', 'longest')
+
+    def __init__(self):
+        self.starts = []
+        self.ends = []
+        self.ids = []
+        self.longest = timedelta(0)
+
+
+class IntervalIndex(object):
+    """Bookings of every venue and artist, answering overlap queries without the database.
+
+    Each venue and each artist has its bookings sorted by start time. Only bookings
+    starting less than the longest of them before a time can still run at that time,
+    so the ones overlapping a period are found with a binary search and a scan of the
+    few bookings starting in between.
+    """
+
+    def __init__(self):
+        self.timelines = {}
+        self.shows = {}
+        # the version of the 'shows' tag the index was built at
+        self.shows_version = None
+
+    def __len__(self):
+        return len(self.shows)
+
+    def add(self, id, venue_id, artist_id, start_time, end_time):
+        """Adds a booking, replacing any previous one of the same show."""
+        if id in self.shows:
+            self.remove(id)
+        self.shows[id] = (venue_id, artist_id, start_time, end_time)
+        for key in (('venue', venue_id), ('artist', artist_id)):
+            timeline = self.timelines.get(key)
+            if timeline is None:
+                timeline = self.timelines[key] = _Timeline()
+            position = bisect_right(timeline.starts, start_time)
+            timeline.starts.insert(position, start_time)
+            timeline.ends.insert(position, end_time)
+            timeline.ids.insert(position, id)
+            timeline.longest = max(timeline.longest, end_time - start_time)
+
+    def load(self, bookings):
+        """Adds many bookings of shows not in the index yet, sorted by start time.
+
+        Arguments:
+            bookings {iterable} -- The bookings as (id, venue_id, artist_id, start_time, end_time) tuples.
+        """
+        timelines, shows = self.timelines, self.shows
+        for id, venue_id, artist_id, start_time, end_time in bookings:
+            shows[id] = (venue_id, artist_id, start_time, end_time)
+            length = end_time - start_time
+            for key in (('venue', venue_id), ('artist', artist_id)):
+                timeline = timelines.get(key)
+                if timeline is None:
+                    timeline = timelines[key] = _Timeline()
+                timeline.starts.append(start_time)
+                timeline.ends.append(end_time)
+                timeline.ids.append(id)
+                if length > timeline.longest:
+                    timeline.longest = length
+
+    def remove(self, id):
+        """Removes the booking of a show, if there is one."""
+        show = self.shows.pop(id, None)
+        if show is None:
+            return
+        venue_id, artist_id, start_time, end_time = show
+        for key in (('venue', venue_id), ('artist', artist_id)):
+            timeline = self.timelines[key]
+            position = bisect_left(timeline.starts, start_time)
+            while timeline.ids[position] != id:
+                position += 1
+            del timeline.starts[position], timeline.ends[position], timeline.ids[position]
+
+    def remove_owner(self, kind, owner_id):
+        """Removes every booking of a venue or an artist, e.g. after deleting it."""
+        timeline = self.timelines.get((kind, owner_id))
+        if timeline is not None:
+            for id in list(timeline.ids):
+                self.remove(id)
+            self.timelines.pop((kind, owner_id), None)
+
+    def overlapping(self, key, start_time, end_time):
+        """The bookings of a venue or an artist overlapping a period.
+
+        Arguments:
+            key {tuple} -- ('venue', venue ID) or ('artist', artist ID).
+            start_time {datetime} -- The beginning of the period.
+            end_time {datetime} -- Its end.
+
+        Returns:
+            list -- The bookings as (id, venue_id, artist_id, start_time, end_time) tuples.
+        """
+        timeline = self.timelines.get(key)
+        if timeline is None:
+            return []
+        found = []
+        starts, ends = timeline.starts, timeline.ends
+        position = bisect_right(starts, start_time - timeline.longest)
+        last = bisect_left(starts, end_time, position)
+        for position in range(position, last):
+            if ends[position] > start_time:
+                id = timeline.ids[position]
+                found.append((id,) + self.shows[id])
+        return found
+
+    def conflicts(self, venue_id, artist_id, start_time, end_time, exclude=None):
+        """The bookings of a venue or an artist overlapping a period, apart from one show's."""
+        found = {}
+        for key in (('venue', venue_id), ('artist', artist_id)):
+            for booking in self.overlapping(key, start_time, end_time):
+                if booking[0] != exclude:
+                    found[booking[0]] = booking
+        return list(found.values())
+
+
+_booking_index = {}
+_booking_lock = threading.Lock()
+
+
+def booking_index():
+    """Returns the in-process interval index of the shows, building it from the database on first use
+    or once the 'shows' cache tag has been invalidated since.
+
+    Every process keeps its own copy, updated with the writes committed through its
+    sessions. The writes of the other processes are only seen once they invalidate the
+    tag, with a cache backend shared between them.
+    """
+    with _booking_lock:
+        index = _booking_index.get('shows')
+        # read before building, so that a write made meanwhile is not missed
+        version = cache.version('shows')
+        if index is None or index.shows_version != version:
+            index = IntervalIndex()
+            index.shows_version = version
+            shows = Show.__table__
+            rows = db.session.execute(select(shows.c.id, shows.c.venue_id, shows.c.artist_id, shows.c.start_time, shows.c.duration)
+                                      .where(shows.c.start_time.isnot(None)).order_by(shows.c.start_time)
+                                      .execution_options(yield_per=10000))
+            index.load((id, venue_id, artist_id, start_time, start_time + timedelta(minutes=duration))
+                       for id, venue_id, artist_id, start_time, duration in rows)
+            _booking_index['shows'] = index
+        return index
+
+
+def reset_booking_index():
+    """Drops the in-process interval index so it is rebuilt on next use, after writes that skip the ORM."""
+    with _booking_lock:
+        _booking_index.pop('shows', None)
+
+
+def _record_show(mapper, connection, show):
+    session = Session.object_session(show)
+    if session is not None and show.start_time is not None:
+        end_time = show_end(show.start_time, show.duration or current_app.config['SHOW_DEFAULT_DURATION'])
+        session.info.setdefault('booking_index_changes', []).append(
+            ('add', show.id, show.venue_id, show.artist_id, show.start_time, end_time))
+
+
+def _record_removal(kind):
+    def listener(mapper, connection, target):
+        session = Session.object_session(target)
+        if session is not None:
+            session.info.setdefault('booking_index_changes', []).append((kind, target.id))
+    return listener
+
+
+def _apply_changes(session):
+    changes = session.info.pop('booking_index_changes', [])
+    with _booking_lock:
+        index = _booking_index.get('shows')
+        if index is None:
+            return
+        for change in changes:
+            if change[0] == 'add':
+                index.add(*change[1:])
+            elif change[0] == 'show':
+                index.remove(change[1])
+            else:
+                # the shows of a deleted venue or artist are deleted with it by the database
+                index.remove_owner(*change)
+
+
+def _discard_changes(session, *args):
+    session.info.pop('booking_index_changes', None)
+
+
+def _drop_after_bulk_change(context):
+    if context.mapper is not None and context.mapper.class_ in (Venue, Artist, Show):
+        reset_booking_index()
+
+
+event.listen(Show, 'after_insert', _record_show)
+event.listen(Show, 'after_update', _record_show)
+event.listen(Show, 'after_delete', _record_removal('show'))
+event.listen(Venue, 'after_delete', _record_removal('venue'))
+event.listen(Artist, 'after_delete', _record_removal('artist'))
+event.listen(Session, 'after_commit', _apply_changes)
+event.listen(Session, 'after_soft_rollback', _discard_changes)
+event.listen(Session, 'after_bulk_delete', _drop_after_bulk_change)
+event.listen(Session, 'after_bulk_update', _drop_after_bulk_change)
@@ -0,0 +1,289 @@
+import csv
+import io
+import json
+from collections import OrderedDict, namedtuple
+from datetime import datetime
+from itertools import islice
+
+from flask import current_app
+from sqlalchemy import select, text
+from sqlalchemy.engine import make_url
+from sqlalchemy.dialects import postgresql, sqlite
+from werkzeug.datastructures import MultiDict
+
+from models import db, Venue, Artist, Show
+from forms import VenueImportForm, ArtistImportForm, ShowImportForm
+from counters import refresh_counters
+from cache import cache
+from search import reset_fallback_index
+from geo import reset_grid_index
+from matching import reset_feature_store
+from bookings import IntervalIndex, reset_booking_index, show_end, overlapping_shows
+from routing import remember_write
+
+#----------------------------------------------------------------------------#
+# Bulk import.
+#----------------------------------------------------------------------------#
+
+# What can be imported: the model, the form whose rules validate every record,
+# the columns written and the natural key the upsert matches existing rows on.
+ImportKind = namedtuple('ImportKind', ['model', 'form', 'columns', 'natural_key'])
+
+IMPORT_KINDS = {
+    'venues': ImportKind(Venue, VenueImportForm,
+                         ('name', 'city', 'state', 'address', 'phone', 'website', 'image_link', 'facebook_link', 'genres'),
+                         ('name', 'city', 'state')),
+    'artists': ImportKind(Artist, ArtistImportForm,
+                          ('name', 'city', 'state', 'phone', 'image_link', 'facebook_link', 'genres'),
+                          ('name', 'city', 'state')),
+    'shows': ImportKind(Show, ShowImportForm,
+                        ('artist_id', 'venue_id', 'start_time', 'duration'),
+                        ('venue_id', 'artist_id', 'start_time')),
+}
+
+# the dialects with an INSERT ... ON CONFLICT to upsert with
+UPSERT_DIALECTS = {'postgresql': postgresql, 'sqlite': sqlite}
+
+
+def check_database(uri):
+    """Raises a ValueError for a database bulk imports cannot upsert into, checked before
+    an import starts rather than in the middle of it.
+
+    Arguments:
+        uri {string} -- The SQLALCHEMY_DATABASE_URI.
+    """
+    backend = make_url(uri).get_backend_name()
+    if backend not in UPSERT_DIALECTS:
+        raise ValueError('Bulk imports need PostgreSQL or SQLite, not {}'.format(backend))
+
+
+def read_records(stream, data_format):
+    """Streams the records of a CSV or NDJSON document one at a time.
+
+    Arguments:
+        stream {file} -- A text stream of the document.
+        data_format {string} -- Either 'csv' (with a header row) or 'ndjson'.
+
+    Returns:
+        generator -- The records as dictionaries.
+    """
+    if data_format == 'csv':
+        return csv.DictReader(stream)
+    if data_format == 'ndjson':
+        return (json.loads(line) for line in stream if line.strip())
+    raise ValueError('Unknown import format: {}'.format(data_format))
+
+
+def validate_record(kind, record):
+    """Validates a record with the rules of the form used to create the same data by hand,
+    relaxed for what an export holds (see the import forms in forms.py).
+
+    Genres may be a list or, like the form input, a string separated by ', '.
+
+    Arguments:
+        kind {ImportKind} -- What the record is.
+        record {dict} -- The raw record.
+
+    Returns:
+        tuple -- The column values to write and the validation errors; the values are None when invalid.
+    """
+    formdata = MultiDict()
+    for name, value in record.items():
+        if name == 'genres' and isinstance(value, str):
+            value = value.split(', ')
+        if isinstance(value, list):
+            for item in value:
+                formdata.add(name, item)
+        elif value is not None:
+            formdata.add(name, str(value))
+
+    form = kind.form(formdata=formdata, meta={'csrf': False})
+    if not form.validate():
+        return None, form.errors
+
+    values = {column: form.data[column] or None for column in kind.columns}
+    if kind.model is Show:
+        try:
+            values['artist_id'] = int(values['artist_id'])
+            values['venue_id'] = int(values['venue_id'])
+        except (TypeError, ValueError):
+            return None, {'artist_id/venue_id': ['Not a valid ID.']}
+        values['duration'] = values['duration'] or current_app.config['SHOW_DEFAULT_DURATION']
+    return values, {}
+
+
+def import_records(kind_name, records, chunk_size=5000, resume_from=0, on_error=None, on_chunk=None):
+    """Validates and upserts a stream of records in bounded chunks.
+
+    Only one chunk is held in memory at a time. Every chunk is written and committed
+    in its own transaction: with COPY into a staging table and one INSERT ... ON CONFLICT
+    on PostgreSQL, and with an executemany upsert elsewhere. Rows are matched on their
+    natural key, so replaying records that were already imported updates them in place,
+    which makes an interrupted import safe to resume from its last checkpoint.
+
+    Arguments:
+        kind_name {string} -- What is imported: 'venues', 'artists' or 'shows'.
+        records {iterable} -- The raw records, e.g. from read_records().
+
+    Keyword Arguments:
+        chunk_size {integer} -- How many records are written per transaction (default: {5000})
+        resume_from {integer} -- Skip the records up to and including this 1-based number (default: {0})
+        on_error {function} -- Called with (record_number, errors) for every rejected record (default: {None})
+        on_chunk {function} -- Called with the number of the last record of every committed chunk (default: {None})
+
+    Returns:
+        dict -- How many records were read, imported and rejected, and the last committed record number.
+    """
+    kind = IMPORT_KINDS[kind_name]
+    summary = {'read': 0, 'imported': 0, 'rejected': 0, 'last_record': resume_from}
+    numbered = islice(enumerate(records, 1), resume_from, None)
+    try:
+        while True:
+            chunk = list(islice(numbered, chunk_size))
+            if not chunk:
+                break
+            _import_chunk(kind, chunk, summary, on_error)
+            if on_chunk is not None:
+                on_chunk(summary['last_record'])
+    finally:
+        # the chunks skip the ORM, so drop what was derived from the old rows,
+        # including after a failure, since the chunks before it are committed
+        if summary['last_record'] > resume_from:
+            cache.clear()
+            for model in (Venue, Artist):
+                reset_fallback_index(model)
+            reset_grid_index()
+            reset_booking_index()
+            reset_feature_store()
+    return summary
+
+
+def _import_chunk(kind, chunk, summary, on_error):
+    # records repeating a natural key within the chunk collapse into the last one
+    valid = OrderedDict()
+    for number, record in chunk:
+        values, errors = validate_record(kind, record)
+        if errors:
+            summary['rejected'] += 1
+            if on_error is not None:
+                on_error(number, errors)
+        else:
+            valid[tuple(values[key] for key in kind.natural_key)] = (number, values)
+
+    with db.engine.begin() as connection:
+        if kind.model is Show:
+            valid = _drop_unknown_references(connection, valid, summary, on_error)
+            valid = _drop_conflicting_bookings(connection, valid, summary, on_error)
+        rows = [values for number, values in valid.values()]
+        if rows:
+            _upsert(connection, kind, rows)
+            if kind.model is Show:
+                refresh_counters(connection, Venue, [row['venue_id'] for row in rows])
+                refresh_counters(connection, Artist, [row['artist_id'] for row in rows])
+
+    if rows:
+        # the chunk is committed, so the visitor reads it from the primary from now on
+        remember_write()
+    summary['read'] += len(chunk)
+    summary['imported'] += len(rows)
+    summary['last_record'] = chunk[-1][0]
+
+
+def _drop_unknown_references(connection, valid, summary, on_error):
+    # reject shows of missing venues or artists up front instead of failing the whole chunk
+    venue_ids = {values['venue_id'] for number, values in valid.values()}
+    artist_ids = {values['artist_id'] for number, values in valid.values()}
+    venues, artists = Venue.__table__, Artist.__table__
+    known_venues = {row.id for row in connection.execute(select(venues.c.id).where(venues.c.id.in_(venue_ids)))}
+    known_artists = {row.id for row in connection.execute(select(artists.c.id).where(artists.c.id.in_(artist_ids)))}
+
+    kept = OrderedDict()
+    for key, (number, values) in valid.items():
+        if values['venue_id'] in known_venues and values['artist_id'] in known_artists:
+            kept[key] = (number, values)
+        else:
+            summary['rejected'] += 1
+            if on_error is not None:
+                on_error(number, {'artist_id/venue_id': ['No such venue or artist.']})
+    return kept
+
+
+def _drop_conflicting_bookings(connection, valid, summary, on_error):
+    # reject shows overlapping another booking of their venue or artist, whether an
+    # existing show or an earlier record of the chunk (see bookings.py)
+    if not valid:
+        return valid
+    periods = [(values['start_time'], show_end(values['start_time'], values['duration']))
+               for number, values in valid.values()]
+    existing = overlapping_shows({values['venue_id'] for number, values in valid.values()},
+                                  {values['artist_id'] for number, values in valid.values()},
+                                  min(start for start, end in periods), max(end for start, end in periods), connection)
+    index = IntervalIndex()
+    replaced = {}
+    for booking in existing:
+        index.add(*booking)
+        replaced[(booking[1], booking[2], booking[3])] = booking
+
+    kept = OrderedDict()
+    for (key, (number, values)), (start_time, end_time) in zip(valid.items(), periods):
+        # a record matching an existing show updates it, so the show does not count
+        previous = replaced.get(key)
+        if previous is not None:
+            index.remove(previous[0])
+        if index.conflicts(values['venue_id'], values['artist_id'], start_time, end_time):
+            if previous is not None:
+                index.add(*previous)
+            summary['rejected'] += 1
+            if on_error is not None:
+                on_error(number, {'start_time': ['The venue or the artist is already booked at that time.']})
+        else:
+            index.add(('record', number), values['venue_id'], values['artist_id'], start_time, end_time)
+            kept[key] = (number, values)
+    return kept
+
+
+def _upsert(connection, kind, rows):
+    if connection.dialect.name == 'postgresql' and connection.dialect.driver == 'psycopg2':
+        _upsert_copy(connection, kind, rows)
+    else:
+        _upsert_executemany(connection, kind, rows)
+
+
+def _upsert_executemany(connection, kind, rows):
+    table = kind.model.__table__
+    statement = UPSERT_DIALECTS[connection.dialect.name].insert(table)
+    updates = {column: statement.excluded[column] for column in kind.columns if column not in kind.natural_key}
+    updates['updated_at'] = datetime.utcnow()
+    connection.execute(statement.on_conflict_do_update(index_elements=list(kind.natural_key), set_=updates), rows)
+
+
+def _upsert_copy(connection, kind, rows):
+    table = kind.model.__tablename__
+    staging = 'import_staging_{}'.format(table.lower())
+    columns = ', '.join(kind.columns)
+    updates = ', '.join('{0} = EXCLUDED.{0}'.format(column) for column in kind.columns if column not in kind.natural_key)
+    updates = ', '.join(filter(None, [updates, "updated_at = timezone('utc', now())"]))
+
+    connection.execute(text('CREATE TEMP TABLE IF NOT EXISTS {} ON COMMIT DELETE ROWS AS SELECT {} FROM "{}" WITH NO DATA'
+                            .format(staging, columns, table)))
+    buffer = io.StringIO()
+    for row in rows:
+        buffer.write(','.join(_copy_value(row[column]) for column in kind.columns))
+        buffer.write('\n')
+    buffer.seek(0)
+    connection.connection.cursor().copy_expert('COPY {} ({}) FROM STDIN WITH (FORMAT csv)'.format(staging, columns), buffer)
+    connection.execute(text('INSERT INTO "{table}" ({columns}) SELECT {columns} FROM {staging} '
+                            'ON CONFLICT ({key}) DO UPDATE SET {updates}'
+                            .format(table=table, columns=columns, staging=staging,
+                                    key=', '.join(kind.natural_key), updates=updates)))
+
+
+def _copy_value(value):
+    # in COPY's CSV format an unquoted empty field is NULL and a quoted one is an empty string
+    if value is None:
+        return ''
+    if isinstance(value, list):
+        value = '{' + ','.join('"{}"'.format(item.replace('\\', '\\\\').replace('"', '\\"')) for item in value) + '}'
+    elif isinstance(value, datetime):
+        value = value.isoformat()
+    return '"{}"'.format(str(value).replace('"', '""'))
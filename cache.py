@@ -0,0 +1,333 @@
+import functools
+import hashlib
+import os
+import pickle
+import tempfile
+import threading
+import time
+import uuid
+from collections import Counter, OrderedDict
+from urllib.parse import urlencode
+
+from flask import Response, current_app, g, has_request_context, make_response, request, session
+
+from dates import display_settings
+
+#----------------------------------------------------------------------------#
+# Backends.
+#----------------------------------------------------------------------------#
+
+
+class MemoryBackend(object):
+    """In-process LRU cache whose entries also expire after a timeout.
+
+    Every worker process keeps its own entries, so invalidations made by one
+    gunicorn worker are not seen by the others; use FileSystemBackend for that.
+    """
+
+    def __init__(self, max_entries=2048):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires, value = entry
+            if expires is not None and expires < time.time():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, timeout=None):
+        expires = time.time() + timeout if timeout else None
+        with self._lock:
+            self._entries[key] = (expires, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class FileSystemBackend(object):
+    """Cache shared by every process that points at the same directory.
+
+    Entries are pickled into one file each and replaced atomically, so gunicorn
+    workers see each other's writes and invalidations. Pointing the directory at
+    a tmpfs such as /dev/shm keeps the entries in shared memory.
+    """
+
+    # how many writes happen between two checks of the number of entries
+    prune_interval = 128
+
+    def __init__(self, directory, max_entries=2048):
+        self.directory = directory
+        self.max_entries = max_entries
+        self._writes = 0
+        os.makedirs(directory, mode=0o700, exist_ok=True)
+
+    def _path(self, key):
+        return os.path.join(self.directory, hashlib.sha1(key.encode('utf-8')).hexdigest())
+
+    def get(self, key):
+        path = self._path(key)
+        try:
+            with open(path, 'rb') as cache_file:
+                expires, value = pickle.load(cache_file)
+        except (OSError, EOFError, pickle.UnpicklingError):
+            return None
+        if expires is not None and expires < time.time():
+            self.delete(key)
+            return None
+        return value
+
+    def set(self, key, value, timeout=None):
+        expires = time.time() + timeout if timeout else None
+        descriptor, temporary_path = tempfile.mkstemp(dir=self.directory, prefix='.tmp')
+        with os.fdopen(descriptor, 'wb') as cache_file:
+            pickle.dump((expires, value), cache_file, pickle.HIGHEST_PROTOCOL)
+        os.replace(temporary_path, self._path(key))
+
+        self._writes += 1
+        if self._writes % self.prune_interval == 0:
+            self._prune()
+
+    def delete(self, key):
+        try:
+            os.remove(self._path(key))
+        except OSError:
+            pass
+
+    def clear(self):
+        for name in os.listdir(self.directory):
+            try:
+                os.remove(os.path.join(self.directory, name))
+            except OSError:
+                pass
+
+    def _prune(self):
+        # drop the least recently written entries once there are too many
+        paths = [os.path.join(self.directory, name) for name in os.listdir(self.directory)
+                 if not name.startswith('.tmp')]
+        if len(paths) <= self.max_entries:
+            return
+        modified = []
+        for path in paths:
+            try:
+                modified.append((os.path.getmtime(path), path))
+            except OSError:
+                pass
+        modified.sort()
+        for _, path in modified[:len(modified) - self.max_entries]:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+#----------------------------------------------------------------------------#
+# Response cache.
+#----------------------------------------------------------------------------#
+
+
+class ResponseCache(object):
+    """Caches rendered pages of read-heavy views and drops them when the data behind them changes.
+
+    Pages are keyed by their path, query string and the locale and timezone dates
+    are shown in, and labelled with tags such as 'listings' or 'venue:1'. Every tag
+    has a version kept in the backend; an entry remembers the versions of its tags
+    when it was rendered, and invalidating a tag gives it a new version so all
+    entries rendered under the old one turn into misses.
+
+    A page or value read from a replica within READ_YOUR_WRITES_WINDOW seconds of the
+    invalidation of one of its tags is not stored: the replica may not have the write
+    behind the invalidation yet, and the stale page would be served under the new
+    version to every visitor, including the one who wrote.
+
+    Configured with CACHE_BACKEND ('memory', 'filesystem' or 'null'), CACHE_DIR,
+    CACHE_DEFAULT_TIMEOUT and CACHE_MAX_ENTRIES.
+    """
+
+    def __init__(self, app=None):
+        self.backend = None
+        self.default_timeout = None
+        self._stats = Counter()
+        self._stats_lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        backend = app.config.get('CACHE_BACKEND', 'memory')
+        max_entries = app.config.get('CACHE_MAX_ENTRIES', 2048)
+        if backend == 'memory':
+            self.backend = MemoryBackend(max_entries)
+        elif backend == 'filesystem':
+            directory = app.config.get('CACHE_DIR') or os.path.join(tempfile.gettempdir(), 'fyyur-cache')
+            self.backend = FileSystemBackend(directory, max_entries)
+        elif backend in (None, 'null'):
+            self.backend = None
+        else:
+            raise ValueError('Unknown CACHE_BACKEND: {}'.format(backend))
+        self.default_timeout = app.config.get('CACHE_DEFAULT_TIMEOUT', 60)
+        app.extensions['response_cache'] = self
+
+    def cached(self, *tags, timeout=None):
+        """Decorates a view so its GET responses are served from the cache.
+
+        Arguments:
+            tags {string} -- The tags of the page, formatted with the view arguments, e.g. 'venue:{venue_id}'.
+
+        Keyword Arguments:
+            timeout {integer} -- Seconds before the page expires regardless of its tags (default: {CACHE_DEFAULT_TIMEOUT})
+
+        Returns:
+            function -- The decorated view.
+        """
+        def decorator(view):
+            @functools.wraps(view)
+            def wrapper(*args, **kwargs):
+                # pages carrying flashed messages belong to a single visitor
+                if self.backend is None or request.method != 'GET' or session.get('_flashes'):
+                    return view(*args, **kwargs)
+
+                key = self._key()
+                versions = self._tag_versions([tag.format(**kwargs) for tag in tags])
+                entry = self.backend.get(key)
+                if entry is not None and entry['tags'] == versions:
+                    self._count('hits')
+                    response = Response(entry['body'], status=entry['status'], content_type=entry['content_type'])
+                    response.headers['X-Cache'] = 'HIT'
+                    return response
+
+                self._count('misses')
+                response = make_response(view(*args, **kwargs))
+                if response.status_code == 200 and not response.direct_passthrough and self._storable(versions):
+                    self.backend.set(key, {
+                        'tags': versions,
+                        'body': response.get_data(),
+                        'status': response.status_code,
+                        'content_type': response.content_type,
+                    }, timeout or self.default_timeout)
+                    self._count('stores')
+                response.headers['X-Cache'] = 'MISS'
+                return response
+            return wrapper
+        return decorator
+
+    def value(self, key, tags, compute, timeout=None):
+        """Returns a value computed for a page, such as an aggregate, cached under the same tags as pages.
+
+        Arguments:
+            key {string} -- Identifies the value, e.g. 'genres:Venue'.
+            tags {tuple} -- The tags whose invalidation drops the value, e.g. ('listings',).
+            compute {function} -- Computes the value when it is not cached; it must be picklable.
+
+        Keyword Arguments:
+            timeout {integer} -- Seconds before the value expires regardless of its tags (default: {CACHE_DEFAULT_TIMEOUT})
+
+        Returns:
+            object -- The cached or freshly computed value.
+        """
+        if self.backend is None:
+            return compute()
+        key = 'value:{}'.format(key)
+        versions = self._tag_versions(tags)
+        entry = self.backend.get(key)
+        if entry is not None and entry['tags'] == versions:
+            self._count('hits')
+            return entry['value']
+        self._count('misses')
+        value = compute()
+        if self._storable(versions):
+            self.backend.set(key, {'tags': versions, 'value': value}, timeout or self.default_timeout)
+            self._count('stores')
+        return value
+
+    def version(self, tag):
+        """The current version of a tag, for data kept in a process that has to be rebuilt
+        once the tag is invalidated; None without a backend.
+
+        Invalidations made by other processes are only seen with a shared backend.
+        """
+        if self.backend is None:
+            return None
+        return self._tag_versions([tag])[tag]
+
+    def invalidate(self, *tags):
+        """Drops every cached page labelled with any of the given tags.
+
+        Arguments:
+            tags {string} -- The tags to invalidate, e.g. 'listings', 'venue:1' or 'artist:2'.
+        """
+        if self.backend is None:
+            return
+        for tag in tags:
+            self.backend.set(self._tag_key(tag), self._new_version())
+            self._count('invalidations')
+
+    def clear(self):
+        if self.backend is not None:
+            self.backend.clear()
+
+    def stats(self):
+        """The hit, miss, store and invalidation counters of this process, for monitoring.
+
+        Returns:
+            dict -- The counters and the hit ratio.
+        """
+        with self._stats_lock:
+            stats = {name: self._stats[name] for name in ('hits', 'misses', 'stores', 'invalidations')}
+        lookups = stats['hits'] + stats['misses']
+        stats['hit_ratio'] = stats['hits'] / float(lookups) if lookups else 0.0
+        stats['backend'] = type(self.backend).__name__ if self.backend is not None else None
+        return stats
+
+    def _count(self, name):
+        with self._stats_lock:
+            self._stats[name] += 1
+
+    def _key(self):
+        query_string = urlencode(sorted(request.args.items(multi=True)))
+        # dates are rendered in the visitor's locale and timezone
+        return 'view:{}?{}|{}|{}'.format(request.path, query_string, *display_settings())
+
+    def _tag_key(self, tag):
+        return 'tag:{}'.format(tag)
+
+    def _tag_versions(self, tags):
+        versions = {}
+        for tag in tags:
+            version = self.backend.get(self._tag_key(tag))
+            if not isinstance(version, tuple):
+                # a tag never invalidated (or evicted, or versioned by an older
+                # release) starts a fresh version
+                version = self._new_version()
+                self.backend.set(self._tag_key(tag), version)
+            versions[tag] = version
+        return versions
+
+    def _new_version(self):
+        # the version and when it began, i.e. when the tag was last invalidated
+        return uuid.uuid4().hex, time.time()
+
+    def _storable(self, versions):
+        if not has_request_context() or not g.get('db_replica'):
+            return True
+        window = current_app.config['READ_YOUR_WRITES_WINDOW']
+        now = time.time()
+        return all(now - invalidated_at >= window for version, invalidated_at in versions.values())
+
+
+cache = ResponseCache()
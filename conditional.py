@@ -0,0 +1,154 @@
+import functools
+import hashlib
+from datetime import datetime, timezone
+
+from flask import Response, make_response, request, session
+from sqlalchemy import func
+
+from models import db, Venue, Artist, Show
+from counters import COUNTED_MODELS
+from dates import display_settings
+from upcoming import summary_version
+
+#----------------------------------------------------------------------------#
+# Conditional GET.
+#----------------------------------------------------------------------------#
+
+
+def conditional(validator):
+    """Decorates a view so conditional GETs are answered with 304 Not Modified before it runs.
+
+    The validator is called with the view arguments and returns an ETag and a
+    Last-Modified time computed from a cheap query, or None when the view should
+    run unconditionally (e.g. to answer 404). When the request's If-None-Match, or
+    failing that its If-Modified-Since, still matches, the page is neither queried
+    nor rendered.
+
+    Arguments:
+        validator {function} -- Computes the (etag, last_modified) pair of a page.
+
+    Returns:
+        function -- The decorator.
+    """
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(*args, **kwargs):
+            # pages carrying flashed messages must be rendered for the visitor
+            if request.method not in ('GET', 'HEAD') or session.get('_flashes'):
+                return view(*args, **kwargs)
+
+            validators = validator(**kwargs)
+            if validators is None:
+                return view(*args, **kwargs)
+            etag, last_modified = validators
+
+            if _not_modified(etag, last_modified):
+                response = Response(status=304)
+            else:
+                response = make_response(view(*args, **kwargs))
+                if response.status_code != 200:
+                    return response
+            response.set_etag(etag, weak=True)
+            if last_modified is not None:
+                response.last_modified = last_modified
+            # let browsers and the CDN keep the page, but revalidate it on every visit
+            response.cache_control.no_cache = True
+            response.vary.add('Accept-Language')
+            return response
+        return wrapper
+    return decorator
+
+
+def _not_modified(etag, last_modified):
+    if request.if_none_match:
+        return request.if_none_match.contains_weak(etag)
+    if request.if_modified_since and last_modified is not None:
+        return request.if_modified_since >= last_modified.replace(microsecond=0)
+    return False
+
+
+def _validators(*values):
+    # the same data renders differently in another locale or timezone
+    etag = hashlib.sha1(repr(values + display_settings()).encode('utf-8')).hexdigest()
+    timestamps = [value for value in values if isinstance(value, datetime)]
+    last_modified = max(timestamps).replace(tzinfo=timezone.utc) if timestamps else None
+    return etag, last_modified
+
+#----------------------------------------------------------------------------#
+# Validators.
+#----------------------------------------------------------------------------#
+
+
+def listing_validator(*models):
+    """Builds a validator from the latest updated_at and the row count of each model.
+
+    Both come from one query of index lookups; the counts catch deletes, which leave
+    no updated_at behind.
+
+    Arguments:
+        models {class} -- The models the listing is rendered from.
+
+    Returns:
+        function -- The validator of the listing.
+    """
+    def validator(**kwargs):
+        columns = []
+        for model in models:
+            columns.append(db.session.query(func.max(model.updated_at)).scalar_subquery())
+            columns.append(db.session.query(func.count(model.id)).scalar_subquery())
+        return _validators(*db.session.query(*columns).one())
+    return validator
+
+
+def shows_validator(**kwargs):
+    """Validator of the /shows listing.
+
+    Show deletes are covered without counting the shows: deleting a show bumps the
+    updated_at of its venue and artist, and deleting a venue changes the venue count.
+    Upcoming shows may be listed from the summary, whose refreshes change it too.
+    A show that starts leaves the ?upcoming=1 listing without a write, so that
+    listing also depends on the start of the latest show that has started, which
+    moves the ETag and Last-Modified as soon as the next one does.
+    """
+    columns = [
+        db.session.query(func.max(Show.updated_at)).scalar_subquery(),
+        db.session.query(func.max(Venue.updated_at)).scalar_subquery(),
+        db.session.query(func.count(Venue.id)).scalar_subquery(),
+        db.session.query(func.max(Artist.updated_at)).scalar_subquery(),
+        db.session.query(func.count(Artist.id)).scalar_subquery(),
+    ]
+    if request.args.get('upcoming') == '1':
+        columns.append(db.session.query(func.max(Show.start_time))
+                       .filter(Show.start_time <= datetime.utcnow()).scalar_subquery())
+    return _validators(summary_version(), *db.session.query(*columns).one())
+
+
+def entity_validator(model, id_argument):
+    """Builds a validator from the updated_at of one venue or artist.
+
+    Their updated_at is bumped whenever one of their shows changes. Shows that start
+    move the page from upcoming to past without a write, so the validator also
+    depends on the start of their latest show that has started, which moves the
+    ETag and Last-Modified as soon as the next one does. The upcoming shows may be
+    read from the summary, whose refreshes change it as well.
+
+    Arguments:
+        model {class} -- The model of the page, either Venue or Artist.
+        id_argument {string} -- The name of the view argument holding the ID.
+
+    Returns:
+        function -- The validator of the page.
+    """
+    show_foreign_key = getattr(Show, COUNTED_MODELS[model])
+
+    def validator(**kwargs):
+        last_started = db.session.query(func.max(Show.start_time)) \
+            .filter(show_foreign_key == model.id, Show.start_time <= datetime.utcnow()) \
+            .scalar_subquery()
+        row = db.session.query(model.updated_at, last_started.label('last_started')) \
+            .filter(model.id == kwargs[id_argument]) \
+            .first()
+        if row is None:
+            return None
+        return _validators(model.__name__, kwargs[id_argument], row.updated_at, row.last_started, summary_version())
+    return validator
@@ -10,5 +10,143 @@ DEBUG = True
 
 
 # TODO IMPLEMENT DATABASE URL
-SQLALCHEMY_DATABASE_URI = 'postgres://tolulopeodueke@localhost:5432/fyyur'
-SQLALCHEMY_TRACK_MODIFICATIONS = True
+SQLALCHEMY_DATABASE_URI = os.environ.get('DATABASE_URL', 'postgresql://tolulopeodueke@localhost:5432/fyyur')
+SQLALCHEMY_TRACK_MODIFICATIONS = False
+
+# Connection pool of every worker process: DB_POOL_SIZE connections are kept open
+# and up to DB_MAX_OVERFLOW more are opened under load; a checkout gives up after
+# DB_POOL_TIMEOUT seconds. Connections are replaced after DB_POOL_RECYCLE seconds
+# and tested before use, so ones dropped by the server or a proxy are not handed out.
+DB_POOL_SIZE = int(os.environ.get('DB_POOL_SIZE', 5))
+DB_MAX_OVERFLOW = int(os.environ.get('DB_MAX_OVERFLOW', 10))
+DB_POOL_TIMEOUT = int(os.environ.get('DB_POOL_TIMEOUT', 30))
+DB_POOL_RECYCLE = int(os.environ.get('DB_POOL_RECYCLE', 1800))
+DB_POOL_PRE_PING = os.environ.get('DB_POOL_PRE_PING', '1') == '1'
+
+# Milliseconds before PostgreSQL cancels a statement; 0 leaves it unlimited
+DB_STATEMENT_TIMEOUT = int(os.environ.get('DB_STATEMENT_TIMEOUT', 30000))
+
+# Serving over ASGI (uvicorn asgi:application): the views run in ASGI_THREADS
+# threads per worker process, and the read pages run their independent queries at
+# the same time on an async engine (asyncpg or aiosqlite). ASYNC_DATABASE_URI
+# defaults to SQLALCHEMY_DATABASE_URI through the async driver.
+ASGI_THREADS = int(os.environ.get('ASGI_THREADS', 32))
+ASYNC_DATABASE_URI = os.environ.get('ASYNC_DATABASE_URL')
+
+# Read replicas serving the read-only pages, as comma separated URIs. A replica more
+# than REPLICA_MAX_LAG seconds behind is skipped (its lag is checked at most every
+# REPLICA_LAG_CHECK_INTERVAL seconds), and visitors who wrote within the last
+# READ_YOUR_WRITES_WINDOW seconds read from the primary.
+DATABASE_REPLICA_URIS = [uri for uri in os.environ.get('DATABASE_REPLICA_URLS', '').split(',') if uri]
+REPLICA_MAX_LAG = float(os.environ.get('REPLICA_MAX_LAG', 5))
+REPLICA_LAG_CHECK_INTERVAL = 5
+READ_YOUR_WRITES_WINDOW = 10
+
+# Locale and timezone dates are shown in, unless the visitor picked others in the
+# fyyur_locale and fyyur_timezone cookies or their Accept-Language header asks for
+# one of SUPPORTED_LOCALES. Stored show times are in UTC.
+DEFAULT_LOCALE = os.environ.get('DEFAULT_LOCALE', 'en_US')
+DEFAULT_TIMEZONE = os.environ.get('DEFAULT_TIMEZONE', 'UTC')
+SUPPORTED_LOCALES = ['en_US', 'en_GB', 'fr_FR', 'de_DE', 'es_ES', 'pt_BR']
+
+# Upcoming shows summary (see upcoming.py), refreshed by the refresh-upcoming
+# command. Readers fall back to querying the shows when it was last refreshed more
+# than UPCOMING_SHOWS_MAX_STALENESS seconds ago (0 never uses it); they check when
+# that was at most every UPCOMING_SHOWS_CHECK_INTERVAL seconds. A refresh also
+# copies the changes of the UPCOMING_SHOWS_REFRESH_OVERLAP seconds before the last
+# one, and on PostgreSQL keeps a partition for each of the next
+# UPCOMING_SHOWS_PARTITION_DAYS days.
+UPCOMING_SHOWS_MAX_STALENESS = int(os.environ.get('UPCOMING_SHOWS_MAX_STALENESS', 300))
+UPCOMING_SHOWS_CHECK_INTERVAL = 5
+UPCOMING_SHOWS_REFRESH_OVERLAP = 60
+UPCOMING_SHOWS_PARTITION_DAYS = 31
+
+# Shows that started more than SHOW_ARCHIVE_AFTER_MONTHS whole months ago are moved
+# to ShowArchive by the maintain-shows command (see archive.py), which on PostgreSQL
+# also adds the monthly partitions of the next SHOW_PARTITION_MONTHS_AHEAD months.
+SHOW_ARCHIVE_AFTER_MONTHS = int(os.environ.get('SHOW_ARCHIVE_AFTER_MONTHS', 12))
+SHOW_PARTITION_MONTHS_AHEAD = 3
+
+# Number of hits shown on each page of the venue and artist search results
+SEARCH_RESULTS_PER_PAGE = 20
+
+# Search backend: 'trigram' for the pg_trgm index, 'memory' for the in-process
+# fallback index. Left unset, it is picked from the database dialect.
+SEARCH_BACKEND = os.environ.get('SEARCH_BACKEND')
+
+# Geocoder that fills in the coordinates of venues (see geo.py): the import path of
+# a Geocoder class, by default one looking up the city of a venue in the CSV table
+# of city centres at GEOCODER_TABLE.
+GEOCODER = os.environ.get('GEOCODER', 'geo.CityTableGeocoder')
+GEOCODER_TABLE = os.path.join(basedir, 'data', 'us_cities.csv')
+
+# Nearby venue search: 'earthdistance' for the PostgreSQL index, 'memory' for the
+# in-process grid of NEARBY_GRID_DEGREES wide cells. Left unset, it is picked from
+# the database dialect. Radiuses are in kilometres.
+NEARBY_BACKEND = os.environ.get('NEARBY_BACKEND')
+NEARBY_GRID_DEGREES = 0.1
+NEARBY_DEFAULT_RADIUS = 25
+NEARBY_MAX_RADIUS = 500
+NEARBY_RESULTS = 50
+
+# Bookings (see bookings.py): a show books its venue and artist for its duration,
+# SHOW_DEFAULT_DURATION minutes unless given one of at most SHOW_MAX_DURATION, and
+# overlapping bookings are refused. BOOKING_BACKEND looks for them with 'query', an
+# indexed query on the shows, or 'memory', an in-process interval index that every
+# process keeps its own copy of; left unset, it is picked from the database dialect.
+# The free slots of a venue are listed over at most FREE_SLOTS_MAX_DAYS days.
+SHOW_DEFAULT_DURATION = 120
+SHOW_MAX_DURATION = 24 * 60
+BOOKING_BACKEND = os.environ.get('BOOKING_BACKEND')
+FREE_SLOTS_MAX_DAYS = 92
+
+# Recommendations of seeking artists for venues and the other way round (see
+# matching.py, which needs NumPy): how much sharing genres, being in the same city
+# or state and the number of shows played over the last MATCHING_HISTORY_DAYS days
+# weigh in the score, how often those shows are counted again (seconds), how long
+# a process keeps the features it built when it sees no invalidation (seconds), and
+# how many are recommended unless asked for more.
+MATCHING_WEIGHTS = {'genres': 0.5, 'city': 0.2, 'state': 0.1, 'history': 0.2}
+MATCHING_HISTORY_DAYS = 365
+MATCHING_HISTORY_REFRESH = 3600
+MATCHING_STORE_MAX_AGE = 300
+MATCHING_RESULTS = 20
+
+# Number of upcoming or past shows listed on each page of a venue or artist
+SHOWS_PER_PAGE = 12
+
+# Templates are compiled once into TEMPLATE_BYTECODE_CACHE_DIR ('filesystem', left
+# unset a private directory in the temporary directory) and loaded from there by new
+# worker processes, or compiled by every process with 'null'; run flask compile-templates
+# on deploy to fill it. The show tiles of the shows, venue and artist pages are cached
+# once rendered in each process, up to FRAGMENT_CACHE_MAX_ENTRIES of them (0 disables it).
+TEMPLATE_BYTECODE_CACHE = os.environ.get('TEMPLATE_BYTECODE_CACHE', 'filesystem')
+TEMPLATE_BYTECODE_CACHE_DIR = os.environ.get('TEMPLATE_BYTECODE_CACHE_DIR')
+FRAGMENT_CACHE_MAX_ENTRIES = 10000
+
+# Response cache for the listing and detail pages: 'memory' (per worker process),
+# 'filesystem' (shared by the workers using CACHE_DIR, e.g. /dev/shm/fyyur-cache) or 'null'
+CACHE_BACKEND = os.environ.get('CACHE_BACKEND', 'memory')
+CACHE_DIR = os.environ.get('CACHE_DIR')
+CACHE_DEFAULT_TIMEOUT = 60
+CACHE_MAX_ENTRIES = 2048
+
+# Page size of the JSON API listings, and the most a client may ask for with ?limit=
+API_PAGE_SIZE = 50
+API_MAX_PAGE_SIZE = 500
+
+# Records written per transaction by the bulk import, and how many rejected
+# records the import endpoint reports back
+IMPORT_CHUNK_SIZE = 5000
+IMPORT_MAX_REPORTED_ERRORS = 100
+
+# Rows fetched from the server-side cursor and encoded at once by the streaming export
+EXPORT_BATCH_SIZE = 1000
+
+# Per-request query profiling (Server-Timing headers, JSON logs on the fyyur.queries
+# logger and /debug/queries). A statement shape run at least
+# QUERY_PROFILER_N_PLUS_ONE_THRESHOLD times in one request is flagged as an N+1.
+QUERY_PROFILER = os.environ.get('QUERY_PROFILER') == '1'
+QUERY_PROFILER_N_PLUS_ONE_THRESHOLD = 5
+QUERY_PROFILER_SLOWEST = 5
+QUERY_PROFILER_HISTORY = 100
@@ -0,0 +1,159 @@
+from datetime import datetime
+
+from sqlalchemy import case, event, func, inspect, or_, select
+
+from models import db, Venue, Artist, Show, ShowArchive
+
+#----------------------------------------------------------------------------#
+# Show counters.
+#----------------------------------------------------------------------------#
+
+# Venue and Artist carry upcoming_shows_count, past_shows_count and next_show_at
+# so listings can read a column instead of counting shows. The counters are
+# adjusted in the same transaction that inserts, updates or deletes a show,
+# and sweep_past_shows() rolls them over as upcoming shows start. Past shows
+# moved to ShowArchive (see archive.py) keep being counted.
+
+# the Show column that links a show to each model with counters
+COUNTED_MODELS = {
+    Venue: 'venue_id',
+    Artist: 'artist_id',
+}
+
+
+def recomputed_counters(model, current_time):
+    """Builds the correlated subqueries that compute the counters of a model from its shows.
+
+    Arguments:
+        model {class} -- The model whose counters are computed, either Venue or Artist.
+        current_time {datetime} -- The point in time that separates upcoming from past shows.
+
+    Returns:
+        dict -- The counter columns mapped to the scalar subqueries computing them.
+    """
+    table = model.__table__
+    show_foreign_key = Show.__table__.c[COUNTED_MODELS[model]]
+    shows = Show.__table__
+    archive = ShowArchive.__table__
+    return {
+        'upcoming_shows_count': select(func.count(shows.c.id))
+            .where(show_foreign_key == table.c.id, shows.c.start_time > current_time)
+            .scalar_subquery(),
+        'past_shows_count': select(func.count(shows.c.id))
+            .where(show_foreign_key == table.c.id, shows.c.start_time <= current_time)
+            .scalar_subquery()
+            + select(func.count(archive.c.id))
+            .where(archive.c[COUNTED_MODELS[model]] == table.c.id)
+            .scalar_subquery(),
+        'next_show_at': select(func.min(shows.c.start_time))
+            .where(show_foreign_key == table.c.id, shows.c.start_time > current_time)
+            .scalar_subquery(),
+    }
+
+
+def refresh_counters(connection, model, ids, current_time=None):
+    """Recomputes the counters of the given venues or artists from their shows.
+
+    Arguments:
+        connection {object} -- The connection or session to run the update on.
+        model {class} -- The model whose counters are refreshed, either Venue or Artist.
+        ids {list} -- The IDs of the rows to refresh.
+
+    Keyword Arguments:
+        current_time {datetime} -- The point in time that separates upcoming from past shows (default: {now})
+    """
+    ids = [id for id in set(ids) if id is not None]
+    if ids:
+        table = model.__table__
+        connection.execute(table.update()
+                           .where(table.c.id.in_(ids))
+                           .values(**recomputed_counters(model, current_time or datetime.utcnow())))
+
+
+def sweep_past_shows(current_time=None):
+    """Rolls the counters of every venue and artist whose next show has started over to past shows.
+
+    Meant to run periodically (see the sweep-shows command); only rows whose next_show_at
+    has passed are touched, which the index on next_show_at finds directly.
+
+    Keyword Arguments:
+        current_time {datetime} -- The point in time that separates upcoming from past shows (default: {now})
+
+    Returns:
+        dict -- The number of rows updated for each model.
+    """
+    current_time = current_time or datetime.utcnow()
+    swept = {}
+    for model in COUNTED_MODELS:
+        table = model.__table__
+        result = db.session.execute(table.update()
+                                    .where(table.c.next_show_at <= current_time)
+                                    .values(**recomputed_counters(model, current_time)))
+        swept[model.__name__] = result.rowcount
+    return swept
+
+
+def reconcile_counters(repair=True, current_time=None):
+    """Finds the venues and artists whose counters have drifted from their shows, and repairs them.
+
+    Keyword Arguments:
+        repair {boolean} -- Whether to rewrite the drifted counters or only report them (default: {True})
+        current_time {datetime} -- The point in time that separates upcoming from past shows (default: {now})
+
+    Returns:
+        dict -- The IDs of the drifted rows for each model.
+    """
+    current_time = current_time or datetime.utcnow()
+    drifted = {}
+    for model in COUNTED_MODELS:
+        table = model.__table__
+        counters = recomputed_counters(model, current_time)
+        drift = or_(table.c.upcoming_shows_count != counters['upcoming_shows_count'],
+                    table.c.past_shows_count != counters['past_shows_count'],
+                    table.c.next_show_at.is_distinct_from(counters['next_show_at']))
+        ids = [row.id for row in db.session.execute(select(table.c.id).where(drift).order_by(table.c.id))]
+        if repair:
+            refresh_counters(db.session, model, ids, current_time)
+        drifted[model.__name__] = ids
+    return drifted
+
+#----------------------------------------------------------------------------#
+# Show events.
+#----------------------------------------------------------------------------#
+
+
+def _show_inserted(mapper, connection, show):
+    current_time = datetime.utcnow()
+    for model, foreign_key in COUNTED_MODELS.items():
+        entity_id = getattr(show, foreign_key)
+        if entity_id is None or show.start_time is None:
+            continue
+        table = model.__table__
+        if show.start_time > current_time:
+            next_show_at = case((or_(table.c.next_show_at.is_(None), table.c.next_show_at > show.start_time),
+                                 show.start_time),
+                                else_=table.c.next_show_at)
+            values = {'upcoming_shows_count': table.c.upcoming_shows_count + 1, 'next_show_at': next_show_at}
+        else:
+            values = {'past_shows_count': table.c.past_shows_count + 1}
+        connection.execute(table.update().where(table.c.id == entity_id).values(**values))
+
+
+def _show_updated(mapper, connection, show):
+    # the show may have moved in time or to another venue or artist, so refresh both sides
+    state = inspect(show)
+    moved = state.attrs.start_time.history.has_changes()
+    for model, foreign_key in COUNTED_MODELS.items():
+        history = state.attrs[foreign_key].history
+        if moved or history.has_changes():
+            refresh_counters(connection, model, list(history.deleted) + [getattr(show, foreign_key)])
+
+
+def _show_deleted(mapper, connection, show):
+    for model, foreign_key in COUNTED_MODELS.items():
+        refresh_counters(connection, model, [getattr(show, foreign_key)])
+
+
+event.listen(Show, 'after_insert', _show_inserted)
+event.listen(Show, 'after_update', _show_updated)
+event.listen(Show, 'after_delete', _show_deleted)
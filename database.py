@@ -0,0 +1,232 @@
+import os
+import threading
+import time
+from collections import Counter
+
+from sqlalchemy import event, exc, make_url, text
+from sqlalchemy.pool import QueuePool, StaticPool
+
+#----------------------------------------------------------------------------#
+# Connection pool.
+#----------------------------------------------------------------------------#
+
+_pool_stats = Counter()
+_pool_stats_lock = threading.Lock()
+
+
+class MeteredQueuePool(QueuePool):
+    """QueuePool that records how long every checkout waited for a connection.
+
+    A checkout waits once every pooled connection and the whole overflow are in use,
+    so a rising wait time, or any timeouts, mean the pool is saturated.
+    """
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            return super(MeteredQueuePool, self)._do_get()
+        except exc.TimeoutError:
+            _count('timeouts')
+            raise
+        finally:
+            waited = time.perf_counter() - started
+            with _pool_stats_lock:
+                _pool_stats['checkouts'] += 1
+                _pool_stats['wait_total'] += waited
+                _pool_stats['wait_max'] = max(_pool_stats['wait_max'], waited)
+
+
+def _count(name):
+    with _pool_stats_lock:
+        _pool_stats[name] += 1
+
+
+def engine_options(config):
+    """Builds the create_engine() options of the primary database from SQLALCHEMY_ENGINE_OPTIONS
+    and the pool settings (see pool_options()).
+
+    Arguments:
+        config {dict} -- The application config.
+
+    Returns:
+        dict -- The engine options, to be used as SQLALCHEMY_ENGINE_OPTIONS.
+    """
+    options = dict(config.get('SQLALCHEMY_ENGINE_OPTIONS') or {})
+    return _with_pool_options(config, config['SQLALCHEMY_DATABASE_URI'], options)
+
+
+def bind_options(config):
+    """Gives every bind of SQLALCHEMY_BINDS (e.g. the replicas) its own pool settings (see pool_options()).
+
+    SQLALCHEMY_ENGINE_OPTIONS only configures the primary, so each bind is turned
+    into a {'url': ..., **options} entry built from its own URI; options a bind
+    already sets are kept.
+
+    Arguments:
+        config {dict} -- The application config.
+
+    Returns:
+        dict -- The binds, to be used as SQLALCHEMY_BINDS.
+    """
+    binds = {}
+    for key, value in (config.get('SQLALCHEMY_BINDS') or {}).items():
+        options = dict(value) if isinstance(value, dict) else {'url': value}
+        binds[key] = _with_pool_options(config, options['url'], options)
+    return binds
+
+
+def pool_options(config, uri, poolclass=None):
+    """The pool options of the engine of one database, from DB_POOL_SIZE, DB_MAX_OVERFLOW,
+    DB_POOL_TIMEOUT, DB_POOL_RECYCLE, DB_POOL_PRE_PING and DB_STATEMENT_TIMEOUT.
+
+    Only a QueuePool is sized: SQLite in memory keeps its StaticPool or
+    SingletonThreadPool, which take no size, overflow or timeout. The statement
+    timeout is a PostgreSQL setting.
+
+    Arguments:
+        config {dict} -- The application config.
+        uri {string} -- The URI of the database.
+
+    Keyword Arguments:
+        poolclass {class} -- The pool class the engine is configured with (default: {the dialect's})
+
+    Returns:
+        dict -- The engine options.
+    """
+    url = make_url(uri)
+    if poolclass is None:
+        poolclass = _default_pool_class(url)
+    options = {
+        'pool_recycle': config['DB_POOL_RECYCLE'],
+        'pool_pre_ping': config['DB_POOL_PRE_PING'],
+    }
+    if issubclass(poolclass, QueuePool):
+        options.update({
+            'poolclass': MeteredQueuePool if poolclass is QueuePool else poolclass,
+            'pool_size': config['DB_POOL_SIZE'],
+            'max_overflow': config['DB_MAX_OVERFLOW'],
+            'pool_timeout': config['DB_POOL_TIMEOUT'],
+        })
+    if config.get('DB_STATEMENT_TIMEOUT') and url.get_backend_name() == 'postgresql':
+        options['connect_args'] = {'options': '-c statement_timeout={:d}'.format(config['DB_STATEMENT_TIMEOUT'])}
+    return options
+
+
+def _default_pool_class(url):
+    # Flask-SQLAlchemy gives SQLite in memory a StaticPool, the other databases keep their dialect's pool
+    if url.get_backend_name() == 'sqlite' and url.database in (None, '', ':memory:'):
+        return StaticPool
+    return url.get_dialect().get_pool_class(url)
+
+
+def _with_pool_options(config, uri, options):
+    pooled = pool_options(config, uri, options.get('poolclass'))
+    connect_args = dict(pooled.pop('connect_args', {}))
+    connect_args.update(options.get('connect_args') or {})
+    pooled.update(options)
+    if connect_args:
+        pooled['connect_args'] = connect_args
+    return pooled
+
+
+def async_engine_options(config):
+    """Builds the create_async_engine() options of the async engine from the same settings as engine_options().
+
+    The async engine keeps SQLAlchemy's async-adapted pool, and asyncpg takes the
+    statement timeout as a server setting rather than a libpq option.
+
+    Arguments:
+        config {dict} -- The application config.
+
+    Returns:
+        dict -- The engine options.
+    """
+    if config['SQLALCHEMY_DATABASE_URI'].startswith('sqlite'):
+        return {}
+    options = {
+        'pool_size': config['DB_POOL_SIZE'],
+        'max_overflow': config['DB_MAX_OVERFLOW'],
+        'pool_timeout': config['DB_POOL_TIMEOUT'],
+        'pool_recycle': config['DB_POOL_RECYCLE'],
+        'pool_pre_ping': config['DB_POOL_PRE_PING'],
+    }
+    if config.get('DB_STATEMENT_TIMEOUT'):
+        options['connect_args'] = {'server_settings': {'statement_timeout': str(config['DB_STATEMENT_TIMEOUT'])}}
+    return options
+
+
+def dispose_after_fork(engine):
+    """Makes forked worker processes (e.g. gunicorn with --preload) open their own connections.
+
+    The child drops the pool it inherited without closing the parent's connections,
+    so no socket is shared between processes and none is left idle in the child.
+
+    Arguments:
+        engine {object} -- The engine created before the fork.
+    """
+    if hasattr(os, 'register_at_fork'):
+        os.register_at_fork(after_in_child=lambda: engine.dispose(close=False))
+
+
+def enforce_foreign_keys(engine):
+    """Makes SQLite enforce the foreign keys of the engine's connections, which it only does when asked.
+
+    The shows of a venue or an artist are deleted with it by ON DELETE CASCADE
+    (the relationships use passive_deletes), as they are on PostgreSQL.
+
+    Arguments:
+        engine {object} -- The engine; engines of other databases are left alone.
+    """
+    if engine.dialect.name == 'sqlite':
+        event.listen(engine, 'connect', _enable_foreign_keys)
+
+
+def _enable_foreign_keys(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    cursor.execute('PRAGMA foreign_keys=ON')
+    cursor.close()
+
+
+def pool_stats(engine):
+    """The checkout wait times of this process and the current occupancy of the pool, for monitoring.
+
+    Arguments:
+        engine {object} -- The engine whose pool is reported.
+
+    Returns:
+        dict -- The counters, the mean and longest checkout wait in seconds and the saturation of the pool.
+    """
+    with _pool_stats_lock:
+        stats = {name: _pool_stats[name] for name in ('checkouts', 'timeouts', 'wait_total', 'wait_max')}
+    stats['wait_mean'] = stats['wait_total'] / stats['checkouts'] if stats['checkouts'] else 0.0
+    pool = engine.pool
+    stats['pool'] = type(pool).__name__
+    if isinstance(pool, QueuePool):
+        capacity = pool.size() + max(pool._max_overflow, 0)
+        stats.update({
+            'size': pool.size(),
+            'checked_in': pool.checkedin(),
+            'checked_out': pool.checkedout(),
+            'overflow': pool.overflow(),
+            'saturation': pool.checkedout() / float(capacity) if capacity else 0.0,
+        })
+    return stats
+
+#----------------------------------------------------------------------------#
+# Partitions.
+#----------------------------------------------------------------------------#
+
+
+def partition_names(connection, parent):
+    """The names of the partitions currently attached to a partitioned PostgreSQL table.
+
+    Arguments:
+        connection {object} -- The connection to read the catalog on.
+        parent {string} -- The name of the partitioned table.
+
+    Returns:
+        set -- The names of its partitions.
+    """
+    return {row[0] for row in connection.execute(text(
+        'SELECT child.relname FROM pg_inherits JOIN pg_class child ON child.oid = pg_inherits.inhrelid '
+        'WHERE pg_inherits.inhparent = CAST(:parent AS regclass)'), {'parent': '"{}"'.format(parent)})}
@@ -0,0 +1,162 @@
+import functools
+from datetime import date, datetime, timezone
+
+import dateutil.parser
+from babel import Locale
+from babel.dates import get_timezone, parse_pattern
+from flask import current_app, g, has_app_context, has_request_context, request
+
+#----------------------------------------------------------------------------#
+# Date formatting.
+#----------------------------------------------------------------------------#
+
+# the named formats of the datetime template filter; 'long' and 'short' are the
+# ones of the locale and any other format is a Babel pattern
+NAMED_FORMATS = {
+    'full': "EEEE MMMM, d, y 'at' h:mma",
+    'medium': "EE MM, dd, y h:mma",
+}
+
+# cookies a visitor's choice of locale and timezone is kept in
+LOCALE_COOKIE = 'fyyur_locale'
+TIMEZONE_COOKIE = 'fyyur_timezone'
+
+
+@functools.lru_cache(maxsize=256)
+def compiled_pattern(format, locale):
+    """Parses a named or custom format in a locale once per process.
+
+    Arguments:
+        format {string} -- 'full', 'medium', 'long', 'short' or a Babel pattern.
+        locale {string} -- The locale identifier, e.g. 'en_US'.
+
+    Returns:
+        tuple -- The DateTimePattern and the Locale to apply it with.
+    """
+    locale = Locale.parse(locale)
+    pattern = NAMED_FORMATS.get(format)
+    if pattern is None and format in ('long', 'short'):
+        # the locale's own date and time patterns, joined the way Babel joins them
+        pattern = locale.datetime_formats[format] \
+            .replace('{1}', locale.date_formats[format].pattern) \
+            .replace('{0}', locale.time_formats[format].pattern)
+    return parse_pattern(pattern or format), locale
+
+
+@functools.lru_cache(maxsize=64)
+def _timezone(name):
+    return get_timezone(name)
+
+
+def display_settings():
+    """The locale and timezone dates are shown in to the current visitor.
+
+    A locale or timezone picked in the fyyur_locale or fyyur_timezone cookie wins,
+    then the best of SUPPORTED_LOCALES for the Accept-Language header, then
+    DEFAULT_LOCALE and DEFAULT_TIMEZONE. The result is kept for the rest of the request.
+
+    Returns:
+        tuple -- The locale identifier and the timezone name.
+    """
+    if not has_app_context():
+        return 'en_US', 'UTC'
+    config = current_app.config
+    default_locale, default_timezone = config.get('DEFAULT_LOCALE', 'en_US'), config.get('DEFAULT_TIMEZONE', 'UTC')
+    if not has_request_context():
+        return default_locale, default_timezone
+
+    settings = g.get('date_display')
+    if settings is None:
+        supported = config.get('SUPPORTED_LOCALES') or [default_locale]
+        locale = request.cookies.get(LOCALE_COOKIE)
+        if locale not in supported:
+            locale = request.accept_languages.best_match(supported) or default_locale
+        timezone_name = request.cookies.get(TIMEZONE_COOKIE) or default_timezone
+        try:
+            _timezone(timezone_name)
+        except LookupError:
+            timezone_name = default_timezone
+        settings = g.date_display = (locale, timezone_name)
+    return settings
+
+
+def to_datetime(value):
+    """Turns a datetime, a date or a timestamp string into a datetime, parsing only strings."""
+    if isinstance(value, datetime):
+        return value
+    if isinstance(value, date):
+        return datetime(value.year, value.month, value.day)
+    try:
+        return datetime.fromisoformat(value)
+    except ValueError:
+        return dateutil.parser.parse(value)
+
+
+def to_utc(value, tzinfo=None):
+    """Turns a time entered by the visitor into UTC without a timezone, the way show times are stored.
+
+    Arguments:
+        value {datetime} -- The time; one without a timezone is taken to be in tzinfo.
+
+    Keyword Arguments:
+        tzinfo {string} -- The timezone name or tzinfo of a time without one (default: {the visitor's})
+
+    Returns:
+        datetime -- The same moment in UTC, without a timezone.
+    """
+    if value.tzinfo is None:
+        if tzinfo is None:
+            tzinfo = display_settings()[1]
+        if isinstance(tzinfo, str):
+            tzinfo = _timezone(tzinfo)
+        # Babel hands out pytz timezones when pytz is installed
+        value = tzinfo.localize(value) if hasattr(tzinfo, 'localize') else value.replace(tzinfo=tzinfo)
+    return value.astimezone(timezone.utc).replace(tzinfo=None)
+
+
+def _formatter(format, locale, tzinfo):
+    if locale is None or tzinfo is None:
+        visitor_locale, visitor_timezone = display_settings()
+        locale = locale or visitor_locale
+        tzinfo = tzinfo or visitor_timezone
+    if isinstance(tzinfo, str):
+        tzinfo = _timezone(tzinfo)
+    pattern, locale = compiled_pattern(format, str(locale))
+    return pattern, locale, tzinfo
+
+
+def _localize(value, tzinfo):
+    # times are stored without a timezone, in UTC
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return value.astimezone(tzinfo)
+
+
+def format_datetime(value, format='medium', locale=None, tzinfo=None):
+    """Formats a show time, the datetime template filter.
+
+    Arguments:
+        value {datetime} -- The time; a date or a timestamp string is accepted too.
+
+    Keyword Arguments:
+        format {string} -- 'full', 'medium', 'long', 'short' or a Babel pattern (default: {'medium'})
+        locale {string} -- The locale to format in (default: {the visitor's})
+        tzinfo {string} -- The timezone name or tzinfo to show the time in (default: {the visitor's})
+
+    Returns:
+        string -- The formatted time.
+    """
+    pattern, locale, tzinfo = _formatter(format, locale, tzinfo)
+    return pattern.apply(_localize(to_datetime(value), tzinfo), locale)
+
+
+def format_datetimes(values, format='medium', locale=None, tzinfo=None):
+    """Formats a list of times at once, resolving the pattern, locale and timezone only once.
+
+    Takes the same keyword arguments as format_datetime().
+
+    Returns:
+        list -- The formatted times, in the order of the values.
+    """
+    pattern, locale, tzinfo = _formatter(format, locale, tzinfo)
+    return [pattern.apply(_localize(to_datetime(value), tzinfo), locale) for value in values]
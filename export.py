@@ -0,0 +1,176 @@
+import csv
+import io
+from datetime import datetime
+
+from models import db, Venue, Artist, Show
+from queries import filter_shows
+from serializers import ModelSerializer, dumps
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:  # pragma: no cover - pyarrow is optional
+    pyarrow = None
+
+#----------------------------------------------------------------------------#
+# Export.
+#----------------------------------------------------------------------------#
+
+# Shows are exported with the names of their venue and artist joined in.
+EXPORT_SERIALIZERS = {
+    'venues': ModelSerializer(Venue),
+    'artists': ModelSerializer(Artist),
+    'shows': ModelSerializer(Show, extra_columns={'venue_name': Venue.name, 'artist_name': Artist.name}),
+}
+
+EXPORT_MIMETYPES = {
+    'csv': 'text/csv',
+    'ndjson': 'application/x-ndjson',
+    'parquet': 'application/vnd.apache.parquet',
+}
+
+
+def export_formats():
+    """The formats that can be exported here; Parquet needs pyarrow to be installed."""
+    return [name for name in EXPORT_MIMETYPES if name != 'parquet' or pyarrow is not None]
+
+
+def export_query(kind_name, filters=None):
+    """Builds the query of an export, ordered so that the output is stable.
+
+    Arguments:
+        kind_name {string} -- What is exported: 'venues', 'artists' or 'shows'.
+
+    Keyword Arguments:
+        filters {dict} -- For shows, the keyword arguments of filter_shows(), e.g. from show_filters() (default: {None})
+
+    Returns:
+        tuple -- The exported field names and the query selecting them.
+    """
+    serializer = EXPORT_SERIALIZERS[kind_name]
+    fields = tuple(serializer.columns)
+    query = db.session.query(*serializer.select(fields))
+    if serializer.model is Show:
+        query = query.join(Venue, Show.venue_id == Venue.id) \
+            .join(Artist, Show.artist_id == Artist.id)
+        query = filter_shows(query, **(filters or {})).order_by(Show.start_time, Show.id)
+    else:
+        query = query.order_by(serializer.model.id)
+    return fields, query
+
+
+def export_rows(kind_name, data_format, filters=None, batch_size=1000):
+    """Streams an export as chunks of encoded output, one chunk per batch of rows.
+
+    The rows are fetched through a server-side cursor (yield_per), so only one batch
+    is held in memory at a time whatever the size of the table. Parquet output is
+    written as one row group per batch.
+
+    Arguments:
+        kind_name {string} -- What is exported: 'venues', 'artists' or 'shows'.
+        data_format {string} -- One of export_formats().
+
+    Keyword Arguments:
+        filters {dict} -- For shows, the keyword arguments of filter_shows() (default: {None})
+        batch_size {integer} -- How many rows are fetched and encoded at once (default: {1000})
+
+    Returns:
+        generator -- The encoded output, as bytes.
+    """
+    if data_format not in export_formats():
+        raise ValueError('Unknown export format: {}'.format(data_format))
+    fields, query = export_query(kind_name, filters)
+    batches = _batches(query.yield_per(batch_size), batch_size)
+    if data_format == 'csv':
+        return _csv_chunks(fields, batches)
+    if data_format == 'ndjson':
+        return _ndjson_chunks(fields, batches)
+    return _parquet_chunks(fields, _arrow_schema(EXPORT_SERIALIZERS[kind_name], fields), batches)
+
+
+def _batches(rows, batch_size):
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) == batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def _csv_value(value):
+    # genres are written the way the forms and the import take them
+    if isinstance(value, list):
+        return ', '.join(value)
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return value
+
+
+def _csv_chunks(fields, batches):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(fields)
+    for batch in batches:
+        writer.writerows([_csv_value(value) for value in row] for row in batch)
+        yield buffer.getvalue().encode('utf-8')
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        # no rows at all, only the header
+        yield buffer.getvalue().encode('utf-8')
+
+
+def _ndjson_chunks(fields, batches):
+    for batch in batches:
+        yield b''.join(dumps(dict(zip(fields, row))) + b'\n' for row in batch)
+
+
+class _ChunkSink(io.RawIOBase):
+    # a write-only file that hands out what has been written since it was last drained
+    def __init__(self):
+        self._chunks = []
+        self._position = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        self._position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._position
+
+    def drain(self):
+        data = b''.join(self._chunks)
+        self._chunks = []
+        return data
+
+
+def _arrow_schema(serializer, fields):
+    types = {int: pyarrow.int64(), float: pyarrow.float64(), bool: pyarrow.bool_(),
+             datetime: pyarrow.timestamp('us'), list: pyarrow.list_(pyarrow.string())}
+    schema = []
+    for name in fields:
+        try:
+            python_type = serializer.columns[name].type.python_type
+        except NotImplementedError:
+            python_type = str
+        schema.append((name, types.get(python_type, pyarrow.string())))
+    return pyarrow.schema(schema)
+
+
+def _parquet_chunks(fields, schema, batches):
+    sink = _ChunkSink()
+    writer = pyarrow.parquet.ParquetWriter(sink, schema)
+    for batch in batches:
+        columns = [list(column) for column in zip(*batch)]
+        writer.write_table(pyarrow.Table.from_arrays(
+            [pyarrow.array(values, type=schema.field(name).type) for name, values in zip(fields, columns)],
+            schema=schema))
+        yield sink.drain()
+    writer.close()
+    yield sink.drain()
@@ -1,7 +1,8 @@
-from datetime import datetime
+from datetime import datetime, timezone
+from flask import current_app
 from flask_wtf import Form
-from wtforms import StringField, SelectField, SelectMultipleField, DateTimeField
-from wtforms.validators import DataRequired, AnyOf, URL
+from wtforms import StringField, SelectField, SelectMultipleField, DateTimeField, IntegerField
+from wtforms.validators import DataRequired, AnyOf, URL, Optional, ValidationError
 
 
 class ShowForm(Form):
@@ -16,6 +17,41 @@ class ShowForm(Form):
         validators=[DataRequired()],
         default=datetime.today()
     )
+    # in minutes, SHOW_DEFAULT_DURATION when left out
+    duration = IntegerField(
+        'duration',
+        validators=[Optional()]
+    )
+
+    def validate_duration(self, field):
+        if field.data is not None and not 1 <= field.data <= current_app.config['SHOW_MAX_DURATION']:
+            raise ValidationError('Must be between 1 and {} minutes.'.format(current_app.config['SHOW_MAX_DURATION']))
+
+
+class ISODateTimeField(DateTimeField):
+    """Takes any ISO 8601 time, as exports write them, e.g. '2027-01-01 20:00' or
+    '2027-01-01T20:00:00.250000+02:00'. Times with an offset are turned into UTC,
+    the way they are stored."""
+
+    def process_formdata(self, valuelist):
+        if not valuelist:
+            return
+        try:
+            value = datetime.fromisoformat(' '.join(valuelist).strip())
+        except ValueError:
+            self.data = None
+            raise ValueError(self.gettext('Not a valid ISO 8601 datetime value.'))
+        if value.tzinfo is not None:
+            value = value.astimezone(timezone.utc).replace(tzinfo=None)
+        self.data = value
+
+
+class ShowImportForm(ShowForm):
+    """The rules of ShowForm for imported shows, whose times are ISO 8601."""
+    start_time = ISODateTimeField(
+        'start_time',
+        validators=[DataRequired()]
+    )
 
 
 class VenueForm(Form):
@@ -227,3 +263,22 @@ class ArtistForm(Form):
     )
 
 # TODO IMPLEMENT NEW ARTIST FORM AND NEW SHOW FORM
+
+
+class VenueImportForm(VenueForm):
+    """The rules of VenueForm for imported venues, which may leave out their links."""
+    facebook_link = StringField(
+        'facebook_link', validators=[Optional(), URL()]
+    )
+    website = StringField(
+        'website', validators=[Optional(), URL()]
+    )
+
+
+class ArtistImportForm(ArtistForm):
+    """The rules of ArtistForm for imported artists, which may leave out their link
+    and have no website to import."""
+    facebook_link = StringField(
+        'facebook_link', validators=[Optional(), URL()]
+    )
+    website = None
@@ -0,0 +1,70 @@
+from sqlalchemy import exists, func, select, true
+
+from cache import cache
+from models import db
+
+#----------------------------------------------------------------------------#
+# Genre facets.
+#----------------------------------------------------------------------------#
+
+# Venues and artists keep their genres in an array column. On PostgreSQL a genre
+# filter is an array containment test answered by the GIN index on the column (see
+# migration d94a7c1e5b38) and the facet counts unnest the arrays; SQLite stores the
+# arrays as JSON and reads them with json_each() instead.
+
+
+def _postgresql():
+    return db.engine.dialect.name == 'postgresql'
+
+
+def genre_filter(model, genre):
+    """The criterion keeping the venues or artists of a genre.
+
+    Arguments:
+        model {class} -- Either Venue or Artist.
+        genre {string} -- The genre, as stored (e.g. 'Jazz').
+
+    Returns:
+        object -- The SQL criterion.
+    """
+    if _postgresql():
+        return model.genres.contains([genre])
+    values = func.json_each(model.genres).table_valued('value')
+    return exists(select(values.c.value).where(values.c.value == genre))
+
+
+def genre_facets(model, criterion=None, key=None):
+    """Counts the venues or artists of every genre in one aggregate query, cached until they change.
+
+    The counts are cached under the 'listings' tag, which every write to a venue or
+    an artist invalidates (see cache.py).
+
+    Arguments:
+        model {class} -- Either Venue or Artist.
+
+    Keyword Arguments:
+        criterion {object} -- Only count the rows matching it, e.g. the hits of a search (default: {every row})
+        key {string} -- Identifies the criterion in the cache; required with a criterion (default: {None})
+
+    Returns:
+        list -- The (genre, count) pairs, most common genre first.
+    """
+    def compute():
+        if _postgresql():
+            genres = select(func.unnest(model.genres).label('genre'))
+            if criterion is not None:
+                genres = genres.where(criterion)
+            genres = genres.subquery()
+            query = select(genres.c.genre, func.count()).group_by(genres.c.genre)
+            genre = genres.c.genre
+        else:
+            values = func.json_each(model.genres).table_valued('value')
+            query = select(values.c.value, func.count()).select_from(model).join(values, true()) \
+                .group_by(values.c.value)
+            if criterion is not None:
+                query = query.where(criterion)
+            genre = values.c.value
+        rows = db.session.execute(query.order_by(func.count().desc(), genre)).all()
+        return [(row[0], row[1]) for row in rows]
+
+    return cache.value('genres:{}:{}'.format(model.__tablename__, key or ''), ('listings',), compute)
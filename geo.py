@@ -0,0 +1,400 @@
+import csv
+import heapq
+import math
+import threading
+from collections import defaultdict
+
+from flask import current_app, has_app_context
+from sqlalchemy import event, func, inspect, select
+from sqlalchemy.orm import Session
+from werkzeug.utils import import_string
+
+from cache import cache
+from models import db, Venue
+
+#----------------------------------------------------------------------------#
+# Geocoding.
+#----------------------------------------------------------------------------#
+
+# mean radius of the Earth, in kilometres
+EARTH_RADIUS = 6371.0088
+
+
+class Geocoder(object):
+    """Places an address on the map without calling out to an online service.
+
+    Subclasses are picked with the GEOCODER setting and built with the app config.
+    """
+
+    def __init__(self, config):
+        self.config = config
+
+    def geocode(self, address, city, state):
+        """The coordinates of an address.
+
+        Arguments:
+            address {string} -- The street address.
+            city {string} -- The city.
+            state {string} -- The two letter state code.
+
+        Returns:
+            tuple -- The latitude and longitude in degrees, or None when the address is unknown.
+        """
+        raise NotImplementedError
+
+
+class CityTableGeocoder(Geocoder):
+    """Places a venue at the centre of its city, looked up in the CSV table at GEOCODER_TABLE.
+
+    The table has city, state, latitude and longitude columns; cities are matched
+    regardless of the character casing.
+    """
+
+    def __init__(self, config):
+        super(CityTableGeocoder, self).__init__(config)
+        self.cities = {}
+        with open(config['GEOCODER_TABLE'], newline='', encoding='utf-8') as table:
+            for row in csv.DictReader(table):
+                self.cities[(row['city'].strip().lower(), row['state'].strip().upper())] = \
+                    (float(row['latitude']), float(row['longitude']))
+
+    def geocode(self, address, city, state):
+        return self.cities.get(((city or '').strip().lower(), (state or '').strip().upper()))
+
+
+def geocoder():
+    """The geocoder of the current app, built from the GEOCODER setting on first use."""
+    instance = current_app.extensions.get('geocoder')
+    if instance is None:
+        instance = current_app.extensions['geocoder'] = import_string(current_app.config['GEOCODER'])(current_app.config)
+    return instance
+
+
+def _geocode_venue(mapper, connection, venue):
+    # new venues, and venues that moved without being given new coordinates
+    if not has_app_context():
+        return
+    state = inspect(venue)
+    if state.has_identity:
+        moved = any(state.attrs[name].history.has_changes() for name in ('address', 'city', 'state'))
+        placed = state.attrs.latitude.history.has_changes() or state.attrs.longitude.history.has_changes()
+        if not moved or placed:
+            return
+    elif venue.latitude is not None:
+        return
+    venue.latitude, venue.longitude = geocoder().geocode(venue.address, venue.city, venue.state) or (None, None)
+
+
+def geocode_venues(everything=False, batch_size=1000):
+    """Fills in the coordinates of the venues that have none, e.g. after a bulk import.
+
+    Keyword Arguments:
+        everything {boolean} -- Geocode every venue again, e.g. after changing the geocoder (default: {False})
+        batch_size {integer} -- How many venues are read and updated per transaction (default: {1000})
+
+    Returns:
+        dict -- How many venues were geocoded and how many addresses were not found.
+    """
+    summary = {'geocoded': 0, 'unknown': 0}
+    table = Venue.__table__
+    located = geocoder()
+    last_id = 0
+    while True:
+        query = select(table.c.id, table.c.address, table.c.city, table.c.state) \
+            .where(table.c.id > last_id).order_by(table.c.id).limit(batch_size)
+        if not everything:
+            query = query.where(table.c.latitude.is_(None))
+        with db.engine.begin() as connection:
+            rows = connection.execute(query).all()
+            if not rows:
+                break
+            for row in rows:
+                location = located.geocode(row.address, row.city, row.state)
+                if location is None:
+                    summary['unknown'] += 1
+                    if not everything:
+                        continue
+                else:
+                    summary['geocoded'] += 1
+                latitude, longitude = location or (None, None)
+                connection.execute(table.update().where(table.c.id == row.id)
+                                   .values(latitude=latitude, longitude=longitude))
+        last_id = rows[-1].id
+    reset_grid_index()
+    return summary
+
+#----------------------------------------------------------------------------#
+# Nearby search.
+#----------------------------------------------------------------------------#
+
+
+def nearby_venues(latitude, longitude, radius, limit=50):
+    """Finds the venues within a radius of a point, nearest first, with their upcoming show counts.
+
+    On PostgreSQL the earthdistance index narrows the venues down to a bounding box
+    around the point in a single query. Other databases use the in-process grid index
+    and one query for the venues found.
+
+    Arguments:
+        latitude {float} -- The latitude of the point, in degrees.
+        longitude {float} -- The longitude of the point, in degrees.
+        radius {float} -- How far from the point venues are found, in kilometres.
+
+    Keyword Arguments:
+        limit {integer} -- The largest number of venues returned (default: {50})
+
+    Returns:
+        list -- The venues, each a dictionary with the distance to the point in kilometres.
+    """
+    if nearby_backend() == 'earthdistance':
+        point = func.ll_to_earth(latitude, longitude)
+        location = func.ll_to_earth(Venue.latitude, Venue.longitude)
+        # earthdistance works in metres
+        distance = func.earth_distance(point, location)
+        rows = _venues_query() \
+            .add_columns((distance / 1000.0).label('distance')) \
+            .filter(func.earth_box(point, radius * 1000.0).op('@>')(location), distance <= radius * 1000.0) \
+            .order_by(distance, Venue.id) \
+            .limit(limit) \
+            .all()
+        distances = {row.id: row.distance for row in rows}
+    else:
+        distances = {id: distance for distance, id in grid_index().nearby(latitude, longitude, radius, limit)}
+        rows = _venues_query().filter(Venue.id.in_(distances)).all() if distances else []
+        rows.sort(key=lambda row: (distances[row.id], row.id))
+
+    return [{
+        'id': row.id,
+        'name': row.name,
+        'city': row.city,
+        'state': row.state,
+        'upcoming_shows_count': row.upcoming_shows_count,
+        'distance': round(distances[row.id], 3),
+    } for row in rows]
+
+
+def nearby_arguments(args):
+    """Reads the point and radius of a nearby search from request arguments.
+
+    Arguments:
+        args {dict} -- The request arguments, with ?lat=, ?lon= and an optional ?radius= in kilometres.
+
+    Raises:
+        ValueError: When the point is missing or off the map, or the radius is not positive.
+
+    Returns:
+        tuple -- The latitude, longitude and radius, capped at NEARBY_MAX_RADIUS.
+    """
+    config = current_app.config
+    try:
+        latitude, longitude = float(args['lat']), float(args['lon'])
+        radius = float(args.get('radius') or config['NEARBY_DEFAULT_RADIUS'])
+    except (KeyError, TypeError) as error:
+        raise ValueError('lat and lon are required') from error
+    if not (-90 <= latitude <= 90 and -180 <= longitude <= 180):
+        raise ValueError('lat must be within -90 and 90 and lon within -180 and 180')
+    if not radius > 0:
+        raise ValueError('radius must be positive')
+    return latitude, longitude, min(radius, config['NEARBY_MAX_RADIUS'])
+
+
+def nearby_backend():
+    """Picks the nearby search backend from the NEARBY_BACKEND setting, or from the database dialect when it is unset.
+
+    Returns:
+        string -- Either 'earthdistance' for the PostgreSQL index or 'memory' for the in-process grid.
+    """
+    backend = current_app.config.get('NEARBY_BACKEND')
+    if backend:
+        return backend
+    return 'earthdistance' if db.engine.dialect.name == 'postgresql' else 'memory'
+
+
+def _venues_query():
+    # upcoming show counts are read from the maintained counters (see counters.py)
+    return db.session.query(Venue.id, Venue.name, Venue.city, Venue.state, Venue.upcoming_shows_count)
+
+#----------------------------------------------------------------------------#
+# In-process grid index.
+#----------------------------------------------------------------------------#
+
+
+def _unit_vector(latitude, longitude):
+    latitude, longitude = math.radians(latitude), math.radians(longitude)
+    return (math.cos(latitude) * math.cos(longitude), math.cos(latitude) * math.sin(longitude), math.sin(latitude))
+
+
+def _chord(angle):
+    # the squared length of the straight line between two points this many radians apart on the unit sphere
+    return (2 * math.sin(angle / 2)) ** 2
+
+
+class GridIndex(object):
+    """In-process spatial index of the venue coordinates, a grid of cells a fixed number of degrees wide.
+
+    Stands in for the earthdistance index on databases without it, such as SQLite.
+    A search only looks at the cells overlapping the bounding box of its circle, and
+    ranks the venues in them by the straight line through the Earth between the two
+    points, which orders them the same as the distance along its surface. Every
+    process keeps its own copy, updated from the writes committed through its sessions
+    and built again once the 'listings' cache tag is invalidated, by any process.
+    """
+
+    def __init__(self, cell_degrees=0.1):
+        self.cell_degrees = cell_degrees
+        self.columns = int(round(360 / cell_degrees))
+        self.cells = defaultdict(dict)
+        self.locations = {}
+        # the version of the 'listings' tag the index was built at
+        self.listings_version = None
+
+    def _cell(self, latitude, longitude):
+        return int(math.floor(latitude / self.cell_degrees)), int(math.floor(longitude / self.cell_degrees)) % self.columns
+
+    def add(self, id, latitude, longitude):
+        self.remove(id)
+        if latitude is None or longitude is None:
+            return
+        cell = self._cell(latitude, longitude)
+        self.cells[cell][id] = _unit_vector(latitude, longitude)
+        self.locations[id] = cell
+
+    def remove(self, id):
+        cell = self.locations.pop(id, None)
+        if cell is None:
+            return
+        del self.cells[cell][id]
+        if not self.cells[cell]:
+            del self.cells[cell]
+
+    def nearby(self, latitude, longitude, radius, limit=50):
+        """Finds the points within a radius of a point.
+
+        Cells are visited in rings around the cell of the point, and the search stops
+        at the first ring whose nearest possible point is further than the last of
+        the points found, once enough are found.
+
+        Arguments:
+            latitude {float} -- The latitude of the point, in degrees.
+            longitude {float} -- The longitude of the point, in degrees.
+            radius {float} -- The radius, in kilometres.
+
+        Keyword Arguments:
+            limit {integer} -- The largest number of points returned (default: {50})
+
+        Returns:
+            list -- (distance in kilometres, ID) pairs, nearest first.
+        """
+        angle = min(radius / EARTH_RADIUS, math.pi)
+        # distances are compared as squared chord lengths
+        threshold = _chord(angle)
+        latitude_span = math.degrees(angle)
+        south, north = max(latitude - latitude_span, -90.0), min(latitude + latitude_span, 90.0)
+        widest = math.cos(math.radians(max(abs(south), abs(north))))
+        if north >= 90.0 or south <= -90.0 or latitude_span >= widest * 180.0:
+            columns = range(self.columns)
+        else:
+            longitude_span = latitude_span / widest
+            first, last = self._cell(south, longitude - longitude_span)[1], self._cell(south, longitude + longitude_span)[1]
+            columns = {column % self.columns for column in range(first, last + 1 + (self.columns if last < first else 0))}
+        rows = range(self._cell(south, longitude)[0], self._cell(north, longitude)[0] + 1)
+        if len(rows) * len(columns) > len(self.cells):
+            cells = [cell for cell in self.cells if cell[0] in rows and cell[1] in columns]
+        else:
+            cells = [(row, column) for row in rows for column in columns if (row, column) in self.cells]
+
+        center_row, center_column = self._cell(latitude, longitude)
+
+        def ring(cell):
+            columns_apart = abs(cell[1] - center_column)
+            return max(abs(cell[0] - center_row), min(columns_apart, self.columns - columns_apart))
+
+        cells.sort(key=ring)
+        cell_angle = math.radians(self.cell_degrees)
+        x, y, z = _unit_vector(latitude, longitude)
+        # the furthest of the nearest points found so far is on top, as (-chord, -id)
+        nearest = []
+        for cell in cells:
+            apart = ring(cell) - 1
+            if apart > 0 and len(nearest) == limit:
+                # the points of this ring are at least this many cells apart in latitude or longitude
+                gap = apart * cell_angle
+                closest = min(gap, 2 * math.asin(min(widest * math.sin(gap / 2), 1.0)))
+                if _chord(closest) > -nearest[0][0]:
+                    break
+            for id, (px, py, pz) in self.cells[cell].items():
+                chord = (px - x) ** 2 + (py - y) ** 2 + (pz - z) ** 2
+                if chord <= threshold:
+                    if len(nearest) < limit:
+                        heapq.heappush(nearest, (-chord, -id))
+                    elif (-chord, -id) > nearest[0]:
+                        heapq.heapreplace(nearest, (-chord, -id))
+        found = sorted((-chord, -id) for chord, id in nearest)
+        return [(2 * EARTH_RADIUS * math.asin(min(math.sqrt(chord) / 2, 1.0)), id) for chord, id in found]
+
+
+_grid_index = {}
+_grid_lock = threading.Lock()
+
+
+def grid_index():
+    """Returns the in-process grid index of the venues, building it from the database on first use
+    or once the 'listings' cache tag has been invalidated since."""
+    with _grid_lock:
+        index = _grid_index.get('venues')
+        # read before building, so that a write made meanwhile is not missed
+        version = cache.version('listings')
+        if index is None or index.listings_version != version:
+            index = GridIndex(current_app.config.get('NEARBY_GRID_DEGREES', 0.1))
+            index.listings_version = version
+            for row in db.session.query(Venue.id, Venue.latitude, Venue.longitude).filter(Venue.latitude.isnot(None)):
+                index.add(*row)
+            _grid_index['venues'] = index
+        return index
+
+
+def reset_grid_index():
+    """Drops the in-process grid index so it is rebuilt on next use, after writes that skip the ORM."""
+    with _grid_lock:
+        _grid_index.pop('venues', None)
+
+
+def _record_change(operation):
+    def listener(mapper, connection, venue):
+        session = Session.object_session(venue)
+        if session is not None:
+            session.info.setdefault('grid_index_changes', []).append((operation, venue.id, venue.latitude, venue.longitude))
+    return listener
+
+
+def _apply_changes(session):
+    changes = session.info.pop('grid_index_changes', [])
+    with _grid_lock:
+        index = _grid_index.get('venues')
+        if index is None:
+            return
+        for operation, id, latitude, longitude in changes:
+            if operation == 'add':
+                index.add(id, latitude, longitude)
+            else:
+                index.remove(id)
+
+
+def _discard_changes(session, *args):
+    session.info.pop('grid_index_changes', None)
+
+
+def _drop_after_bulk_change(context):
+    if context.mapper is not None and context.mapper.class_ is Venue:
+        reset_grid_index()
+
+
+event.listen(Venue, 'before_insert', _geocode_venue)
+event.listen(Venue, 'before_update', _geocode_venue)
+event.listen(Venue, 'after_insert', _record_change('add'))
+event.listen(Venue, 'after_update', _record_change('add'))
+event.listen(Venue, 'after_delete', _record_change('remove'))
+event.listen(Session, 'after_commit', _apply_changes)
+event.listen(Session, 'after_soft_rollback', _discard_changes)
+event.listen(Session, 'after_bulk_delete', _drop_after_bulk_change)
+event.listen(Session, 'after_bulk_update', _drop_after_bulk_change)
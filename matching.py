@@ -0,0 +1,382 @@
+import threading
+import time
+from datetime import datetime, timedelta
+
+from flask import current_app
+from sqlalchemy import event, func, select
+from sqlalchemy.orm import Session
+
+from cache import cache
+from models import db, Venue, Artist, Show
+
+try:
+    import numpy
+except ImportError:  # pragma: no cover - numpy is optional
+    numpy = None
+
+#----------------------------------------------------------------------------#
+# Venue and artist matching.
+#----------------------------------------------------------------------------#
+
+# Venues seeking talent are recommended artists seeking venues, and the other way
+# round. A candidate scores on the genres it shares with the venue or artist (their
+# Jaccard index), on being in the same city or state, and on how many shows it
+# played over the last MATCHING_HISTORY_DAYS days, weighted with MATCHING_WEIGHTS.
+#
+# The features of every venue and artist are kept in NumPy arrays, so a ranking is a
+# handful of vectorised operations over all the candidates. Every process builds
+# its own from the database on first use and updates them with the writes committed
+# through its sessions. Writes of the other processes are only seen by rebuilding
+# them: once the 'listings' cache tag is invalidated (by any process, with a cache
+# backend shared between them) and at the latest MATCHING_STORE_MAX_AGE seconds
+# after they were built. The show counts slide with time, so they are counted again
+# at most every MATCHING_HISTORY_REFRESH seconds. Rankings are cached per venue or
+# artist until any venue, artist or show changes.
+
+# the side a venue or an artist is matched against, and the flag marking candidates
+_COUNTERPARTS = {Venue: Artist, Artist: Venue}
+_SEEKING = {Venue: 'seeking_talent', Artist: 'seeking_venue'}
+
+
+def matching_available():
+    """Whether matching can run here; it needs NumPy to be installed."""
+    return numpy is not None
+
+
+class FeatureTable(object):
+    """The features of the venues or the artists, one row each.
+
+    Rows of deleted venues or artists are blanked and left unused until the table
+    is rebuilt.
+    """
+
+    def __init__(self, genre_columns, capacity=1024):
+        self.size = 0
+        self.rows = {}
+        self.ids = numpy.zeros(capacity, dtype=numpy.int64)
+        self.genres = numpy.zeros((capacity, genre_columns), dtype=numpy.float32)
+        self.genre_counts = numpy.zeros(capacity, dtype=numpy.float32)
+        self.cities = numpy.full(capacity, -1, dtype=numpy.int32)
+        self.states = numpy.full(capacity, -1, dtype=numpy.int32)
+        self.seeking = numpy.zeros(capacity, dtype=bool)
+        self.recent_shows = numpy.zeros(capacity, dtype=numpy.float32)
+
+    def row(self, id):
+        """The row of a venue or an artist, added when it has none yet."""
+        row = self.rows.get(id)
+        if row is None:
+            if self.size == len(self.ids):
+                self._grow(2 * len(self.ids), self.genres.shape[1])
+            row = self.rows[id] = self.size
+            self.ids[row] = id
+            self.size += 1
+        return row
+
+    def widen(self, genre_columns):
+        """Makes room for new genres."""
+        if genre_columns > self.genres.shape[1]:
+            self._grow(len(self.ids), max(genre_columns, 2 * self.genres.shape[1]))
+
+    def remove(self, id):
+        row = self.rows.pop(id, None)
+        if row is not None:
+            self.ids[row] = 0
+            self.genres[row] = 0
+            self.genre_counts[row] = 0
+            self.cities[row] = self.states[row] = -1
+            self.seeking[row] = False
+            self.recent_shows[row] = 0
+
+    def _grow(self, capacity, genre_columns):
+        size = self.size
+        genres = numpy.zeros((capacity, genre_columns), dtype=numpy.float32)
+        genres[:size, :self.genres.shape[1]] = self.genres[:size]
+        self.genres = genres
+        for name, fill in (('ids', 0), ('genre_counts', 0), ('cities', -1), ('states', -1),
+                           ('seeking', False), ('recent_shows', 0)):
+            old = getattr(self, name)
+            if len(old) != capacity:
+                new = numpy.full(capacity, fill, dtype=old.dtype)
+                new[:size] = old[:size]
+                setattr(self, name, new)
+
+
+class FeatureStore(object):
+    """The feature tables of the venues and the artists, sharing their genre and place codes."""
+
+    def __init__(self):
+        self.genres = {}
+        self.places = {}
+        self.tables = {Venue: FeatureTable(32), Artist: FeatureTable(32)}
+        self.history_counted_at = None
+        # what the store was built from, to tell when it has to be built again
+        self.built_at = time.monotonic()
+        self.listings_version = None
+
+    def set(self, model, id, genres, city, state, seeking):
+        """Stores the features of a venue or an artist, replacing its previous ones."""
+        table = self.tables[model]
+        columns = [self._code(self.genres, genre) for genre in set(genres or ())]
+        if len(self.genres) > table.genres.shape[1]:
+            for each in self.tables.values():
+                each.widen(len(self.genres))
+        row = table.row(id)
+        table.genres[row] = 0
+        table.genres[row, columns] = 1
+        table.genre_counts[row] = len(columns)
+        state_key = (state or '').strip().upper()
+        table.cities[row] = self._code(self.places, ((city or '').strip().lower(), state_key)) if city else -1
+        table.states[row] = self._code(self.places, state_key) if state_key else -1
+        table.seeking[row] = bool(seeking)
+
+    def load(self, model, rows):
+        """Stores the features of many venues or artists not in the store yet, filling the arrays at once.
+
+        Arguments:
+            model {class} -- Venue or Artist.
+            rows {iterable} -- The (id, genres, city, state, seeking) of each.
+        """
+        table = self.tables[model]
+        ids, genre_rows, genre_columns, cities, states, seeking = [], [], [], [], [], []
+        for id, genres, city, state, seeks in rows:
+            for genre in set(genres or ()):
+                genre_rows.append(len(ids))
+                genre_columns.append(self._code(self.genres, genre))
+            state_key = (state or '').strip().upper()
+            cities.append(self._code(self.places, ((city or '').strip().lower(), state_key)) if city else -1)
+            states.append(self._code(self.places, state_key) if state_key else -1)
+            seeking.append(bool(seeks))
+            ids.append(id)
+        for each in self.tables.values():
+            each.widen(len(self.genres))
+        first = table.size
+        if first + len(ids) > len(table.ids):
+            table._grow(max(first + len(ids), 2 * len(table.ids)), table.genres.shape[1])
+        rows = numpy.array(genre_rows, dtype=numpy.int64) + first
+        table.ids[first:first + len(ids)] = ids
+        table.genres[rows, genre_columns] = 1
+        table.genre_counts[first:first + len(ids)] = numpy.bincount(rows - first, minlength=len(ids))
+        table.cities[first:first + len(ids)] = cities
+        table.states[first:first + len(ids)] = states
+        table.seeking[first:first + len(ids)] = seeking
+        table.rows.update(zip(ids, range(first, first + len(ids))))
+        table.size += len(ids)
+
+    def count_show(self, venue_id, artist_id, delta):
+        for model, id in ((Venue, venue_id), (Artist, artist_id)):
+            row = self.tables[model].rows.get(id)
+            if row is not None:
+                self.tables[model].recent_shows[row] += delta
+
+    def rank(self, model, id, weights, limit):
+        """Ranks the seeking venues or artists of the other side for a venue or an artist.
+
+        Arguments:
+            model {class} -- Venue or Artist, what the ranking is for.
+            id {integer} -- The ID of the venue or the artist.
+            weights {dict} -- The weights of the 'genres', 'city', 'state' and 'history' scores.
+            limit {integer} -- How many candidates to return.
+
+        Returns:
+            list -- The best candidates as (id, score, shared genres) tuples, best first,
+            or None when the venue or the artist is unknown.
+        """
+        source = self.tables[model]
+        row = source.rows.get(id)
+        if row is None:
+            return None
+        table = self.tables[_COUNTERPARTS[model]]
+        size = table.size
+        genres = source.genres[row]
+
+        shared = table.genres[:size] @ genres
+        union = table.genre_counts[:size] + source.genre_counts[row] - shared
+        scores = weights['genres'] * numpy.divide(shared, union, out=numpy.zeros_like(shared), where=union > 0)
+        if source.cities[row] >= 0:
+            scores += weights['city'] * (table.cities[:size] == source.cities[row])
+        if source.states[row] >= 0:
+            scores += weights['state'] * (table.states[:size] == source.states[row])
+        history = numpy.log1p(table.recent_shows[:size])
+        busiest = history.max() if size else 0
+        if busiest > 0:
+            scores += weights['history'] * history / busiest
+
+        candidates = numpy.flatnonzero(table.seeking[:size])
+        if len(candidates) > limit:
+            candidates = candidates[numpy.argpartition(-scores[candidates], limit - 1)[:limit]]
+        # best first, and by ID between equal scores
+        candidates = candidates[numpy.lexsort((table.ids[candidates], -scores[candidates]))]
+        names = list(self.genres)
+        return [(int(table.ids[candidate]), round(float(scores[candidate]), 4),
+                 sorted(names[column] for column in numpy.flatnonzero(table.genres[candidate] * genres)))
+                for candidate in candidates]
+
+    def _code(self, codes, value):
+        code = codes.get(value)
+        if code is None:
+            code = codes[value] = len(codes)
+        return code
+
+
+_store = {}
+_store_lock = threading.RLock()
+
+
+def feature_store():
+    """Returns the in-process feature store, building it from the database on first use
+    or once it is out of date, and counting the recent shows again when they were last
+    counted too long ago."""
+    with _store_lock:
+        store = _store.get('features')
+        # read before building, so that a write made meanwhile is not missed
+        version = cache.version('listings')
+        if store is not None and (store.listings_version != version or
+                                  time.monotonic() - store.built_at > current_app.config['MATCHING_STORE_MAX_AGE']):
+            store = None
+        if store is None:
+            store = FeatureStore()
+            store.listings_version = version
+            for model in (Venue, Artist):
+                query = select(model.id, model.genres, model.city, model.state, getattr(model, _SEEKING[model]))
+                store.load(model, db.session.execute(query.execution_options(yield_per=10000)))
+            _store['features'] = store
+        refresh = current_app.config['MATCHING_HISTORY_REFRESH']
+        if store.history_counted_at is None or time.monotonic() - store.history_counted_at > refresh:
+            _count_recent_shows(store)
+        return store
+
+
+def _count_recent_shows(store):
+    now = datetime.utcnow()
+    since = now - timedelta(days=current_app.config['MATCHING_HISTORY_DAYS'])
+    for model, column in ((Venue, Show.venue_id), (Artist, Show.artist_id)):
+        table = store.tables[model]
+        table.recent_shows[:] = 0
+        counts = db.session.execute(select(column, func.count()).where(Show.start_time >= since, Show.start_time < now)
+                                    .group_by(column))
+        for id, count in counts:
+            row = table.rows.get(id)
+            if row is not None:
+                table.recent_shows[row] = count
+    store.history_counted_at = time.monotonic()
+
+
+def reset_feature_store():
+    """Drops the in-process feature store so it is rebuilt on next use, after writes that skip the ORM."""
+    with _store_lock:
+        _store.pop('features', None)
+
+
+def recommend(model, id, limit=None):
+    """Recommends the seeking artists for a venue, or the seeking venues for an artist, cached until they change.
+
+    Arguments:
+        model {class} -- Venue or Artist, what the recommendations are for.
+        id {integer} -- The ID of the venue or the artist.
+
+    Keyword Arguments:
+        limit {integer} -- How many to recommend (default: {MATCHING_RESULTS})
+
+    Returns:
+        list -- The recommended venues or artists as dictionaries with their id, name, city,
+        state, image_link, score and the genres they share, best first, or None when the
+        venue or the artist does not exist.
+    """
+    config = current_app.config
+    limit = limit or config['MATCHING_RESULTS']
+    tag = '{}:{}'.format(model.__name__.lower(), id)
+
+    def compute():
+        with _store_lock:
+            store = feature_store()
+            if id not in store.tables[model].rows:
+                # added by another process since the store was built
+                row = db.session.execute(select(model.id, model.genres, model.city, model.state,
+                                                getattr(model, _SEEKING[model])).where(model.id == id)).first()
+                if row is None:
+                    return None
+                store.set(model, *row)
+            ranked = store.rank(model, id, config['MATCHING_WEIGHTS'], limit)
+        counterpart = _COUNTERPARTS[model]
+        details = {row.id: row for row in db.session.execute(
+            select(counterpart.id, counterpart.name, counterpart.city, counterpart.state, counterpart.image_link)
+            .where(counterpart.id.in_([candidate for candidate, score, genres in ranked])))}
+        return [{'id': candidate, 'name': details[candidate].name, 'city': details[candidate].city,
+                 'state': details[candidate].state, 'image_link': details[candidate].image_link,
+                 'score': score, 'shared_genres': genres}
+                for candidate, score, genres in ranked if candidate in details]
+
+    return cache.value('matches:{}:{}'.format(tag, limit), ('listings', tag), compute)
+
+
+def _record_entity(mapper, connection, target):
+    session = Session.object_session(target)
+    if session is not None:
+        session.info.setdefault('feature_store_changes', []).append(
+            ('set', type(target), target.id, list(target.genres or ()), target.city, target.state,
+             getattr(target, _SEEKING[type(target)])))
+
+
+def _record_entity_removal(mapper, connection, target):
+    session = Session.object_session(target)
+    if session is not None:
+        # its shows are deleted with it by the database
+        session.info.setdefault('feature_store_changes', []).extend([('remove', type(target), target.id), ('recount',)])
+
+
+def _record_show(delta):
+    def listener(mapper, connection, show):
+        session = Session.object_session(show)
+        if session is not None:
+            session.info.setdefault('feature_store_changes', []).append(
+                ('show', show.venue_id, show.artist_id, show.start_time, delta))
+    return listener
+
+
+def _record_show_update(mapper, connection, show):
+    session = Session.object_session(show)
+    if session is not None:
+        session.info.setdefault('feature_store_changes', []).append(('recount',))
+
+
+def _apply_changes(session):
+    changes = session.info.pop('feature_store_changes', [])
+    with _store_lock:
+        store = _store.get('features')
+        if store is None or not changes:
+            return
+        since = datetime.utcnow() - timedelta(days=current_app.config['MATCHING_HISTORY_DAYS'])
+        for change in changes:
+            if change[0] == 'set':
+                store.set(*change[1:])
+            elif change[0] == 'remove':
+                store.tables[change[1]].remove(change[2])
+            elif change[0] == 'show':
+                venue_id, artist_id, start_time, delta = change[1:]
+                if start_time is not None and since <= start_time < datetime.utcnow():
+                    store.count_show(venue_id, artist_id, delta)
+            else:
+                store.history_counted_at = None
+
+
+def _discard_changes(session, *args):
+    session.info.pop('feature_store_changes', None)
+
+
+def _drop_after_bulk_change(context):
+    if context.mapper is not None and context.mapper.class_ in (Venue, Artist, Show):
+        reset_feature_store()
+
+
+if numpy is not None:
+    for _model in (Venue, Artist):
+        event.listen(_model, 'after_insert', _record_entity)
+        event.listen(_model, 'after_update', _record_entity)
+        event.listen(_model, 'after_delete', _record_entity_removal)
+    event.listen(Show, 'after_insert', _record_show(1))
+    event.listen(Show, 'after_delete', _record_show(-1))
+    event.listen(Show, 'after_update', _record_show_update)
+    event.listen(Session, 'after_commit', _apply_changes)
+    event.listen(Session, 'after_soft_rollback', _discard_changes)
+    event.listen(Session, 'after_bulk_delete', _drop_after_bulk_change)
+    event.listen(Session, 'after_bulk_update', _drop_after_bulk_change)
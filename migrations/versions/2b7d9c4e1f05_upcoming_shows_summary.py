@@ -0,0 +1,55 @@
+"""upcoming shows summary, partitioned by day on PostgreSQL
+
+Revision ID: 2b7d9c4e1f05
+Revises: f1a6c8e03b47
+Create Date: 2026-10-18 18:12:40.551207
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '2b7d9c4e1f05'
+down_revision = 'f1a6c8e03b47'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    columns = [
+        sa.Column('day', sa.Date(), nullable=False),
+        sa.Column('id', sa.Integer(), autoincrement=False, nullable=False),
+        sa.Column('start_time', sa.DateTime(), nullable=False),
+        sa.Column('venue_id', sa.Integer(), nullable=False),
+        sa.Column('venue_name', sa.String(), nullable=True),
+        sa.Column('venue_image_link', sa.String(length=500), nullable=True),
+        sa.Column('artist_id', sa.Integer(), nullable=False),
+        sa.Column('artist_name', sa.String(), nullable=True),
+        sa.Column('artist_image_link', sa.String(length=500), nullable=True),
+        sa.PrimaryKeyConstraint('day', 'id'),
+    ]
+    if op.get_bind().dialect.name == 'postgresql':
+        # the refresh adds a partition for each of the coming days and drops past ones
+        op.create_table('UpcomingShow', *columns, postgresql_partition_by='RANGE (day)')
+        op.execute('CREATE TABLE "UpcomingShow_default" PARTITION OF "UpcomingShow" DEFAULT')
+    else:
+        op.create_table('UpcomingShow', *columns)
+    op.create_index('ix_upcoming_show_start_time_id', 'UpcomingShow', ['start_time', 'id'])
+    op.create_index('ix_upcoming_show_venue_id_start_time', 'UpcomingShow', ['venue_id', 'start_time'])
+    op.create_index('ix_upcoming_show_artist_id_start_time', 'UpcomingShow', ['artist_id', 'start_time'])
+
+    op.create_table('SummaryRefresh',
+        sa.Column('name', sa.String(length=64), nullable=False),
+        sa.Column('refreshed_at', sa.DateTime(), nullable=False),
+        sa.PrimaryKeyConstraint('name'),
+    )
+
+
+def downgrade():
+    op.drop_table('SummaryRefresh')
+    op.drop_index('ix_upcoming_show_artist_id_start_time', table_name='UpcomingShow')
+    op.drop_index('ix_upcoming_show_venue_id_start_time', table_name='UpcomingShow')
+    op.drop_index('ix_upcoming_show_start_time_id', table_name='UpcomingShow')
+    # drops the partitions with it
+    op.drop_table('UpcomingShow')
@@ -0,0 +1,40 @@
+"""trigram search indexes for venues and artists
+
+Revision ID: 3c9a5e1f7d20
+Revises: 517f65667149
+Create Date: 2026-10-18 09:12:41.318204
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = '3c9a5e1f7d20'
+down_revision = '517f65667149'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    # array_to_string() is only STABLE, so wrap the searchable fields in an
+    # IMMUTABLE function that an expression index can be built on
+    op.execute("""
+        CREATE OR REPLACE FUNCTION fyyur_search_text(name varchar, city varchar, state varchar, genres varchar[])
+        RETURNS text
+        LANGUAGE sql IMMUTABLE PARALLEL SAFE
+        AS $$
+          SELECT lower(coalesce(name, '') || ' ' || coalesce(city, '') || ' ' ||
+                       coalesce(state, '') || ' ' || coalesce(array_to_string(genres, ' '), ''))
+        $$
+    """)
+    op.execute('CREATE INDEX ix_venue_search_text_trgm ON "Venue" '
+               'USING gin (fyyur_search_text(name, city, state, genres) gin_trgm_ops)')
+    op.execute('CREATE INDEX ix_artist_search_text_trgm ON "Artist" '
+               'USING gin (fyyur_search_text(name, city, state, genres) gin_trgm_ops)')
+
+
+def downgrade():
+    op.execute('DROP INDEX IF EXISTS ix_artist_search_text_trgm')
+    op.execute('DROP INDEX IF EXISTS ix_venue_search_text_trgm')
+    op.execute('DROP FUNCTION IF EXISTS fyyur_search_text(varchar, varchar, varchar, varchar[])')
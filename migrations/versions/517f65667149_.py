@@ -1,4 +1,4 @@
-"""empty message
+"""initial schema
 
 Revision ID: 517f65667149
 Revises: 
@@ -17,52 +17,46 @@ depends_on = None
 
 
 def upgrade():
-    # ### commands auto generated by Alembic - please adjust! ###
-    op.drop_table('Artist')
-    op.drop_table('Venue')
-    op.drop_table('Show')
-    # ### end Alembic commands ###
-
-
-def downgrade():
-    # ### commands auto generated by Alembic - please adjust! ###
-    op.create_table('Show',
-    sa.Column('id', sa.INTEGER(), server_default=sa.text('nextval(\'"Show_id_seq"\'::regclass)'), autoincrement=True, nullable=False),
-    sa.Column('artist_id', sa.INTEGER(), autoincrement=False, nullable=True),
-    sa.Column('venue_id', sa.INTEGER(), autoincrement=False, nullable=True),
-    sa.Column('start_time', postgresql.TIMESTAMP(), autoincrement=False, nullable=True),
-    sa.ForeignKeyConstraint(['artist_id'], ['Artist.id'], name='Show_artist_id_fkey'),
-    sa.ForeignKeyConstraint(['venue_id'], ['Venue.id'], name='Show_venue_id_fkey'),
-    sa.PrimaryKeyConstraint('id', name='Show_pkey')
-    )
     op.create_table('Venue',
-    sa.Column('id', sa.INTEGER(), server_default=sa.text('nextval(\'"Venue_id_seq"\'::regclass)'), autoincrement=True, nullable=False),
-    sa.Column('name', sa.VARCHAR(), autoincrement=False, nullable=False),
-    sa.Column('city', sa.VARCHAR(length=120), autoincrement=False, nullable=True),
-    sa.Column('state', sa.VARCHAR(length=120), autoincrement=False, nullable=True),
-    sa.Column('address', sa.VARCHAR(length=120), autoincrement=False, nullable=True),
-    sa.Column('phone', sa.VARCHAR(length=120), autoincrement=False, nullable=True),
-    sa.Column('website', sa.VARCHAR(length=500), autoincrement=False, nullable=True),
-    sa.Column('image_link', sa.VARCHAR(length=500), autoincrement=False, nullable=True),
-    sa.Column('facebook_link', sa.VARCHAR(length=120), autoincrement=False, nullable=True),
-    sa.Column('seeking_talent', sa.BOOLEAN(), autoincrement=False, nullable=True),
-    sa.Column('seeking_description', sa.VARCHAR(), autoincrement=False, nullable=True),
-    sa.Column('genres', postgresql.ARRAY(sa.VARCHAR(length=120)), autoincrement=False, nullable=True),
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('name', sa.String(), nullable=False),
+    sa.Column('city', sa.String(length=120), nullable=True),
+    sa.Column('state', sa.String(length=120), nullable=True),
+    sa.Column('address', sa.String(length=120), nullable=True),
+    sa.Column('phone', sa.String(length=120), nullable=True),
+    sa.Column('website', sa.String(length=500), nullable=True),
+    sa.Column('image_link', sa.String(length=500), nullable=True),
+    sa.Column('facebook_link', sa.String(length=120), nullable=True),
+    sa.Column('seeking_talent', sa.Boolean(), nullable=True),
+    sa.Column('seeking_description', sa.String(), nullable=True),
+    sa.Column('genres', postgresql.ARRAY(sa.String(length=120)), nullable=True),
     sa.PrimaryKeyConstraint('id', name='Venue_pkey')
     )
     op.create_table('Artist',
-    sa.Column('id', sa.INTEGER(), server_default=sa.text('nextval(\'"Artist_id_seq"\'::regclass)'), autoincrement=True, nullable=False),
-    sa.Column('name', sa.VARCHAR(), autoincrement=False, nullable=True),
-    sa.Column('city', sa.VARCHAR(length=120), autoincrement=False, nullable=True),
-    sa.Column('state', sa.VARCHAR(length=120), autoincrement=False, nullable=True),
-    sa.Column('address', sa.VARCHAR(length=120), autoincrement=False, nullable=True),
-    sa.Column('phone', sa.VARCHAR(length=120), autoincrement=False, nullable=True),
-    sa.Column('website', sa.VARCHAR(length=500), autoincrement=False, nullable=True),
-    sa.Column('image_link', sa.VARCHAR(length=500), autoincrement=False, nullable=True),
-    sa.Column('facebook_link', sa.VARCHAR(length=120), autoincrement=False, nullable=True),
-    sa.Column('seeking_venue', sa.BOOLEAN(), autoincrement=False, nullable=True),
-    sa.Column('seeking_description', sa.VARCHAR(), autoincrement=False, nullable=True),
-    sa.Column('genres', postgresql.ARRAY(sa.VARCHAR(length=120)), autoincrement=False, nullable=True),
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('name', sa.String(), nullable=True),
+    sa.Column('city', sa.String(length=120), nullable=True),
+    sa.Column('state', sa.String(length=120), nullable=True),
+    sa.Column('phone', sa.String(length=120), nullable=True),
+    sa.Column('image_link', sa.String(length=500), nullable=True),
+    sa.Column('facebook_link', sa.String(length=120), nullable=True),
+    sa.Column('seeking_venue', sa.Boolean(), nullable=True),
+    sa.Column('seeking_description', sa.String(), nullable=True),
+    sa.Column('genres', postgresql.ARRAY(sa.String(length=120)), nullable=True),
     sa.PrimaryKeyConstraint('id', name='Artist_pkey')
     )
-    # ### end Alembic commands ###
+    op.create_table('Show',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('artist_id', sa.Integer(), nullable=True),
+    sa.Column('venue_id', sa.Integer(), nullable=True),
+    sa.Column('start_time', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['artist_id'], ['Artist.id'], name='Show_artist_id_fkey'),
+    sa.ForeignKeyConstraint(['venue_id'], ['Venue.id'], name='Show_venue_id_fkey'),
+    sa.PrimaryKeyConstraint('id', name='Show_pkey')
+    )
+
+
+def downgrade():
+    op.drop_table('Show')
+    op.drop_table('Artist')
+    op.drop_table('Venue')
@@ -0,0 +1,53 @@
+"""show durations, and exclusion constraints against double bookings on PostgreSQL
+
+Revision ID: 5a2e9c7d1b63
+Revises: 6e1b8f3a9d47
+Create Date: 2026-10-18 22:48:05.417390
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5a2e9c7d1b63'
+down_revision = '6e1b8f3a9d47'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    for table in ('Show', 'ShowArchive'):
+        op.add_column(table, sa.Column('duration', sa.Integer(), nullable=False, server_default='120'))
+    if op.get_bind().dialect.name != 'postgresql':
+        return
+
+    # the existing shows had no duration, so the default is cut short where it would
+    # run into the next show of the same venue or artist; shows of a venue or an
+    # artist starting at the same time have to be fixed before this can run
+    op.execute('UPDATE "Show" SET duration = greatest(1, least(duration, '
+               'floor(extract(epoch FROM following.next_start - following.start_time) / 60)::integer)) '
+               'FROM (SELECT id, start_time, least('
+               'lead(start_time) OVER (PARTITION BY venue_id ORDER BY start_time, id), '
+               'lead(start_time) OVER (PARTITION BY artist_id ORDER BY start_time, id)) AS next_start '
+               'FROM "Show") AS following '
+               'WHERE "Show".id = following.id AND "Show".start_time = following.start_time '
+               'AND following.next_start < "Show".start_time + "Show".duration * interval \'1 minute\'')
+
+    # a partitioned table cannot have exclusion constraints over ranges, so every
+    # partition gets its own; archive.py adds them to the partitions it creates
+    op.execute('CREATE EXTENSION IF NOT EXISTS btree_gist')
+    partitions = op.get_bind().execute(sa.text(
+        'SELECT child.relname FROM pg_inherits JOIN pg_class child ON child.oid = pg_inherits.inhrelid '
+        'WHERE pg_inherits.inhparent = CAST(\'"Show"\' AS regclass)')).scalars().all()
+    for partition in partitions:
+        for column in ('venue_id', 'artist_id'):
+            op.execute('ALTER TABLE "{0}" ADD CONSTRAINT "{0}_{1}_booking" EXCLUDE USING gist '
+                       '({1} WITH =, tsrange(start_time, start_time + duration * interval \'1 minute\') WITH &&)'
+                       .format(partition, column))
+
+
+def downgrade():
+    # the exclusion constraints go with the column
+    op.drop_column('ShowArchive', 'duration')
+    op.drop_column('Show', 'duration')
@@ -0,0 +1,35 @@
+"""venue coordinates and their spatial index on PostgreSQL
+
+Revision ID: 6e1b8f3a9d47
+Revises: d94a7c1e5b38
+Create Date: 2026-10-18 21:26:52.903114
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '6e1b8f3a9d47'
+down_revision = 'd94a7c1e5b38'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('Venue', sa.Column('latitude', sa.Float(), nullable=True))
+    op.add_column('Venue', sa.Column('longitude', sa.Float(), nullable=True))
+    # the geocode-venues command fills the coordinates of the existing venues
+    if op.get_bind().dialect.name != 'postgresql':
+        return
+    op.execute('CREATE EXTENSION IF NOT EXISTS cube')
+    op.execute('CREATE EXTENSION IF NOT EXISTS earthdistance')
+    # the nearby search tests earth_box(...) @> ll_to_earth(latitude, longitude)
+    op.execute('CREATE INDEX ix_venue_location ON "Venue" USING gist (ll_to_earth(latitude, longitude))')
+
+
+def downgrade():
+    if op.get_bind().dialect.name == 'postgresql':
+        op.execute('DROP INDEX IF EXISTS ix_venue_location')
+    op.drop_column('Venue', 'longitude')
+    op.drop_column('Venue', 'latitude')
@@ -0,0 +1,114 @@
+"""show archive, and shows partitioned by month on PostgreSQL
+
+Revision ID: 8d3f0a6b2c71
+Revises: 2b7d9c4e1f05
+Create Date: 2026-10-18 19:40:13.082615
+
+"""
+from datetime import date, datetime
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8d3f0a6b2c71'
+down_revision = '2b7d9c4e1f05'
+branch_labels = None
+depends_on = None
+
+# partitions are added for the months of the existing shows and this many months ahead
+MONTHS_AHEAD = 3
+
+
+def show_columns():
+    return [
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('artist_id', sa.Integer(), nullable=True),
+        sa.Column('venue_id', sa.Integer(), nullable=True),
+        sa.Column('start_time', sa.DateTime(), nullable=False),
+        sa.Column('updated_at', sa.DateTime(), nullable=False),
+        sa.ForeignKeyConstraint(['artist_id'], ['Artist.id'], ondelete='CASCADE'),
+        sa.ForeignKeyConstraint(['venue_id'], ['Venue.id'], ondelete='CASCADE'),
+    ]
+
+
+def add_months(month, months):
+    index = month.year * 12 + month.month - 1 + months
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def upgrade():
+    if op.get_bind().dialect.name != 'postgresql':
+        op.create_table('ShowArchive', *show_columns(), sa.PrimaryKeyConstraint('id'))
+        op.create_index('ix_show_archive_venue_id_start_time', 'ShowArchive', ['venue_id', 'start_time'])
+        op.create_index('ix_show_archive_artist_id_start_time', 'ShowArchive', ['artist_id', 'start_time'])
+        return
+
+    # a table cannot be partitioned in place, so the shows are copied into a new
+    # one; the partition key has to be part of the primary key, and shows without
+    # a start time have to be fixed before this can run
+    op.rename_table('Show', 'Show_unpartitioned')
+    for index in ('Show_pkey', 'ix_show_venue_id_start_time', 'ix_show_artist_id_start_time',
+                  'ix_show_start_time_id', 'uq_show_venue_id_artist_id_start_time', 'ix_Show_updated_at'):
+        op.execute('ALTER INDEX "{0}" RENAME TO "{0}_unpartitioned"'.format(index))
+
+    for table in ('Show', 'ShowArchive'):
+        op.create_table(table, *show_columns(), sa.PrimaryKeyConstraint('id', 'start_time'),
+                        postgresql_partition_by='RANGE (start_time)')
+        op.execute('CREATE TABLE "{0}_default" PARTITION OF "{0}" DEFAULT'.format(table))
+    op.execute('ALTER TABLE "Show" ALTER COLUMN id SET DEFAULT nextval(\'"Show_id_seq"\')')
+    op.execute('ALTER TABLE "Show" ALTER COLUMN updated_at SET DEFAULT timezone(\'utc\', now())')
+
+    first, last = op.get_bind().execute(sa.text('SELECT min(start_time), max(start_time) FROM "Show_unpartitioned"')).one()
+    this_month = datetime.utcnow().date().replace(day=1)
+    month = min(first or datetime.utcnow(), datetime.utcnow()).date().replace(day=1)
+    end = max(add_months(this_month, MONTHS_AHEAD), last.date().replace(day=1) if last else this_month)
+    while month <= end:
+        op.execute('CREATE TABLE "Show_{:%Y%m}" PARTITION OF "Show" FOR VALUES FROM (\'{}\') TO (\'{}\')'.format(
+            month, month.isoformat(), add_months(month, 1).isoformat()))
+        month = add_months(month, 1)
+
+    op.execute('INSERT INTO "Show" (id, artist_id, venue_id, start_time, updated_at) '
+               'SELECT id, artist_id, venue_id, start_time, updated_at FROM "Show_unpartitioned"')
+    op.execute('ALTER SEQUENCE "Show_id_seq" OWNED BY "Show".id')
+    op.drop_table('Show_unpartitioned')
+
+    op.create_index('ix_show_venue_id_start_time', 'Show', ['venue_id', 'start_time'])
+    op.create_index('ix_show_artist_id_start_time', 'Show', ['artist_id', 'start_time'])
+    op.create_index('ix_show_start_time_id', 'Show', ['start_time', 'id'])
+    op.create_index('uq_show_venue_id_artist_id_start_time', 'Show', ['venue_id', 'artist_id', 'start_time'], unique=True)
+    op.create_index('ix_Show_updated_at', 'Show', ['updated_at'])
+    op.create_index('ix_show_archive_venue_id_start_time', 'ShowArchive', ['venue_id', 'start_time'])
+    op.create_index('ix_show_archive_artist_id_start_time', 'ShowArchive', ['artist_id', 'start_time'])
+
+
+def downgrade():
+    if op.get_bind().dialect.name != 'postgresql':
+        op.execute('INSERT INTO "Show" (id, artist_id, venue_id, start_time, updated_at) '
+                   'SELECT id, artist_id, venue_id, start_time, updated_at FROM "ShowArchive"')
+        op.drop_table('ShowArchive')
+        return
+
+    # the archived shows go back with the others into a single table
+    op.rename_table('Show', 'Show_partitioned')
+    for index in ('Show_pkey', 'ix_show_venue_id_start_time', 'ix_show_artist_id_start_time',
+                  'ix_show_start_time_id', 'uq_show_venue_id_artist_id_start_time', 'ix_Show_updated_at'):
+        op.execute('ALTER INDEX "{0}" RENAME TO "{0}_partitioned"'.format(index))
+    op.create_table('Show', *show_columns(), sa.PrimaryKeyConstraint('id'))
+    op.alter_column('Show', 'start_time', nullable=True)
+    op.execute('ALTER TABLE "Show" ALTER COLUMN id SET DEFAULT nextval(\'"Show_id_seq"\')')
+    op.execute('ALTER TABLE "Show" ALTER COLUMN updated_at SET DEFAULT timezone(\'utc\', now())')
+    op.execute('INSERT INTO "Show" (id, artist_id, venue_id, start_time, updated_at) '
+               'SELECT id, artist_id, venue_id, start_time, updated_at FROM "Show_partitioned" '
+               'UNION ALL SELECT id, artist_id, venue_id, start_time, updated_at FROM "ShowArchive"')
+    op.execute('ALTER SEQUENCE "Show_id_seq" OWNED BY "Show".id')
+    # drops the partitions with them
+    op.drop_table('Show_partitioned')
+    op.drop_table('ShowArchive')
+
+    op.create_index('ix_show_venue_id_start_time', 'Show', ['venue_id', 'start_time'])
+    op.create_index('ix_show_artist_id_start_time', 'Show', ['artist_id', 'start_time'])
+    op.create_index('ix_show_start_time_id', 'Show', ['start_time', 'id'])
+    op.create_index('uq_show_venue_id_artist_id_start_time', 'Show', ['venue_id', 'artist_id', 'start_time'], unique=True)
+    op.create_index('ix_Show_updated_at', 'Show', ['updated_at'])
@@ -0,0 +1,38 @@
+"""indexes for show access patterns and cascading show foreign keys
+
+Revision ID: a41d2c7e9b58
+Revises: 3c9a5e1f7d20
+Create Date: 2026-10-18 11:04:52.730118
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = 'a41d2c7e9b58'
+down_revision = '3c9a5e1f7d20'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # deleting a venue or an artist deletes their shows instead of failing on them
+    op.drop_constraint('Show_venue_id_fkey', 'Show', type_='foreignkey')
+    op.create_foreign_key('Show_venue_id_fkey', 'Show', 'Venue', ['venue_id'], ['id'], ondelete='CASCADE')
+    op.drop_constraint('Show_artist_id_fkey', 'Show', type_='foreignkey')
+    op.create_foreign_key('Show_artist_id_fkey', 'Show', 'Artist', ['artist_id'], ['id'], ondelete='CASCADE')
+
+    op.create_index('ix_show_venue_id_start_time', 'Show', ['venue_id', 'start_time'])
+    op.create_index('ix_show_artist_id_start_time', 'Show', ['artist_id', 'start_time'])
+    op.create_index('ix_show_start_time_id', 'Show', ['start_time', 'id'])
+
+
+def downgrade():
+    op.drop_index('ix_show_start_time_id', table_name='Show')
+    op.drop_index('ix_show_artist_id_start_time', table_name='Show')
+    op.drop_index('ix_show_venue_id_start_time', table_name='Show')
+
+    op.drop_constraint('Show_artist_id_fkey', 'Show', type_='foreignkey')
+    op.create_foreign_key('Show_artist_id_fkey', 'Show', 'Artist', ['artist_id'], ['id'])
+    op.drop_constraint('Show_venue_id_fkey', 'Show', type_='foreignkey')
+    op.create_foreign_key('Show_venue_id_fkey', 'Show', 'Venue', ['venue_id'], ['id'])
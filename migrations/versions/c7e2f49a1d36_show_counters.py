@@ -0,0 +1,39 @@
+"""denormalised show counters on venues and artists
+
+Revision ID: c7e2f49a1d36
+Revises: a41d2c7e9b58
+Create Date: 2026-10-18 13:26:09.481577
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c7e2f49a1d36'
+down_revision = 'a41d2c7e9b58'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    for table, foreign_key in (('Venue', 'venue_id'), ('Artist', 'artist_id')):
+        op.add_column(table, sa.Column('upcoming_shows_count', sa.Integer(), nullable=False, server_default='0'))
+        op.add_column(table, sa.Column('past_shows_count', sa.Integer(), nullable=False, server_default='0'))
+        op.add_column(table, sa.Column('next_show_at', sa.DateTime(), nullable=True))
+        op.create_index('ix_{}_next_show_at'.format(table), table, ['next_show_at'])
+        # backfill from the existing shows
+        op.execute("""
+            UPDATE "{table}" SET
+              upcoming_shows_count = (SELECT count(*) FROM "Show" WHERE "Show".{key} = "{table}".id AND start_time > timezone('utc', now())),
+              past_shows_count = (SELECT count(*) FROM "Show" WHERE "Show".{key} = "{table}".id AND start_time < timezone('utc', now())),
+              next_show_at = (SELECT min(start_time) FROM "Show" WHERE "Show".{key} = "{table}".id AND start_time > timezone('utc', now()))
+        """.format(table=table, key=foreign_key))
+
+
+def downgrade():
+    for table in ('Artist', 'Venue'):
+        op.drop_index('ix_{}_next_show_at'.format(table), table_name=table)
+        op.drop_column(table, 'next_show_at')
+        op.drop_column(table, 'past_shows_count')
+        op.drop_column(table, 'upcoming_shows_count')
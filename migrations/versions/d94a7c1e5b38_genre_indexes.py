@@ -0,0 +1,31 @@
+"""GIN indexes on the genres of venues and artists
+
+Revision ID: d94a7c1e5b38
+Revises: 8d3f0a6b2c71
+Create Date: 2026-10-18 20:31:07.416592
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = 'd94a7c1e5b38'
+down_revision = '8d3f0a6b2c71'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # the genre filters test array containment (genres @> ARRAY[...]), which a GIN
+    # index answers; other databases filter the JSON genres without an index
+    if op.get_bind().dialect.name != 'postgresql':
+        return
+    op.create_index('ix_venue_genres', 'Venue', ['genres'], postgresql_using='gin')
+    op.create_index('ix_artist_genres', 'Artist', ['genres'], postgresql_using='gin')
+
+
+def downgrade():
+    if op.get_bind().dialect.name != 'postgresql':
+        return
+    op.drop_index('ix_artist_genres', table_name='Artist')
+    op.drop_index('ix_venue_genres', table_name='Venue')
@@ -0,0 +1,29 @@
+"""updated_at timestamps for conditional requests
+
+Revision ID: e58b0d3f6a92
+Revises: c7e2f49a1d36
+Create Date: 2026-10-18 15:02:37.904416
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e58b0d3f6a92'
+down_revision = 'c7e2f49a1d36'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    for table in ('Venue', 'Artist', 'Show'):
+        op.add_column(table, sa.Column('updated_at', sa.DateTime(), nullable=False,
+                                       server_default=sa.text("timezone('utc', now())")))
+        op.create_index('ix_{}_updated_at'.format(table), table, ['updated_at'])
+
+
+def downgrade():
+    for table in ('Show', 'Artist', 'Venue'):
+        op.drop_index('ix_{}_updated_at'.format(table), table_name=table)
+        op.drop_column(table, 'updated_at')
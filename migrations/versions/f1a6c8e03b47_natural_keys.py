@@ -0,0 +1,54 @@
+"""unique natural keys for bulk import upserts
+
+Revision ID: f1a6c8e03b47
+Revises: e58b0d3f6a92
+Create Date: 2026-10-18 16:40:15.226893
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f1a6c8e03b47'
+down_revision = 'e58b0d3f6a92'
+branch_labels = None
+depends_on = None
+
+
+NATURAL_KEYS = (
+    ('Venue', ('name', 'city', 'state')),
+    ('Artist', ('name', 'city', 'state')),
+    ('Show', ('venue_id', 'artist_id', 'start_time')),
+)
+
+
+def upgrade():
+    # which of two duplicates to keep is not ours to decide, so stop before
+    # building anything and list them, rather than fail halfway on an index
+    duplicates = []
+    for table, key in NATURAL_KEYS:
+        columns = ', '.join(key)
+        rows = op.get_bind().execute(sa.text(
+            # a unique index lets rows with a NULL in the key repeat
+            'SELECT {columns}, count(*) AS copies, min(id) AS first_id FROM "{table}" WHERE {not_null} '
+            'GROUP BY {columns} HAVING count(*) > 1 ORDER BY min(id)'.format(
+                table=table, columns=columns, not_null=' AND '.join('{} IS NOT NULL'.format(column) for column in key)))).all()
+        for row in rows[:20]:
+            duplicates.append('  {} ({}) = ({}): {} rows, the first with id {}'.format(
+                table, columns, ', '.join(repr(value) for value in row[:len(key)]), row.copies, row.first_id))
+        if len(rows) > 20:
+            duplicates.append('  ... and {} more in {}'.format(len(rows) - 20, table))
+    if duplicates:
+        raise RuntimeError('These rows share a natural key, which has to be unique for bulk import upserts. '
+                           'Merge or delete the duplicates, then run the upgrade again:\n' + '\n'.join(duplicates))
+
+    op.create_index('uq_venue_name_city_state', 'Venue', ['name', 'city', 'state'], unique=True)
+    op.create_index('uq_artist_name_city_state', 'Artist', ['name', 'city', 'state'], unique=True)
+    op.create_index('uq_show_venue_id_artist_id_start_time', 'Show', ['venue_id', 'artist_id', 'start_time'], unique=True)
+
+
+def downgrade():
+    op.drop_index('uq_show_venue_id_artist_id_start_time', table_name='Show')
+    op.drop_index('uq_artist_name_city_state', table_name='Artist')
+    op.drop_index('uq_venue_name_city_state', table_name='Venue')
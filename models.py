@@ -1,11 +1,24 @@
-from flask import Flask
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import PrimaryKeyConstraint
+from sqlalchemy.ext.compiler import compiles
 import datetime
 
+from routing import RoutingSession
 
-app = Flask(__name__)
-app.config.from_object('config')
-db = SQLAlchemy(app)
+
+# bound to the application by create_app() in app.py
+db = SQLAlchemy(session_options={'class_': RoutingSession})
+
+
+@compiles(PrimaryKeyConstraint, 'sqlite')
+def _sqlite_primary_key(constraint, compiler, **kw):
+    # SQLite only numbers the rows of a table keyed by a single INTEGER column, so
+    # the shows, keyed by (id, start_time) for the partitions of PostgreSQL, are
+    # keyed by the column named in their sqlite_rowid info there
+    rowid = constraint.table.info.get('sqlite_rowid')
+    if rowid is not None:
+        return 'PRIMARY KEY ({})'.format(compiler.preparer.format_column(constraint.table.c[rowid]))
+    return compiler.visit_primary_key_constraint(constraint, **kw)
 
 #----------------------------------------------------------------------------#
 # Models.
@@ -22,6 +35,12 @@ class Venue(db.Model):
         object -- A venue object with the corresponding database colums.
     """
     __tablename__ = 'Venue'
+    __table_args__ = (
+        # natural key matched by the bulk import upsert
+        db.Index('uq_venue_name_city_state', 'name', 'city', 'state', unique=True),
+        # the genre filters (see genres.py); other databases filter the JSON genres without an index
+        db.Index('ix_venue_genres', 'genres', postgresql_using='gin').ddl_if(dialect='postgresql'),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String, nullable=False)
@@ -32,10 +51,20 @@ class Venue(db.Model):
     website = db.Column(db.String(500))
     image_link = db.Column(db.String(500))
     facebook_link = db.Column(db.String(120))
+    # where the venue is, filled in by the geocoder (see geo.py) for the nearby search
+    latitude = db.Column(db.Float)
+    longitude = db.Column(db.Float)
     seeking_talent = db.Column(db.Boolean, default=False)
     seeking_description = db.Column(db.String)
-    genres = db.Column(db.ARRAY(db.String(120)))
-    shows = db.relationship('Show', backref='venue', lazy=True)
+    genres = db.Column(db.ARRAY(db.String(120)).with_variant(db.JSON, 'sqlite'))
+    # maintained by counters.py as shows are created, deleted and start
+    upcoming_shows_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    past_shows_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    next_show_at = db.Column(db.DateTime, index=True)
+    # bumped on every change, including show changes (see counters.py), for conditional GETs
+    updated_at = db.Column(db.DateTime, nullable=False, default=datetime.datetime.utcnow,
+                           onupdate=datetime.datetime.utcnow, index=True)
+    shows = db.relationship('Show', backref='venue', lazy=True, passive_deletes=True)
 
     def __repr__(self):
         return f'<Venue {self.id} {self.name} {self.city} {self.state} {self.address} {self.shows}>'
@@ -55,6 +84,12 @@ class Artist(db.Model):
         object -- An artist object with the corresponding database columns.
     """
     __tablename__ = 'Artist'
+    __table_args__ = (
+        # natural key matched by the bulk import upsert
+        db.Index('uq_artist_name_city_state', 'name', 'city', 'state', unique=True),
+        # the genre filters (see genres.py); other databases filter the JSON genres without an index
+        db.Index('ix_artist_genres', 'genres', postgresql_using='gin').ddl_if(dialect='postgresql'),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String)
@@ -65,8 +100,15 @@ class Artist(db.Model):
     facebook_link = db.Column(db.String(120))
     seeking_venue = db.Column(db.Boolean, default=False)
     seeking_description = db.Column(db.String)
-    genres = db.Column(db.ARRAY(db.String(120)))
-    shows = db.relationship('Show', backref='artist', lazy=True)
+    genres = db.Column(db.ARRAY(db.String(120)).with_variant(db.JSON, 'sqlite'))
+    # maintained by counters.py as shows are created, deleted and start
+    upcoming_shows_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    past_shows_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    next_show_at = db.Column(db.DateTime, index=True)
+    # bumped on every change, including show changes (see counters.py), for conditional GETs
+    updated_at = db.Column(db.DateTime, nullable=False, default=datetime.datetime.utcnow,
+                           onupdate=datetime.datetime.utcnow, index=True)
+    shows = db.relationship('Show', backref='artist', lazy=True, passive_deletes=True)
 
     def __repr__(self):
         return f'<Artist {self.id} {self.name} {self.city} {self.state} {self.address} {self.shows}>'
@@ -86,15 +128,87 @@ class Show(db.Model):
         object -- A show object with the corresponding database columns.
     """
     __tablename__ = 'Show'
-
-    id = db.Column(db.Integer, primary_key=True)
-    artist_id = db.Column(db.Integer, db.ForeignKey('Artist.id'))
-    venue_id = db.Column(db.Integer, db.ForeignKey('Venue.id'))
-    start_time = db.Column(db.DateTime)
+    __table_args__ = (
+        # upcoming/past shows of a venue or an artist
+        db.Index('ix_show_venue_id_start_time', 'venue_id', 'start_time'),
+        db.Index('ix_show_artist_id_start_time', 'artist_id', 'start_time'),
+        # the /shows listing and its keyset pagination
+        db.Index('ix_show_start_time_id', 'start_time', 'id'),
+        # natural key matched by the bulk import upsert
+        db.Index('uq_show_venue_id_artist_id_start_time', 'venue_id', 'artist_id', 'start_time', unique=True),
+        {'info': {'sqlite_rowid': 'id'}},
+    )
+
+    # on PostgreSQL the table is partitioned by month, so the start time is part of
+    # the primary key and the ID comes from the Show_id_seq default
+    id = db.Column(db.Integer, primary_key=True, server_default=db.FetchedValue())
+    artist_id = db.Column(db.Integer, db.ForeignKey('Artist.id', ondelete='CASCADE'))
+    venue_id = db.Column(db.Integer, db.ForeignKey('Venue.id', ondelete='CASCADE'))
+    start_time = db.Column(db.DateTime, primary_key=True, nullable=False)
+    # minutes the show books its venue and artist for (see bookings.py)
+    duration = db.Column(db.Integer, nullable=False, server_default='120')
+    updated_at = db.Column(db.DateTime, nullable=False, default=datetime.datetime.utcnow,
+                           onupdate=datetime.datetime.utcnow, index=True)
 
     def __repr__(self):
         return f'<Show {self.id} {self.artist_id} {self.venue_id} {self.start_time}>'
 
 
-if __name__ == '__main__':
-    app.run()
+class ShowArchive(db.Model):
+    """A show that started more than SHOW_ARCHIVE_AFTER_MONTHS months ago.
+
+    Moved out of Show by archive_shows() (see archive.py), so the shows most pages
+    read stay small. On PostgreSQL both tables are partitioned by month and a month
+    is archived by moving its whole partition over.
+    """
+    __tablename__ = 'ShowArchive'
+    __table_args__ = (
+        # past shows of a venue or an artist
+        db.Index('ix_show_archive_venue_id_start_time', 'venue_id', 'start_time'),
+        db.Index('ix_show_archive_artist_id_start_time', 'artist_id', 'start_time'),
+        {'info': {'sqlite_rowid': 'id'}},
+    )
+
+    # the ID the show had in Show; partitioned like Show
+    id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    artist_id = db.Column(db.Integer, db.ForeignKey('Artist.id', ondelete='CASCADE'))
+    venue_id = db.Column(db.Integer, db.ForeignKey('Venue.id', ondelete='CASCADE'))
+    start_time = db.Column(db.DateTime, primary_key=True, nullable=False)
+    duration = db.Column(db.Integer, nullable=False, server_default='120')
+    updated_at = db.Column(db.DateTime, nullable=False, default=datetime.datetime.utcnow)
+
+
+class UpcomingShow(db.Model):
+    """Summary row of a show that has not started yet, with the names of its venue and artist.
+
+    Kept up to date by refresh_upcoming_shows() (see upcoming.py) rather than by the
+    app, so it lags the shows by up to the refresh interval. On PostgreSQL the table
+    is partitioned by day, which is why the day is part of the primary key.
+    """
+    __tablename__ = 'UpcomingShow'
+    __table_args__ = (
+        # the upcoming /shows listing and its keyset pagination
+        db.Index('ix_upcoming_show_start_time_id', 'start_time', 'id'),
+        # upcoming shows of a venue or an artist
+        db.Index('ix_upcoming_show_venue_id_start_time', 'venue_id', 'start_time'),
+        db.Index('ix_upcoming_show_artist_id_start_time', 'artist_id', 'start_time'),
+    )
+
+    day = db.Column(db.Date, primary_key=True)
+    # the ID of the show
+    id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    start_time = db.Column(db.DateTime, nullable=False)
+    venue_id = db.Column(db.Integer, nullable=False)
+    venue_name = db.Column(db.String)
+    venue_image_link = db.Column(db.String(500))
+    artist_id = db.Column(db.Integer, nullable=False)
+    artist_name = db.Column(db.String)
+    artist_image_link = db.Column(db.String(500))
+
+
+class SummaryRefresh(db.Model):
+    """When a summary table was last refreshed, to bound how stale its readers may find it."""
+    __tablename__ = 'SummaryRefresh'
+
+    name = db.Column(db.String(64), primary_key=True)
+    refreshed_at = db.Column(db.DateTime, nullable=False)
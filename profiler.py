@@ -0,0 +1,246 @@
+import heapq
+import json
+import logging
+import re
+import threading
+import time
+from collections import Counter, deque
+from contextlib import contextmanager
+
+from flask import before_render_template, g, has_request_context, request, template_rendered
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+#----------------------------------------------------------------------------#
+# Query profiler.
+#----------------------------------------------------------------------------#
+
+logger = logging.getLogger('fyyur.queries')
+
+_captures = threading.local()
+_listening = False
+_listening_lock = threading.Lock()
+
+
+def statement_shape(statement):
+    """Reduces a SQL statement to its shape, so statements differing only in their values compare equal.
+
+    Literals become ? and lists of values or placeholders, such as the ones of IN, collapse into one.
+    """
+    shape = re.sub(r"'(?:[^']|'')*'", '?', statement)
+    shape = re.sub(r'(?<![\w"])-?\d+(?:\.\d+)?\b', '?', shape)
+    shape = re.sub(r'%\(\w+\)s|:\w+|\$\d+|__\[POSTCOMPILE_\w+\]', '?', shape)
+    shape = re.sub(r'\(\s*\?(?:\s*,\s*\?)*\s*\)', '(?)', shape)
+    return ' '.join(shape.split())
+
+
+class QueryProfile(object):
+    """The statements run, and the templates rendered, while serving one request (or inside query_budget())."""
+
+    def __init__(self, slowest=5):
+        self.count = 0
+        self.duration = 0.0
+        self.templates = 0
+        self.render_duration = 0.0
+        self.shapes = Counter()
+        self._slowest = []
+        self._keep = slowest
+
+    def record(self, statement, duration):
+        shape = statement_shape(statement)
+        self.count += 1
+        self.duration += duration
+        self.shapes[shape] += 1
+        entry = (duration, self.count, shape)
+        if len(self._slowest) < self._keep:
+            heapq.heappush(self._slowest, entry)
+        elif entry > self._slowest[0]:
+            heapq.heapreplace(self._slowest, entry)
+
+    def record_render(self, duration):
+        self.templates += 1
+        self.render_duration += duration
+
+    def slowest(self):
+        """The slowest statements, slowest first, as (seconds, shape) pairs."""
+        return [(duration, shape) for duration, _, shape in sorted(self._slowest, reverse=True)]
+
+    def repeated(self, threshold):
+        """The statement shapes run at least threshold times, the telltale of an N+1 query."""
+        return [(shape, count) for shape, count in self.shapes.most_common() if count >= threshold]
+
+    def as_dict(self, threshold):
+        return {
+            'queries': self.count,
+            'duration_ms': round(self.duration * 1000, 3),
+            'templates': self.templates,
+            'render_ms': round(self.render_duration * 1000, 3),
+            'slowest': [{'duration_ms': round(duration * 1000, 3), 'statement': shape}
+                        for duration, shape in self.slowest()],
+            'repeated': [{'count': count, 'statement': shape} for shape, count in self.repeated(threshold)],
+        }
+
+
+def _active_profiles():
+    profiles = list(getattr(_captures, 'stack', ()))
+    if has_request_context():
+        profile = g.get('query_profile')
+        if profile is not None:
+            profiles.append(profile)
+    return profiles
+
+
+def _before_cursor_execute(connection, cursor, statement, parameters, context, executemany):
+    connection.info.setdefault('query_started', []).append(time.perf_counter())
+
+
+def _after_cursor_execute(connection, cursor, statement, parameters, context, executemany):
+    started = connection.info['query_started'].pop()
+    profiles = _active_profiles()
+    if profiles:
+        duration = time.perf_counter() - started
+        for profile in profiles:
+            profile.record(statement, duration)
+
+
+def _before_render_template(sender, template, context, **extra):
+    if not hasattr(_captures, 'render_started'):
+        _captures.render_started = []
+    _captures.render_started.append((template, time.perf_counter()))
+
+
+def _template_rendered(sender, template, context, **extra):
+    # a template that failed to render never sends template_rendered, so its entry
+    # is dropped here rather than mistaken for this one's
+    stack = getattr(_captures, 'render_started', [])
+    for index in range(len(stack) - 1, -1, -1):
+        if stack[index][0] is template:
+            break
+    else:
+        # its rendering began before the listeners were connected
+        return
+    started = stack[index][1]
+    del stack[index:]
+    profiles = _active_profiles()
+    if profiles:
+        duration = time.perf_counter() - started
+        for profile in profiles:
+            profile.record_render(duration)
+
+
+def _listen():
+    # listens on the Engine class, so the primary and every replica are timed, and
+    # on Flask's template signals, which every application sends
+    global _listening
+    with _listening_lock:
+        if not _listening:
+            event.listen(Engine, 'before_cursor_execute', _before_cursor_execute)
+            event.listen(Engine, 'after_cursor_execute', _after_cursor_execute)
+            before_render_template.connect(_before_render_template)
+            template_rendered.connect(_template_rendered)
+            _listening = True
+
+
+@contextmanager
+def profile_queries():
+    """Records the statements run by the code inside, whether or not the profiler is enabled.
+
+    Returns:
+        QueryProfile -- The profile, filled in as statements run.
+    """
+    _listen()
+    profile = QueryProfile()
+    if not hasattr(_captures, 'stack'):
+        _captures.stack = []
+    _captures.stack.append(profile)
+    try:
+        yield profile
+    finally:
+        _captures.stack.remove(profile)
+
+
+@contextmanager
+def query_budget(max_queries, n_plus_one_threshold=None):
+    """Fails when the code inside runs more statements than its budget, e.g. around a test client request.
+
+    Works whether or not the profiler is enabled, so a pytest fixture can wrap it:
+
+        with query_budget(3) as profile:
+            client.get('/venues')
+
+    Arguments:
+        max_queries {integer} -- The most statements allowed.
+
+    Keyword Arguments:
+        n_plus_one_threshold {integer} -- Also fail when a statement shape repeats this often (default: {None})
+
+    Raises:
+        AssertionError: When the budget is exceeded, listing the statements that ran most.
+    """
+    with profile_queries() as profile:
+        yield profile
+    if profile.count > max_queries:
+        raise AssertionError('{} queries run, budget was {}: {}'.format(
+            profile.count, max_queries, json.dumps(profile.shapes.most_common(5))))
+    if n_plus_one_threshold is not None and profile.repeated(n_plus_one_threshold):
+        raise AssertionError('Repeated statements: {}'.format(json.dumps(profile.repeated(n_plus_one_threshold))))
+
+
+class QueryProfiler(object):
+    """Opt-in profiler of the statements every request runs.
+
+    Enabled with QUERY_PROFILER. Each response then carries the statement count and
+    database time, and the time spent rendering templates, in a Server-Timing header.
+    Each request is logged as a JSON line on the fyyur.queries logger, at WARNING
+    when a statement shape repeats at least QUERY_PROFILER_N_PLUS_ONE_THRESHOLD
+    times. The last QUERY_PROFILER_HISTORY profiles are kept for the /debug/queries
+    endpoint. When disabled, no listener is registered and requests pay nothing.
+    """
+
+    def __init__(self, app=None):
+        self.enabled = False
+        self._history = deque()
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.extensions['query_profiler'] = self
+        self.enabled = bool(app.config.get('QUERY_PROFILER'))
+        if not self.enabled:
+            return
+        self.threshold = app.config.get('QUERY_PROFILER_N_PLUS_ONE_THRESHOLD', 5)
+        self.slowest = app.config.get('QUERY_PROFILER_SLOWEST', 5)
+        self._history = deque(maxlen=app.config.get('QUERY_PROFILER_HISTORY', 100))
+        _listen()
+        app.before_request(self._start)
+        app.after_request(self._finish)
+
+    def history(self):
+        """The profiles of the latest requests of this process, newest first."""
+        with self._lock:
+            return list(reversed(self._history))
+
+    def _start(self):
+        g.query_profile = QueryProfile(self.slowest)
+
+    def _finish(self, response):
+        profile = g.pop('query_profile', None)
+        if profile is None:
+            return response
+        report = profile.as_dict(self.threshold)
+        timing = 'db;dur={:.3f};desc="{} queries"'.format(profile.duration * 1000, profile.count)
+        if profile.templates:
+            timing += ', render;dur={:.3f};desc="{} templates"'.format(profile.render_duration * 1000, profile.templates)
+        if report['repeated']:
+            timing += ', db-repeated;desc="{} repeated statements"'.format(len(report['repeated']))
+        response.headers.add('Server-Timing', timing)
+
+        report.update({'method': request.method, 'path': request.full_path.rstrip('?'), 'status': response.status_code})
+        with self._lock:
+            self._history.append(report)
+        logger.log(logging.WARNING if report['repeated'] else logging.INFO, json.dumps(report))
+        return response
+
+
+profiler = QueryProfiler()
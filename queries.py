@@ -0,0 +1,431 @@
+import base64
+from datetime import datetime
+from itertools import groupby
+
+import dateutil.parser
+
+from sqlalchemy import func, select, tuple_, union_all
+
+from genres import genre_filter
+from models import db, Venue, Artist, Show, ShowArchive, UpcomingShow
+from upcoming import summary_fresh
+
+# the Show column that links a show to each model it belongs to
+SHOW_FOREIGN_KEYS = {
+    Venue: Show.venue_id,
+    Artist: Show.artist_id,
+}
+
+# the ShowArchive column that links an archived show to each model it belongs to
+ARCHIVE_FOREIGN_KEYS = {
+    Venue: ShowArchive.venue_id,
+    Artist: ShowArchive.artist_id,
+}
+
+# the UpcomingShow columns of the venue and the artist of a show
+SUMMARY_COLUMNS = {
+    Venue: (UpcomingShow.venue_id, UpcomingShow.venue_name, UpcomingShow.venue_image_link),
+    Artist: (UpcomingShow.artist_id, UpcomingShow.artist_name, UpcomingShow.artist_image_link),
+}
+
+# the columns of a venue or an artist shown on its page
+DETAIL_COLUMNS = {
+    Venue: ('id', 'name', 'genres', 'address', 'city', 'state', 'phone', 'website', 'facebook_link',
+            'seeking_talent', 'seeking_description', 'image_link'),
+    Artist: ('id', 'name', 'genres', 'city', 'state', 'phone', 'facebook_link',
+             'seeking_venue', 'seeking_description', 'image_link'),
+}
+
+#----------------------------------------------------------------------------#
+# Listing queries.
+#----------------------------------------------------------------------------#
+
+
+def venue_areas(genre=None):
+    """Builds the city/state grouped venue listing from a single query.
+
+    The upcoming show count of every venue is read from its maintained counter
+    (see counters.py), so the page costs one round trip however many venues or areas exist.
+
+    Keyword Arguments:
+        genre {string} -- Only list the venues of this genre (default: {None})
+
+    Returns:
+        list -- A list of areas, each a dictionary with the city, state and the venues in it.
+    """
+    query = db.session.query(Venue.city, Venue.state, Venue.id, Venue.name,
+                             Venue.upcoming_shows_count.label('upcoming_shows'))
+    if genre:
+        query = query.filter(genre_filter(Venue, genre))
+    rows = query.order_by(Venue.state, Venue.city, Venue.id).all()
+
+    # the rows arrive ordered by area, so a single pass groups them
+    areas = []
+    for (city, state), venues in groupby(rows, key=lambda row: (row.city, row.state)):
+        areas.append({
+            'city': city,
+            'state': state,
+            'venues': [{'id': row.id, 'name': row.name, 'upcoming_shows': row.upcoming_shows} for row in venues]
+        })
+    return areas
+
+
+def shows_page(after=None, start=None, end=None, venue_id=None, artist_id=None,
+               upcoming_only=False, per_page=12, current_time=None):
+    """Lists a page of shows with the names of their venues and artists.
+
+    Shows are ordered by start time and ID and paged with a keyset cursor instead of an
+    offset, so every page is one indexed range scan over the shows joined to their venue
+    and artist, however deep into the listing it is. Upcoming shows are read from the
+    upcoming shows summary while it is fresh enough.
+
+    Keyword Arguments:
+        after {string} -- The cursor of the last show on the previous page (default: {None})
+        start {datetime} -- Only list shows starting at or after this time (default: {None})
+        end {datetime} -- Only list shows starting before this time (default: {None})
+        venue_id {integer} -- Only list the shows of this venue (default: {None})
+        artist_id {integer} -- Only list the shows of this artist (default: {None})
+        upcoming_only {boolean} -- Only list shows that have not started yet (default: {False})
+        per_page {integer} -- The number of shows on a page (default: {12})
+        current_time {datetime} -- The point in time that separates upcoming from past shows (default: {now})
+
+    Raises:
+        ValueError: When the cursor is malformed.
+
+    Returns:
+        dict -- The shows on the page and the cursor of the next page, which is None on the last page.
+    """
+    if upcoming_only and summary_fresh():
+        # the upcoming shows summary already carries the names (see upcoming.py)
+        shows = UpcomingShow
+        query = db.session.query(UpcomingShow.id, UpcomingShow.start_time,
+                                 UpcomingShow.venue_id, UpcomingShow.venue_name,
+                                 UpcomingShow.artist_id, UpcomingShow.artist_name,
+                                 UpcomingShow.artist_image_link)
+    else:
+        shows = Show
+        query = db.session.query(Show.id, Show.start_time,
+                                 Show.venue_id, Venue.name.label('venue_name'),
+                                 Show.artist_id, Artist.name.label('artist_name'),
+                                 Artist.image_link.label('artist_image_link')) \
+            .join(Venue, Show.venue_id == Venue.id) \
+            .join(Artist, Show.artist_id == Artist.id)
+
+    query = filter_shows(query, after=after, start=start, end=end, venue_id=venue_id, artist_id=artist_id,
+                         upcoming_only=upcoming_only, current_time=current_time, model=shows)
+
+    # fetch one extra row to learn whether there is a next page
+    rows = query.order_by(shows.start_time, shows.id).limit(per_page + 1).all()
+    next_cursor = encode_cursor(rows[per_page - 1].start_time, rows[per_page - 1].id) if len(rows) > per_page else None
+
+    return {
+        'shows': [{
+            'venue_id': row.venue_id,
+            'venue_name': row.venue_name,
+            'artist_id': row.artist_id,
+            'artist_name': row.artist_name,
+            'artist_image_link': row.artist_image_link,
+            'start_time': row.start_time,
+        } for row in rows[:per_page]],
+        'next_cursor': next_cursor,
+    }
+
+
+def filter_shows(query, after=None, start=None, end=None, venue_id=None, artist_id=None,
+                 upcoming_only=False, current_time=None, model=Show):
+    """Applies the /shows listing filters and keyset cursor to a query over Show.
+
+    Arguments:
+        query {object} -- The query to filter.
+
+    Keyword Arguments:
+        after {string} -- The cursor of the last show on the previous page (default: {None})
+        start {datetime} -- Only keep shows starting at or after this time (default: {None})
+        end {datetime} -- Only keep shows starting before this time (default: {None})
+        venue_id {integer} -- Only keep the shows of this venue (default: {None})
+        artist_id {integer} -- Only keep the shows of this artist (default: {None})
+        upcoming_only {boolean} -- Only keep shows that have not started yet (default: {False})
+        current_time {datetime} -- The point in time that separates upcoming from past shows (default: {now})
+        model {class} -- Show, or UpcomingShow for a query over the upcoming shows summary (default: {Show})
+
+    Raises:
+        ValueError: When the cursor is malformed.
+
+    Returns:
+        object -- The filtered query.
+    """
+    if after:
+        query = query.filter(tuple_(model.start_time, model.id) > decode_cursor(after))
+    if start is not None:
+        query = query.filter(model.start_time >= start)
+    if end is not None:
+        query = query.filter(model.start_time < end)
+    if upcoming_only:
+        # the summary may still hold shows that started since its last refresh
+        query = query.filter(model.start_time > (current_time or datetime.utcnow()))
+    if venue_id is not None:
+        query = query.filter(model.venue_id == venue_id)
+    if artist_id is not None:
+        query = query.filter(model.artist_id == artist_id)
+    return query
+
+
+def show_filters(args):
+    """Reads the /shows listing filters from request arguments.
+
+    Arguments:
+        args {dict} -- The request arguments, with ?from=, ?to=, ?venue_id=, ?artist_id= and ?upcoming=1.
+
+    Raises:
+        ValueError: When a filter is malformed.
+
+    Returns:
+        dict -- The keyword arguments of filter_shows() for the filters present.
+    """
+    filters = {}
+    try:
+        if args.get('from'):
+            filters['start'] = dateutil.parser.parse(args['from'])
+        if args.get('to'):
+            filters['end'] = dateutil.parser.parse(args['to'])
+    except OverflowError as error:
+        raise ValueError(str(error)) from error
+    if args.get('venue_id'):
+        filters['venue_id'] = int(args['venue_id'])
+    if args.get('artist_id'):
+        filters['artist_id'] = int(args['artist_id'])
+    if args.get('upcoming') == '1':
+        filters['upcoming_only'] = True
+    return filters
+
+
+def encode_cursor(start_time, show_id):
+    """Encodes the keyset position of a show into an opaque, URL safe cursor."""
+    position = '{}|{}'.format(start_time.isoformat(), show_id)
+    return base64.urlsafe_b64encode(position.encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor):
+    """Decodes a cursor made by encode_cursor() back into a (start_time, id) keyset position.
+
+    Raises:
+        ValueError: When the cursor is malformed.
+    """
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        start_time, show_id = base64.urlsafe_b64decode(padded.encode('ascii')).decode('utf-8').split('|')
+        return datetime.strptime(start_time, '%Y-%m-%dT%H:%M:%S.%f' if '.' in start_time else '%Y-%m-%dT%H:%M:%S'), int(show_id)
+    except (TypeError, UnicodeError, ValueError) as error:
+        raise ValueError('Malformed cursor: {}'.format(cursor)) from error
+
+#----------------------------------------------------------------------------#
+# Detail queries.
+#----------------------------------------------------------------------------#
+
+
+def venue_detail(venue_id, upcoming_page=1, past_page=1, per_page=12, current_time=None, execute_all=None):
+    """Loads a venue with a page of its upcoming and past shows and the artists playing them.
+
+    Arguments:
+        venue_id {integer} -- The ID of the venue to load.
+
+    Keyword Arguments:
+        upcoming_page {integer} -- The 1-based page of upcoming shows, soonest first (default: {1})
+        past_page {integer} -- The 1-based page of past shows, most recent first (default: {1})
+        per_page {integer} -- The number of shows on a page (default: {12})
+        current_time {datetime} -- The point in time that separates upcoming from past shows (default: {now})
+        execute_all {function} -- Runs a list of independent statements and returns their rows (default: {one after another on db.session})
+
+    Returns:
+        dict -- The venue details with its shows, or None when no venue has the given ID.
+    """
+    return entity_detail(Venue, venue_id, upcoming_page, past_page, per_page, current_time, execute_all)
+
+
+def artist_detail(artist_id, upcoming_page=1, past_page=1, per_page=12, current_time=None, execute_all=None):
+    """Loads an artist with a page of their upcoming and past shows and the venues hosting them.
+
+    Arguments:
+        artist_id {integer} -- The ID of the artist to load.
+
+    Keyword Arguments:
+        upcoming_page {integer} -- The 1-based page of upcoming shows, soonest first (default: {1})
+        past_page {integer} -- The 1-based page of past shows, most recent first (default: {1})
+        per_page {integer} -- The number of shows on a page (default: {12})
+        current_time {datetime} -- The point in time that separates upcoming from past shows (default: {now})
+        execute_all {function} -- Runs a list of independent statements and returns their rows (default: {one after another on db.session})
+
+    Returns:
+        dict -- The artist details with their shows, or None when no artist has the given ID.
+    """
+    return entity_detail(Artist, artist_id, upcoming_page, past_page, per_page, current_time, execute_all)
+
+
+def entity_detail(model, entity_id, upcoming_page=1, past_page=1, per_page=12, current_time=None, execute_all=None):
+    """Loads a venue or an artist with a page each of its upcoming and past shows.
+
+    The entity, the show counts and the two pages of shows do not depend on each
+    other, so they are built as four statements that execute_all may run at the
+    same time (see async_db.py). Archived past shows are only read when the page
+    of past shows reaches beyond the ones still in Show.
+
+    Arguments:
+        model {class} -- Either Venue or Artist.
+        entity_id {integer} -- The ID of the venue or artist.
+
+    Keyword Arguments:
+        upcoming_page {integer} -- The 1-based page of upcoming shows, soonest first (default: {1})
+        past_page {integer} -- The 1-based page of past shows, most recent first (default: {1})
+        per_page {integer} -- The number of shows on a page (default: {12})
+        current_time {datetime} -- The point in time that separates upcoming from past shows (default: {now})
+        execute_all {function} -- Runs a list of independent statements and returns their rows (default: {one after another on db.session})
+
+    Returns:
+        dict -- The details with the shows, or None when no entity has the given ID.
+    """
+    upcoming_page, past_page = max(upcoming_page, 1), max(past_page, 1)
+    current_time = current_time or datetime.utcnow()
+    execute_all = execute_all or execute_serially
+    statements = [select(*[getattr(model, name) for name in DETAIL_COLUMNS[model]]).where(model.id == entity_id)]
+    statements.extend(_shows_statements(model, entity_id, upcoming_page, past_page, per_page, current_time))
+    entity_rows, *show_rows = execute_all(statements)
+    if not entity_rows:
+        return None
+
+    data = dict(entity_rows[0]._mapping)
+    data.update(_shows_data(model, entity_id, show_rows, upcoming_page, past_page, per_page, current_time, execute_all))
+    return data
+
+
+def entity_shows(model, entity_id, upcoming_page=1, past_page=1, per_page=12, current_time=None, execute_all=None):
+    """Splits the shows of a venue or an artist into pages of upcoming and past shows in SQL.
+
+    Runs a fixed three queries however many shows there are: one for both counts and one
+    for each page, which are joined to the venue or artist on the other side of the show.
+    A fourth reads the archive when the page of past shows reaches archived shows.
+
+    Arguments:
+        model {class} -- The model the shows belong to, either Venue or Artist.
+        entity_id {integer} -- The ID of the venue or artist.
+
+    Keyword Arguments:
+        upcoming_page {integer} -- The 1-based page of upcoming shows, soonest first (default: {1})
+        past_page {integer} -- The 1-based page of past shows, most recent first (default: {1})
+        per_page {integer} -- The number of shows on a page (default: {12})
+        current_time {datetime} -- The point in time that separates upcoming from past shows (default: {now})
+        execute_all {function} -- Runs a list of independent statements and returns their rows (default: {one after another on db.session})
+
+    Returns:
+        dict -- The upcoming and past shows with their counts and the pagination details.
+    """
+    upcoming_page, past_page = max(upcoming_page, 1), max(past_page, 1)
+    current_time = current_time or datetime.utcnow()
+    execute_all = execute_all or execute_serially
+    statements = _shows_statements(model, entity_id, upcoming_page, past_page, per_page, current_time)
+    return _shows_data(model, entity_id, execute_all(statements), upcoming_page, past_page, per_page,
+                       current_time, execute_all)
+
+
+def execute_serially(statements):
+    """Runs statements one after another on the request's session.
+
+    Arguments:
+        statements {list} -- The SELECT statements.
+
+    Returns:
+        list -- The rows of every statement, in the order of the statements.
+    """
+    return [db.session.execute(statement).all() for statement in statements]
+
+
+def _shows_statements(model, entity_id, upcoming_page, past_page, per_page, current_time):
+    show_foreign_key = SHOW_FOREIGN_KEYS[model]
+    past_shows = _shows_page(model, entity_id, Show.start_time < current_time,
+                             (Show.start_time.desc(), Show.id.desc()), past_page, per_page)
+    # the counters include the archived shows, the shows still in Show are counted too
+    counted_shows = select(model.upcoming_shows_count + model.past_shows_count) \
+        .where(model.id == entity_id).scalar_subquery()
+    if summary_fresh():
+        # the upcoming shows are read from the summary (see upcoming.py)
+        summary_foreign_key = SUMMARY_COLUMNS[model][0]
+        counts = select(
+            select(func.count(UpcomingShow.id))
+            .where(summary_foreign_key == entity_id, UpcomingShow.start_time > current_time).scalar_subquery(),
+            select(func.count(Show.id))
+            .where(show_foreign_key == entity_id, Show.start_time < current_time).scalar_subquery(),
+            select(func.count(Show.id)).where(show_foreign_key == entity_id).scalar_subquery(),
+            counted_shows)
+        counterpart_id, counterpart_name, counterpart_image_link = SUMMARY_COLUMNS[Artist if model is Venue else Venue]
+        upcoming_shows = select(UpcomingShow.start_time, counterpart_id.label('id'), counterpart_name.label('name'),
+                                counterpart_image_link.label('image_link')) \
+            .where(summary_foreign_key == entity_id, UpcomingShow.start_time > current_time) \
+            .order_by(UpcomingShow.start_time, UpcomingShow.id) \
+            .limit(per_page) \
+            .offset((upcoming_page - 1) * per_page)
+        return [counts, upcoming_shows, past_shows]
+
+    counts = select(func.count(Show.id).filter(Show.start_time > current_time),
+                    func.count(Show.id).filter(Show.start_time < current_time),
+                    func.count(Show.id), counted_shows) \
+        .where(show_foreign_key == entity_id)
+    upcoming_shows = _shows_page(model, entity_id, Show.start_time > current_time,
+                                 (Show.start_time, Show.id), upcoming_page, per_page)
+    return [counts, upcoming_shows, past_shows]
+
+
+def _shows_data(model, entity_id, rows, upcoming_page, past_page, per_page, current_time, execute_all):
+    count_rows, upcoming_rows, past_rows = rows
+    upcoming_shows_count, past_shows_count, shows_count, counted_shows = count_rows[0]
+    # whatever the counters hold beyond the shows in Show has been archived
+    archived_shows_count = max((counted_shows or 0) - shows_count, 0)
+    if archived_shows_count and past_page * per_page > past_shows_count:
+        # the page reaches into the archive, which is read only then
+        past_rows = execute_all([_past_shows_page(model, entity_id, past_page, per_page, current_time)])[0]
+    past_shows_count += archived_shows_count
+    return {
+        'upcoming_shows': _show_rows(model, upcoming_rows),
+        'past_shows': _show_rows(model, past_rows),
+        'upcoming_shows_count': upcoming_shows_count,
+        'past_shows_count': past_shows_count,
+        'upcoming_page': upcoming_page,
+        'past_page': past_page,
+        'has_more_upcoming_shows': upcoming_page * per_page < upcoming_shows_count,
+        'has_more_past_shows': past_page * per_page < past_shows_count,
+    }
+
+
+def _shows_page(model, entity_id, criterion, ordering, page, per_page):
+    # a venue lists the artists of its shows and an artist lists the venues
+    counterpart = Artist if model is Venue else Venue
+    return select(Show.start_time, counterpart.id, counterpart.name, counterpart.image_link) \
+        .join(counterpart, SHOW_FOREIGN_KEYS[counterpart] == counterpart.id) \
+        .where(SHOW_FOREIGN_KEYS[model] == entity_id, criterion) \
+        .order_by(*ordering) \
+        .limit(per_page) \
+        .offset((page - 1) * per_page)
+
+
+def _past_shows_page(model, entity_id, page, per_page, current_time):
+    # the past shows still in Show followed by the archived ones, most recent first
+    counterpart = Artist if model is Venue else Venue
+    recent = select(Show.id.label('show_id'), Show.start_time, counterpart.id, counterpart.name, counterpart.image_link) \
+        .join(counterpart, SHOW_FOREIGN_KEYS[counterpart] == counterpart.id) \
+        .where(SHOW_FOREIGN_KEYS[model] == entity_id, Show.start_time < current_time)
+    archived = select(ShowArchive.id, ShowArchive.start_time, counterpart.id, counterpart.name, counterpart.image_link) \
+        .join(counterpart, ARCHIVE_FOREIGN_KEYS[counterpart] == counterpart.id) \
+        .where(ARCHIVE_FOREIGN_KEYS[model] == entity_id)
+    shows = union_all(recent, archived).subquery()
+    return select(shows.c.start_time, shows.c.id, shows.c.name, shows.c.image_link) \
+        .order_by(shows.c.start_time.desc(), shows.c.show_id.desc()) \
+        .limit(per_page) \
+        .offset((page - 1) * per_page)
+
+
+def _show_rows(model, rows):
+    prefix = (Artist if model is Venue else Venue).__tablename__.lower()
+    return [{
+        prefix + '_id': row.id,
+        prefix + '_name': row.name,
+        prefix + '_image_link': row.image_link,
+        'start_time': row.start_time,
+    } for row in rows]
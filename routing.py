@@ -0,0 +1,174 @@
+import functools
+import random
+import threading
+import time
+from collections import Counter
+
+from flask import current_app, g, has_request_context, request
+from flask_sqlalchemy.session import Session
+from sqlalchemy import event, text
+
+#----------------------------------------------------------------------------#
+# Read replicas.
+#----------------------------------------------------------------------------#
+
+REPLICA_BIND_PREFIX = 'replica_'
+
+# how far behind the primary a PostgreSQL standby is, in seconds; an idle
+# standby that has replayed everything it received is not behind at all
+_LAG_QUERY = text(
+    'SELECT CASE WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0 '
+    'ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0) END')
+
+
+class RoutingSession(Session):
+    """Session that sends the reads of read-only views to the replica picked for the request.
+
+    Flushes, and everything after the first flush of a request, go to the primary.
+    """
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and not self._flushing and has_request_context():
+            replica = g.get('db_replica')
+            if replica is not None and not g.get('db_wrote'):
+                return current_app.extensions['sqlalchemy'].engines[replica]
+        return super(RoutingSession, self).get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+def remember_write():
+    """Marks the current request as one that wrote to the primary, if there is a request.
+
+    Its later reads stay on the primary and the visitor gets the read-your-writes
+    cookie. Flushes of the session are marked on their own; writes on a connection
+    of their own, like the chunks of a bulk import, have to call this.
+    """
+    if has_request_context():
+        g.db_wrote = True
+
+
+def _flushed(session, flush_context):
+    remember_write()
+
+
+event.listen(RoutingSession, 'after_flush', _flushed)
+
+
+class ReplicaRouter(object):
+    """Routes the reads of read-only views to replicas that are not lagging behind.
+
+    Every URI in DATABASE_REPLICA_URIS becomes a bind named replica_<n>. A request
+    to a view decorated with read_only() is served from a random replica whose lag
+    is at most REPLICA_MAX_LAG seconds, unless the visitor wrote within the last
+    READ_YOUR_WRITES_WINDOW seconds (remembered in a cookie), so they always see
+    their own changes. Replica lag is measured at most every REPLICA_LAG_CHECK_INTERVAL
+    seconds; a replica that cannot be reached counts as lagging.
+    """
+
+    cookie_name = 'fyyur_last_write'
+
+    def __init__(self, app=None):
+        self._lags = {}
+        self._lock = threading.Lock()
+        self._stats = Counter()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        """Adds the replica binds to the config; must be called before db.init_app()."""
+        binds = dict(app.config.get('SQLALCHEMY_BINDS') or {})
+        for number, uri in enumerate(app.config.get('DATABASE_REPLICA_URIS') or []):
+            binds['{}{}'.format(REPLICA_BIND_PREFIX, number)] = uri
+        app.config['SQLALCHEMY_BINDS'] = binds
+        app.after_request(self._remember_write)
+        app.extensions['replica_router'] = self
+
+    def read_only(self, view):
+        """Decorates a view that only reads, so its queries may be served by a replica."""
+        @functools.wraps(view)
+        def wrapper(*args, **kwargs):
+            g.db_replica = self.choose()
+            return view(*args, **kwargs)
+        return wrapper
+
+    def choose(self):
+        """Picks the replica for the current request.
+
+        Returns:
+            string -- The bind key of the replica, or None to stay on the primary.
+        """
+        replicas = self.replica_keys()
+        if not replicas:
+            return None
+        if self._wrote_recently():
+            self._count('primary:recent_write')
+            return None
+        max_lag = current_app.config['REPLICA_MAX_LAG']
+        healthy = [key for key in replicas if self.lag(key) <= max_lag]
+        if not healthy:
+            self._count('primary:replicas_lagging')
+            return None
+        replica = random.choice(healthy)
+        self._count(replica)
+        return replica
+
+    def replica_keys(self):
+        return sorted(key for key in current_app.config['SQLALCHEMY_BINDS'] if key.startswith(REPLICA_BIND_PREFIX))
+
+    def lag(self, key):
+        """The replication lag of a replica in seconds, remeasured once REPLICA_LAG_CHECK_INTERVAL has passed.
+
+        Only PostgreSQL standbys report lag; other databases count as caught up.
+        """
+        now = time.time()
+        with self._lock:
+            measured = self._lags.get(key)
+        if measured is not None and now - measured[0] < current_app.config['REPLICA_LAG_CHECK_INTERVAL']:
+            return measured[1]
+
+        engine = current_app.extensions['sqlalchemy'].engines[key]
+        try:
+            if engine.dialect.name == 'postgresql':
+                with engine.connect() as connection:
+                    lag = float(connection.execute(_LAG_QUERY).scalar())
+            else:
+                lag = 0.0
+        except Exception:
+            current_app.logger.exception('Could not measure the lag of %s', key)
+            lag = float('inf')
+        with self._lock:
+            self._lags[key] = (now, lag)
+        return lag
+
+    def stats(self):
+        """The routing decisions of this process and the last measured lag of every replica, for monitoring.
+
+        Returns:
+            dict -- The number of requests routed to each replica or kept on the primary (and why), and the lags.
+        """
+        with self._lock:
+            routes = dict(self._stats)
+            lags = {key: (lag if lag != float('inf') else None) for key, (measured_at, lag) in self._lags.items()}
+        return {'routes': routes, 'lag': lags, 'replicas': self.replica_keys()}
+
+    def _count(self, name):
+        with self._lock:
+            self._stats[name] += 1
+
+    def _wrote_recently(self):
+        try:
+            last_write = float(request.cookies.get(self.cookie_name, 0))
+        except ValueError:
+            return False
+        return time.time() - last_write < current_app.config['READ_YOUR_WRITES_WINDOW']
+
+    def _remember_write(self, response):
+        if g.get('db_wrote'):
+            response.set_cookie(self.cookie_name, '{:.3f}'.format(time.time()),
+                                max_age=current_app.config['READ_YOUR_WRITES_WINDOW'], httponly=True, samesite='Lax')
+        route = g.get('db_replica', False)
+        if route is not False:
+            response.headers['X-DB-Route'] = route or 'primary'
+        return response
+
+
+router = ReplicaRouter()
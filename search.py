@@ -0,0 +1,290 @@
+import re
+import threading
+from collections import defaultdict
+
+from flask import current_app
+from sqlalchemy import and_, event, func
+from sqlalchemy.orm import Session
+
+from cache import cache
+from genres import genre_facets, genre_filter
+from models import db
+from queries import SHOW_FOREIGN_KEYS
+
+#----------------------------------------------------------------------------#
+# Search.
+#----------------------------------------------------------------------------#
+
+
+def search(model, search_term, page=1, per_page=20, genre=None):
+    """Searches the name, city, state and genres of a model, with the upcoming show count of every hit.
+
+    Hits are ranked by how similar their name is to the search term, then by how similar
+    the rest of their searchable text is. On PostgreSQL the matching and ranking run against
+    the pg_trgm index in a single query, and the total is a window count over the matches.
+    Other databases use the in-process trigram index and one query for the page of hits.
+    The genres of all hits are counted for filtering them down to one genre.
+
+    Arguments:
+        model {class} -- The model to search, either Venue or Artist.
+        search_term {string} -- The term to look for, regardless of the character casing.
+
+    Keyword Arguments:
+        page {integer} -- The 1-based page of results to return (default: {1})
+        per_page {integer} -- The number of hits on a page (default: {20})
+        genre {string} -- Only keep the hits of this genre (default: {None})
+
+    Returns:
+        dict -- The total count, the hits on the requested page, the genre counts of
+        all hits regardless of the genre filter and the pagination details.
+    """
+    page = max(page, 1)
+    offset = (page - 1) * per_page
+
+    if search_backend() == 'trigram':
+        rows, count, genres = _search_trigram(model, search_term, offset, per_page, genre)
+    else:
+        rows, count, genres = _search_memory(model, search_term, offset, per_page, genre)
+
+    return {
+        'count': count,
+        'genres': genres,
+        'genre': genre,
+        'data': [{'id': row.id, 'name': row.name, 'upcoming_shows_count': row.upcoming_shows_count} for row in rows],
+        'page': page,
+        'per_page': per_page,
+        'has_next': page * per_page < count,
+    }
+
+
+def search_backend():
+    """Picks the search backend from the SEARCH_BACKEND setting, or from the database dialect when it is unset.
+
+    Returns:
+        string -- Either 'trigram' for the PostgreSQL index or 'memory' for the in-process index.
+    """
+    backend = current_app.config.get('SEARCH_BACKEND')
+    if backend:
+        return backend
+    return 'trigram' if db.engine.dialect.name == 'postgresql' else 'memory'
+
+
+def search_document(model):
+    """The SQL expression the trigram index of a model is built on (see migration 3c9a5e1f7d20)."""
+    return func.fyyur_search_text(model.name, model.city, model.state, model.genres)
+
+
+def _hits_query(model):
+    # upcoming show counts are read from the maintained counters (see counters.py)
+    return db.session.query(model.id, model.name, model.upcoming_shows_count)
+
+
+def _search_trigram(model, search_term, offset, limit, genre):
+    keywords = '%{}%'.format(search_term.lower())
+    document = search_document(model)
+    matches = document.like(keywords)
+    genres = genre_facets(model, matches, key='search:' + search_term.lower())
+    if genre:
+        matches = and_(matches, genre_filter(model, genre))
+    rows = _hits_query(model) \
+        .add_columns(func.count().over().label('total')) \
+        .filter(matches) \
+        .order_by(func.similarity(model.name, search_term).desc(),
+                  func.word_similarity(search_term, document).desc(),
+                  model.name, model.id) \
+        .limit(limit) \
+        .offset(offset) \
+        .all()
+
+    if rows:
+        count = rows[0].total
+    elif offset:
+        # paged past the last hit, so the window count has no row to ride on
+        count = db.session.query(func.count(model.id)).filter(matches).scalar()
+    else:
+        count = 0
+    return rows, count, genres
+
+
+def _search_memory(model, search_term, offset, limit, genre):
+    ids = fallback_index(model).search(search_term)
+    genres = genre_facets(model, model.id.in_(ids), key='search:' + search_term.lower()) if ids else []
+    if genre and ids:
+        kept = {row.id for row in db.session.query(model.id).filter(model.id.in_(ids), genre_filter(model, genre))}
+        ids = [id for id in ids if id in kept]
+    page_ids = ids[offset:offset + limit]
+    if not page_ids:
+        return [], len(ids), genres
+
+    rows = _hits_query(model).filter(model.id.in_(page_ids)).all()
+    positions = {id: position for position, id in enumerate(page_ids)}
+    rows.sort(key=lambda row: positions[row.id])
+    return rows, len(ids), genres
+
+#----------------------------------------------------------------------------#
+# In-process fallback index.
+#----------------------------------------------------------------------------#
+
+
+def search_text(name, city, state, genres):
+    """Mirrors the fyyur_search_text() SQL function: the lowercased searchable fields joined by spaces."""
+    return ' '.join([name or '', city or '', state or '', ' '.join(genres or [])]).lower()
+
+
+def substring_trigrams(text):
+    """Every three character window of the text, used to find substring matches."""
+    return {text[index:index + 3] for index in range(len(text) - 2)}
+
+
+def word_trigrams(text):
+    """The trigrams of every padded word in the text, the way pg_trgm extracts them for similarity()."""
+    trigrams = set()
+    for word in re.findall(r'\w+', text.lower()):
+        padded = '  {} '.format(word)
+        trigrams.update(padded[index:index + 3] for index in range(len(padded) - 2))
+    return trigrams
+
+
+def similarity(trigrams, other_trigrams):
+    """The share of trigrams two texts have in common, as computed by pg_trgm's similarity()."""
+    if not trigrams or not other_trigrams:
+        return 0.0
+    shared = len(trigrams & other_trigrams)
+    return shared / float(len(trigrams) + len(other_trigrams) - shared)
+
+
+class TrigramIndex(object):
+    """In-process trigram index over the name, city, state and genres of one model.
+
+    Stands in for the pg_trgm index on databases without it, such as SQLite. Matches have
+    the same substring semantics as the SQL path and are ranked the same way. Every process
+    keeps its own copy, which is updated from the writes committed through its sessions and
+    built again once the 'listings' cache tag is invalidated, by any process.
+    """
+
+    def __init__(self):
+        self.documents = {}
+        self.postings = defaultdict(set)
+        # the version of the 'listings' tag the index was built at
+        self.listings_version = None
+
+    def add(self, id, name, city, state, genres):
+        self.remove(id)
+        document = search_text(name, city, state, genres)
+        self.documents[id] = (name or '', document, word_trigrams(name or ''), word_trigrams(document))
+        for trigram in substring_trigrams(document):
+            self.postings[trigram].add(id)
+
+    def remove(self, id):
+        entry = self.documents.pop(id, None)
+        if entry is None:
+            return
+        for trigram in substring_trigrams(entry[1]):
+            self.postings[trigram].discard(id)
+            if not self.postings[trigram]:
+                del self.postings[trigram]
+
+    def search(self, search_term):
+        """Finds the documents containing the search term.
+
+        Arguments:
+            search_term {string} -- The term to look for, regardless of the character casing.
+
+        Returns:
+            list -- The IDs of the matching rows, best match first.
+        """
+        term = search_term.lower()
+        trigrams = sorted(substring_trigrams(term), key=lambda trigram: len(self.postings.get(trigram, ())))
+        if trigrams:
+            candidates = set(self.postings.get(trigrams[0], ()))
+            for trigram in trigrams[1:]:
+                candidates &= self.postings.get(trigram, set())
+        else:
+            # too short to have a trigram, so every document is a candidate
+            candidates = self.documents.keys()
+
+        term_trigrams = word_trigrams(term)
+        ranked = []
+        for id in candidates:
+            name, document, name_trigrams, document_trigrams = self.documents[id]
+            if term in document:
+                ranked.append((-similarity(term_trigrams, name_trigrams),
+                               -similarity(term_trigrams, document_trigrams), name, id))
+        ranked.sort()
+        return [entry[-1] for entry in ranked]
+
+
+_fallback_indexes = {}
+_fallback_lock = threading.Lock()
+
+
+def fallback_index(model):
+    """Returns the in-process index of a model, building it from the database on first use
+    or once the 'listings' cache tag has been invalidated since.
+
+    Arguments:
+        model {class} -- The model whose index is wanted, either Venue or Artist.
+
+    Returns:
+        TrigramIndex -- The index of all rows of the model.
+    """
+    with _fallback_lock:
+        index = _fallback_indexes.get(model)
+        # read before building, so that a write made meanwhile is not missed
+        version = cache.version('listings')
+        if index is None or index.listings_version != version:
+            index = TrigramIndex()
+            index.listings_version = version
+            rows = db.session.query(model.id, model.name, model.city, model.state, model.genres).all()
+            for row in rows:
+                index.add(*row)
+            _fallback_indexes[model] = index
+        return index
+
+
+def _record_change(operation):
+    def listener(mapper, connection, target):
+        session = Session.object_session(target)
+        if session is not None:
+            values = (target.id, target.name, target.city, target.state, target.genres)
+            session.info.setdefault('search_index_changes', []).append((operation, type(target), values))
+    return listener
+
+
+def _apply_changes(session):
+    changes = session.info.pop('search_index_changes', [])
+    with _fallback_lock:
+        for operation, model, values in changes:
+            index = _fallback_indexes.get(model)
+            if index is None:
+                continue
+            if operation == 'add':
+                index.add(*values)
+            else:
+                index.remove(values[0])
+
+
+def _discard_changes(session, *args):
+    session.info.pop('search_index_changes', None)
+
+
+def reset_fallback_index(model):
+    """Drops the in-process index of a model so it is rebuilt on next use, after writes that skip the ORM."""
+    with _fallback_lock:
+        _fallback_indexes.pop(model, None)
+
+
+def _drop_after_bulk_change(context):
+    # Query.delete()/update() skip the mapper events, so rebuild the index on next use
+    if context.mapper is not None:
+        reset_fallback_index(context.mapper.class_)
+
+
+for _model in SHOW_FOREIGN_KEYS:
+    event.listen(_model, 'after_insert', _record_change('add'))
+    event.listen(_model, 'after_update', _record_change('add'))
+    event.listen(_model, 'after_delete', _record_change('remove'))
+event.listen(Session, 'after_commit', _apply_changes)
+event.listen(Session, 'after_soft_rollback', _discard_changes)
+event.listen(Session, 'after_bulk_delete', _drop_after_bulk_change)
+event.listen(Session, 'after_bulk_update', _drop_after_bulk_change)
@@ -0,0 +1,98 @@
+import json
+from collections import OrderedDict
+from operator import attrgetter
+
+from sqlalchemy import inspect
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - orjson is optional
+    orjson = None
+
+#----------------------------------------------------------------------------#
+# Encoding.
+#----------------------------------------------------------------------------#
+
+
+def _default(value):
+    if hasattr(value, 'isoformat'):
+        return value.isoformat()
+    raise TypeError('{!r} is not JSON serializable'.format(value))
+
+
+def dumps(data):
+    """Encodes data as compact JSON bytes, with orjson when it is installed.
+
+    Arguments:
+        data {object} -- The data to encode; datetimes become ISO 8601 strings.
+
+    Returns:
+        bytes -- The UTF-8 encoded JSON document.
+    """
+    if orjson is not None:
+        return orjson.dumps(data, default=_default)
+    return json.dumps(data, default=_default, separators=(',', ':'), ensure_ascii=False).encode('utf-8')
+
+#----------------------------------------------------------------------------#
+# Serializers.
+#----------------------------------------------------------------------------#
+
+
+class ModelSerializer(object):
+    """Serialises the columns of one model, as rows or as instances.
+
+    The column map is read from the mapper once, and the accessor of every field
+    list is compiled once and reused, instead of walking __table__.columns with
+    getattr for every instance like Model.as_dict() does.
+
+    Arguments:
+        model {class} -- The model to serialise.
+
+    Keyword Arguments:
+        extra_columns {dict} -- Further fields, mapped to the column expressions that select them (default: {None})
+    """
+
+    def __init__(self, model, extra_columns=None):
+        self.model = model
+        self.columns = OrderedDict((attribute.key, getattr(model, attribute.key))
+                                   for attribute in inspect(model).column_attrs)
+        self.model_fields = tuple(self.columns)
+        self.columns.update(extra_columns or {})
+        self._getters = {}
+
+    def fields(self, requested=None):
+        """Resolves a ?fields= value into the tuple of fields to return, always led by the ID.
+
+        Keyword Arguments:
+            requested {string} -- Comma separated field names, or None for every column of the model (default: {None})
+
+        Raises:
+            ValueError: When a requested field does not exist.
+
+        Returns:
+            tuple -- The field names.
+        """
+        if not requested:
+            return self.model_fields
+        names = OrderedDict.fromkeys(['id'] + [name.strip() for name in requested.split(',') if name.strip()])
+        unknown = [name for name in names if name not in self.columns]
+        if unknown:
+            raise ValueError('Unknown fields: {}'.format(', '.join(unknown)))
+        return tuple(names)
+
+    def select(self, fields):
+        """The column expressions that select exactly the given fields."""
+        return [self.columns[name] for name in fields]
+
+    def dump_rows(self, fields, rows):
+        """Serialises rows selected with select(fields); trailing extra columns are ignored."""
+        return [dict(zip(fields, row)) for row in rows]
+
+    def dump(self, instance, fields=None):
+        """Serialises a model instance, by default with all of its columns."""
+        fields = fields or self.model_fields
+        getter = self._getters.get(fields)
+        if getter is None:
+            getter = self._getters[fields] = attrgetter(*fields)
+        values = getter(instance)
+        return dict(zip(fields, values)) if len(fields) > 1 else {fields[0]: values}
@@ -0,0 +1,142 @@
+import os
+import threading
+from collections import Counter
+from collections.abc import Mapping
+
+from jinja2 import FileSystemBytecodeCache
+
+from cache import MemoryBackend
+from dates import display_settings
+
+#----------------------------------------------------------------------------#
+# Compiled templates.
+#----------------------------------------------------------------------------#
+
+
+def bytecode_cache(config):
+    """The cache compiled templates are kept in between processes, from TEMPLATE_BYTECODE_CACHE.
+
+    Jinja checks the source of a template against the one it was compiled from, so
+    an edited template is compiled again rather than served stale.
+
+    Arguments:
+        config {dict} -- The application config.
+
+    Returns:
+        object -- A FileSystemBytecodeCache, or None with TEMPLATE_BYTECODE_CACHE set to 'null'.
+    """
+    backend = config.get('TEMPLATE_BYTECODE_CACHE', 'filesystem')
+    if backend == 'filesystem':
+        # without a directory, Jinja uses a private one in the temporary directory
+        directory = config.get('TEMPLATE_BYTECODE_CACHE_DIR')
+        if directory:
+            os.makedirs(directory, mode=0o700, exist_ok=True)
+        return FileSystemBytecodeCache(directory, '%s.fyyur.cache')
+    if backend in (None, 'null'):
+        return None
+    raise ValueError('Unknown TEMPLATE_BYTECODE_CACHE: {}'.format(backend))
+
+
+def precompile_templates(app):
+    """Compiles every template of the application into its bytecode cache.
+
+    Run at deploy time, so the first requests of new worker processes load compiled
+    templates instead of parsing them.
+
+    Arguments:
+        app {Flask} -- The application.
+
+    Returns:
+        list -- The names of the templates compiled.
+    """
+    environment = app.jinja_env
+    names = [name for name in environment.list_templates() if name.endswith('.html')]
+    for name in names:
+        environment.get_template(name)
+    return names
+
+#----------------------------------------------------------------------------#
+# Fragment cache.
+#----------------------------------------------------------------------------#
+
+
+class FragmentCache(object):
+    """Caches the rendered show tiles of the shows, venue and artist pages in each process.
+
+    A template wraps a tile in the fragment() global, with the data the tile is
+    rendered from:
+
+        {% call fragment('show', show) %}...{% endcall %}
+
+    The tile is keyed by its name, that data and the locale and timezone dates are
+    shown in, so a changed show, venue or artist gets a new key and only its tiles
+    are rendered again; the tiles of the old data age out of the LRU. Data that
+    cannot be hashed is rendered every time. The one-line venue and artist items of
+    the listings are left out: looking them up costs more than rendering them.
+
+    Configured with FRAGMENT_CACHE_MAX_ENTRIES (0 disables it).
+    """
+
+    def __init__(self, app=None):
+        self.backend = None
+        self._stats = Counter()
+        self._stats_lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        max_entries = app.config.get('FRAGMENT_CACHE_MAX_ENTRIES', 10000)
+        self.backend = MemoryBackend(max_entries) if max_entries else None
+        app.jinja_env.globals['fragment'] = self.fragment
+        app.extensions['fragment_cache'] = self
+
+    def fragment(self, name, data, caller):
+        """Renders the body of the call block, or returns the tile rendered from the same data before.
+
+        Arguments:
+            name {string} -- The kind of tile, e.g. 'show' or 'venue-show'.
+            data {dict} -- Everything the tile is rendered from.
+            caller {function} -- Renders the body of the call block.
+
+        Returns:
+            Markup -- The rendered tile.
+        """
+        if self.backend is None:
+            return caller()
+        try:
+            key = (name, tuple(data.items()) if isinstance(data, Mapping) else data, display_settings())
+            hash(key)
+        except TypeError:
+            return caller()
+        tile = self.backend.get(key)
+        if tile is not None:
+            self._count('hits')
+            return tile
+        self._count('misses')
+        tile = caller()
+        self.backend.set(key, tile)
+        return tile
+
+    def clear(self):
+        if self.backend is not None:
+            self.backend.clear()
+
+    def stats(self):
+        """The hit and miss counters of this process, for monitoring.
+
+        Returns:
+            dict -- The counters, the hit ratio and the number of tiles kept.
+        """
+        with self._stats_lock:
+            stats = {name: self._stats[name] for name in ('hits', 'misses')}
+        lookups = stats['hits'] + stats['misses']
+        stats['hit_ratio'] = stats['hits'] / float(lookups) if lookups else 0.0
+        stats['entries'] = len(self.backend) if self.backend is not None else 0
+        return stats
+
+    def _count(self, name):
+        with self._stats_lock:
+            self._stats[name] += 1
+
+
+fragments = FragmentCache()
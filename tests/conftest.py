@@ -0,0 +1,93 @@
+import os
+
+import pytest
+
+# importing app.py builds the app of config.py, whose database defaults to PostgreSQL
+os.environ.setdefault('DATABASE_URL', 'sqlite://')
+
+import config
+import profiler
+from app import create_app
+from benchmarks import seed as seeding
+from bookings import reset_booking_index
+from geo import reset_grid_index
+from matching import reset_feature_store
+from models import db, Venue, Artist
+from search import reset_fallback_index
+
+#----------------------------------------------------------------------------#
+# Fixtures.
+#----------------------------------------------------------------------------#
+
+
+def reset_indexes():
+    # the in-process indexes outlive an app, so one built on another test's database is dropped
+    for model in (Venue, Artist):
+        reset_fallback_index(model)
+    reset_grid_index()
+    reset_booking_index()
+    reset_feature_store()
+
+
+@pytest.fixture
+def make_app(tmp_path):
+    """Builds apps on SQLite databases of their own, seeded with synthetic data (see benchmarks/seed.py).
+
+    The settings are those of config.py, without replicas, response cache or CSRF
+    tokens unless overridden:
+
+        app = make_app(venues=20, artists=40, shows=100, CACHE_BACKEND='memory')
+    """
+    apps = []
+
+    def make(venues=0, artists=0, shows=0, now=None, **overrides):
+        settings = {name: getattr(config, name) for name in dir(config) if name.isupper()}
+        settings.update({
+            'SQLALCHEMY_DATABASE_URI': 'sqlite:///' + str(tmp_path / 'fyyur-{}.db'.format(len(apps))),
+            'DATABASE_REPLICA_URIS': [],
+            'CACHE_BACKEND': 'null',
+            'TESTING': True,
+            'WTF_CSRF_ENABLED': False,
+        })
+        settings.update(overrides)
+        app = create_app(type('TestConfig', (object,), settings))
+        apps.append(app)
+        reset_indexes()
+        seeding.schema(app)
+        if venues or artists:
+            with app.app_context():
+                seeding.seed(venues, artists, shows, chunk_size=1000, now=now)
+        return app
+
+    yield make
+    for app in apps:
+        with app.app_context():
+            db.session.remove()
+            for engine in db.engines.values():
+                engine.dispose()
+    reset_indexes()
+
+
+@pytest.fixture
+def app(make_app):
+    return make_app(venues=20, artists=40, shows=200)
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+@pytest.fixture
+def query_budget():
+    """Fails the test when the code inside runs more statements than its budget (see profiler.query_budget()):
+
+        def test_venues(client, query_budget):
+            with query_budget(3) as profile:
+                client.get('/venues')
+
+    A statement shape repeating twice counts as an N+1, unless n_plus_one_threshold says otherwise.
+    """
+    def budget(max_queries, n_plus_one_threshold=2):
+        return profiler.query_budget(max_queries, n_plus_one_threshold=n_plus_one_threshold)
+    return budget
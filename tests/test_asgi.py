@@ -0,0 +1,36 @@
+import asyncio
+
+from asgi import ASGIApp
+
+#----------------------------------------------------------------------------#
+# ASGI serving.
+#----------------------------------------------------------------------------#
+
+
+def _get(application, path):
+    messages = []
+
+    async def receive():
+        return {'type': 'http.request', 'body': b'', 'more_body': False}
+
+    async def send(message):
+        messages.append(message)
+
+    scope = {'type': 'http', 'http_version': '1.1', 'method': 'GET', 'path': path, 'query_string': b'', 'headers': []}
+    asyncio.run(application(scope, receive, send))
+    return messages
+
+
+def test_an_app_that_never_starts_its_response_answers_500(make_app):
+    app = make_app()
+    app.wsgi_app = lambda environ, start_response: [b'never sent']
+    messages = _get(ASGIApp(app, threads=1), '/')
+    assert messages[0]['type'] == 'http.response.start'
+    assert messages[0]['status'] == 500
+    assert [message.get('body') for message in messages[1:]] == [b'']
+
+
+def test_pages_are_served_over_asgi(app):
+    messages = _get(ASGIApp(app, threads=1), '/')
+    assert messages[0]['status'] == 200
+    assert b''.join(message.get('body', b'') for message in messages[1:])
@@ -0,0 +1,111 @@
+import sqlite3
+from datetime import datetime, timedelta
+
+import pytest
+
+from bookings import booking_conflicts, booking_index, free_slots, lock_bookings
+from cache import cache
+from bulk_import import import_records
+from models import db, Show
+
+#----------------------------------------------------------------------------#
+# Double bookings.
+#----------------------------------------------------------------------------#
+
+# long after the seeded shows, so only the shows of the tests are around
+EVENING = datetime(2031, 3, 1, 20, 0)
+
+
+def _add_show(venue_id, artist_id, start_time, duration=120):
+    show = Show(venue_id=venue_id, artist_id=artist_id, start_time=start_time, duration=duration)
+    db.session.add(show)
+    db.session.commit()
+    return show.id
+
+
+@pytest.fixture(params=['memory', 'query'])
+def booking_app(request, make_app):
+    return make_app(venues=5, artists=5, shows=20, BOOKING_BACKEND=request.param)
+
+
+def test_overlapping_shows_of_the_venue_or_the_artist_conflict(booking_app):
+    with booking_app.app_context():
+        show_id = _add_show(1, 1, EVENING)
+        # the same venue, the same artist, and both, an hour into the show
+        for venue_id, artist_id in ((1, 2), (2, 1), (1, 1)):
+            conflicts = booking_conflicts(venue_id, artist_id, EVENING + timedelta(hours=1), 60)
+            assert [conflict['id'] for conflict in conflicts] == [show_id]
+            assert conflicts[0]['end_time'] == EVENING + timedelta(hours=2)
+
+
+def test_shows_next_to_each_other_or_elsewhere_do_not_conflict(booking_app):
+    with booking_app.app_context():
+        show_id = _add_show(1, 1, EVENING)
+        assert booking_conflicts(1, 1, EVENING + timedelta(hours=2), 60) == []
+        assert booking_conflicts(1, 1, EVENING - timedelta(hours=1), 60) == []
+        assert booking_conflicts(2, 2, EVENING, 120) == []
+        # the show being moved does not conflict with itself
+        assert booking_conflicts(1, 1, EVENING + timedelta(minutes=30), 120, exclude=show_id) == []
+
+
+def test_free_slots_leave_out_the_booked_time(booking_app):
+    with booking_app.app_context():
+        _add_show(1, 1, EVENING)
+        slots = free_slots(1, EVENING - timedelta(hours=2), EVENING + timedelta(hours=4), 60)
+    assert slots == [{'start': EVENING - timedelta(hours=2), 'end': EVENING},
+                     {'start': EVENING + timedelta(hours=2), 'end': EVENING + timedelta(hours=4)}]
+
+
+def test_the_show_form_refuses_a_double_booking(app, client):
+    data = {'venue_id': '1', 'artist_id': '1', 'start_time': '2031-03-01 20:00:00', 'duration': '120'}
+    assert 'Show was successfully listed!' in client.post('/shows/create', data=data).get_data(as_text=True)
+
+    data.update(artist_id='2', start_time='2031-03-01 21:00:00')
+    response = client.post('/shows/create', data=data)
+    assert 'The venue or the artist is already booked from' in response.get_data(as_text=True)
+    with app.app_context():
+        assert Show.query.filter(Show.start_time >= EVENING).count() == 1
+
+
+def test_the_import_rejects_double_bookings(app):
+    errors = []
+    records = [
+        {'venue_id': 1, 'artist_id': 1, 'start_time': '2031-03-01T20:00:00', 'duration': 120},
+        # against the record before it
+        {'venue_id': 1, 'artist_id': 2, 'start_time': '2031-03-01T21:00:00', 'duration': 60},
+        {'venue_id': 2, 'artist_id': 2, 'start_time': '2031-03-01T21:00:00', 'duration': 60},
+    ]
+    with app.app_context():
+        summary = import_records('shows', records, on_error=lambda number, record_errors: errors.append(number))
+        assert (summary['imported'], summary['rejected']) == (2, 1)
+        assert errors == [2]
+
+        # and against the shows already booked
+        summary = import_records('shows', [{'venue_id': 3, 'artist_id': 1, 'start_time': '2031-03-01T21:30:00'}])
+        assert (summary['imported'], summary['rejected']) == (0, 1)
+
+
+def test_the_booking_index_is_rebuilt_once_shows_are_invalidated(make_app):
+    app = make_app(venues=5, artists=5, BOOKING_BACKEND='memory', CACHE_BACKEND='memory')
+    with app.app_context():
+        index = booking_index()
+        # as another worker process would, without the sessions of this one
+        with db.engine.begin() as connection:
+            connection.execute(Show.__table__.insert().values(venue_id=1, artist_id=1, start_time=EVENING, duration=120))
+        assert booking_index() is index
+
+        cache.invalidate('shows')
+        assert [conflict['start_time'] for conflict in booking_conflicts(1, 2, EVENING, 60)] == [EVENING]
+
+
+def test_other_writers_wait_while_a_booking_is_checked(app):
+    database = app.config['SQLALCHEMY_DATABASE_URI'][len('sqlite:///'):]
+    with app.app_context():
+        lock_bookings(1, 1)
+        other = sqlite3.connect(database, timeout=0.1)
+        with pytest.raises(sqlite3.OperationalError, match='locked'):
+            other.execute('UPDATE "Venue" SET name = name WHERE id = 1')
+        db.session.rollback()
+        other.execute('UPDATE "Venue" SET name = name WHERE id = 1')
+        other.rollback()
+        other.close()
@@ -0,0 +1,51 @@
+import time
+from datetime import datetime, timedelta
+
+from models import db, Show
+
+#----------------------------------------------------------------------------#
+# Conditional GET.
+#----------------------------------------------------------------------------#
+
+
+def test_upcoming_shows_listing_changes_when_a_show_starts(make_app):
+    app = make_app(venues=2, artists=2, UPCOMING_SHOWS_MAX_STALENESS=0)
+    starts_soon = datetime.utcnow() + timedelta(seconds=1)
+    with app.app_context():
+        db.session.add_all([Show(venue_id=1, artist_id=1, start_time=starts_soon, duration=60),
+                            Show(venue_id=2, artist_id=2, start_time=starts_soon + timedelta(days=1), duration=60)])
+        db.session.commit()
+    client = app.test_client()
+
+    response = client.get('/shows?upcoming=1')
+    etag = response.headers['ETag']
+    assert client.get('/shows?upcoming=1', headers={'If-None-Match': etag}).status_code == 304
+
+    time.sleep(max((starts_soon - datetime.utcnow()).total_seconds(), 0) + 0.1)
+    response = client.get('/shows?upcoming=1', headers={'If-None-Match': etag})
+    assert response.status_code == 200
+    assert response.headers['ETag'] != etag
+    assert response.last_modified is not None
+
+
+def test_venue_page_changes_each_time_one_of_its_shows_starts(make_app):
+    app = make_app(venues=1, artists=2, UPCOMING_SHOWS_MAX_STALENESS=0)
+    first = datetime.utcnow() + timedelta(seconds=1)
+    second = first + timedelta(seconds=1)
+    with app.app_context():
+        db.session.add_all([Show(venue_id=1, artist_id=1, start_time=first, duration=60),
+                            Show(venue_id=1, artist_id=2, start_time=second, duration=60)])
+        db.session.commit()
+    client = app.test_client()
+
+    time.sleep(max((first - datetime.utcnow()).total_seconds(), 0) + 0.1)
+    response = client.get('/venues/1')
+    etag, last_modified = response.headers['ETag'], response.last_modified
+    assert client.get('/venues/1', headers={'If-None-Match': etag}).status_code == 304
+
+    # the next show has already started, so only the start of the second one can move the page on
+    time.sleep(max((second - datetime.utcnow()).total_seconds(), 0) + 0.1)
+    response = client.get('/venues/1', headers={'If-None-Match': etag})
+    assert response.status_code == 200
+    assert response.headers['ETag'] != etag
+    assert response.last_modified > last_modified
@@ -0,0 +1,26 @@
+import tracemalloc
+
+from export import export_rows
+
+#----------------------------------------------------------------------------#
+# Export.
+#----------------------------------------------------------------------------#
+
+# far below the size of the exports, which would be held whole if they were buffered
+MAX_EXPORT_MEMORY = 5 * 1024 * 1024
+
+
+def test_exporting_a_large_table_keeps_memory_bounded(make_app):
+    app = make_app(venues=200, artists=400, shows=100000)
+    with app.app_context():
+        for data_format in ('csv', 'ndjson'):
+            exported = 0
+            tracemalloc.start()
+            try:
+                for chunk in export_rows('shows', data_format, batch_size=1000):
+                    exported += len(chunk)
+                current, peak = tracemalloc.get_traced_memory()
+            finally:
+                tracemalloc.stop()
+            assert exported > MAX_EXPORT_MEMORY, data_format
+            assert peak < MAX_EXPORT_MEMORY, data_format
@@ -0,0 +1,79 @@
+from datetime import datetime
+
+from dates import TIMEZONE_COOKIE
+from models import db, Venue, Artist, Show
+
+#----------------------------------------------------------------------------#
+# Venue and artist forms.
+#----------------------------------------------------------------------------#
+
+
+def _venue_form(**fields):
+    form = {'name': 'The Musical Hop', 'city': 'San Francisco', 'state': 'CA', 'address': '1015 Folsom Street',
+            'phone': '123-123-1234', 'website': 'https://www.themusicalhop.com', 'image_link': '',
+            'facebook_link': 'https://www.facebook.com/TheMusicalHop', 'genres': 'Jazz, Reggae'}
+    form.update(fields)
+    return form
+
+
+def _artist_form(**fields):
+    form = {'name': 'Guns N Petals', 'city': 'San Francisco', 'state': 'CA', 'phone': '326-123-5000',
+            'image_link': '', 'facebook_link': 'https://www.facebook.com/GunsNPetals', 'genres': 'Rock n Roll'}
+    form.update(fields)
+    return form
+
+
+def test_a_venue_with_the_name_of_another_in_the_same_city_is_refused(app, client):
+    client.post('/venues/create', data=_venue_form())
+    response = client.post('/venues/create', data=_venue_form(address='1 Other Street'))
+    assert 'A venue named The Musical Hop already exists in San Francisco, CA' in response.get_data(as_text=True)
+    with app.app_context():
+        assert Venue.query.filter_by(name='The Musical Hop').count() == 1
+
+    response = client.post('/venues/create', data=_venue_form(city='Oakland'))
+    assert 'was successfully listed' in response.get_data(as_text=True)
+
+
+def test_an_artist_with_the_name_of_another_in_the_same_city_is_refused(app, client):
+    client.post('/artists/create', data=_artist_form())
+    response = client.post('/artists/create', data=_artist_form(phone='326-123-5001'))
+    assert 'An artist named Guns N Petals already exists in San Francisco, CA' in response.get_data(as_text=True)
+    with app.app_context():
+        assert Artist.query.filter_by(name='Guns N Petals').count() == 1
+
+
+def test_renaming_a_venue_to_the_name_of_another_is_refused(app, client):
+    with app.app_context():
+        first, second = db.session.query(Venue.id, Venue.name, Venue.city, Venue.state).order_by(Venue.id).limit(2).all()
+    response = client.post('/venues/{}/edit'.format(second.id), follow_redirects=True,
+                           data=_venue_form(name=first.name, city=first.city, state=first.state))
+    assert 'Another venue with the same name already exists in that city and state' in response.get_data(as_text=True)
+    with app.app_context():
+        assert db.session.get(Venue, second.id).name == second.name
+
+
+def test_renaming_an_artist_to_the_name_of_another_is_refused(app, client):
+    with app.app_context():
+        first, second = db.session.query(Artist.id, Artist.name, Artist.city, Artist.state).order_by(Artist.id).limit(2).all()
+    response = client.post('/artists/{}/edit'.format(second.id), follow_redirects=True,
+                           data=_artist_form(name=first.name, city=first.city, state=first.state))
+    assert 'Another artist with the same name already exists in that city and state' in response.get_data(as_text=True)
+    with app.app_context():
+        assert db.session.get(Artist, second.id).name == second.name
+
+#----------------------------------------------------------------------------#
+# Show form.
+#----------------------------------------------------------------------------#
+
+
+def test_show_times_are_typed_in_the_visitors_timezone_and_stored_in_utc(app, client):
+    client.set_cookie(TIMEZONE_COOKIE, 'Europe/Berlin')
+    response = client.post('/shows/create', data={'venue_id': '1', 'artist_id': '1', 'start_time': '2030-07-01 20:00:00'})
+    assert 'Show was successfully listed!' in response.get_data(as_text=True)
+    with app.app_context():
+        show = Show.query.filter_by(venue_id=1, artist_id=1).order_by(Show.start_time.desc()).first()
+        assert show.start_time == datetime(2030, 7, 1, 18, 0)
+
+    # and shown to the visitor as typed
+    response = client.post('/shows/create', data={'venue_id': '1', 'artist_id': '1', 'start_time': '2030-07-01 21:00:00'})
+    assert 'already booked from Mon 07, 01, 2030 8:00PM' in response.get_data(as_text=True)
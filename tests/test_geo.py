@@ -0,0 +1,24 @@
+from datetime import datetime
+
+from cache import cache
+from geo import grid_index, nearby_venues
+from models import db, Venue
+
+#----------------------------------------------------------------------------#
+# Nearby venues.
+#----------------------------------------------------------------------------#
+
+
+def test_the_grid_index_is_rebuilt_once_listings_are_invalidated(make_app):
+    app = make_app(CACHE_BACKEND='memory')
+    with app.app_context():
+        index = grid_index()
+        # as another worker process would, without the sessions of this one
+        with db.engine.begin() as connection:
+            connection.execute(Venue.__table__.insert().values(
+                name='The Other Worker Hall', city='Oakland', state='CA', latitude=37.8044, longitude=-122.2712,
+                updated_at=datetime.utcnow()))
+        assert grid_index() is index
+
+        cache.invalidate('listings')
+        assert [venue['name'] for venue in nearby_venues(37.8, -122.27, 5)] == ['The Other Worker Hall']
@@ -0,0 +1,130 @@
+import csv
+import io
+from datetime import datetime
+
+import pytest
+
+from bulk_import import IMPORT_KINDS, import_records, read_records, validate_record
+from models import db, Show
+
+#----------------------------------------------------------------------------#
+# Bulk import.
+#----------------------------------------------------------------------------#
+
+
+@pytest.mark.parametrize('start_time, expected', [
+    ('2027-01-01 20:00', datetime(2027, 1, 1, 20, 0)),
+    ('2027-01-01T20:00:00', datetime(2027, 1, 1, 20, 0)),
+    ('2027-01-01T20:00:00.250000', datetime(2027, 1, 1, 20, 0, 0, 250000)),
+    ('2027-01-01T20:00:00+02:00', datetime(2027, 1, 1, 18, 0)),
+])
+def test_show_start_times_are_read_as_iso_8601(app, start_time, expected):
+    with app.test_request_context():
+        values, errors = validate_record(IMPORT_KINDS['shows'],
+                                         {'venue_id': '1', 'artist_id': '1', 'start_time': start_time})
+    assert errors == {}
+    assert values['start_time'] == expected
+
+
+@pytest.mark.parametrize('start_time', ['', 'tomorrow', '01/01/2027 20:00'])
+def test_shows_without_an_iso_8601_start_time_are_rejected(app, start_time):
+    with app.test_request_context():
+        values, errors = validate_record(IMPORT_KINDS['shows'],
+                                         {'venue_id': '1', 'artist_id': '1', 'start_time': start_time})
+    assert values is None
+    assert 'start_time' in errors
+
+
+@pytest.mark.parametrize('data_format', ['csv', 'ndjson'])
+def test_exported_shows_can_be_imported_again(app, client, data_format):
+    with client.get('/api/v1/export/shows?format={}'.format(data_format)) as response:
+        assert response.status_code == 200
+        document = response.get_data(as_text=True)
+    with app.app_context():
+        exported = db.session.query(Show.venue_id, Show.artist_id, Show.start_time, Show.duration) \
+            .order_by(Show.start_time, Show.id).all()
+        db.session.query(Show).delete()
+        db.session.commit()
+
+        stream = io.StringIO(document, newline='')
+        summary = import_records('shows', read_records(stream, data_format))
+
+        imported = db.session.query(Show.venue_id, Show.artist_id, Show.start_time, Show.duration) \
+            .order_by(Show.start_time, Show.id).all()
+    assert summary['rejected'] == 0
+    assert summary['imported'] == len(exported)
+    assert imported == exported
+
+
+def test_exported_shows_can_be_posted_to_the_import_api(app, client):
+    with client.get('/api/v1/export/shows?format=csv') as response:
+        exported = response.get_data()
+    assert len(list(csv.DictReader(io.StringIO(exported.decode('utf-8'))))) == 200
+
+    response = client.post('/api/v1/import/shows', data=exported, content_type='text/csv')
+    assert response.status_code == 200
+    summary = response.get_json()
+    assert summary['errors'] == []
+    assert summary['imported'] == 200
+
+
+@pytest.mark.parametrize('kind_name', ['venues', 'artists'])
+def test_links_may_be_left_out_of_imported_records(app, kind_name):
+    record = {'name': 'The Empty Room', 'city': 'Oakland', 'state': 'CA', 'address': '1 Main St',
+              'genres': 'Jazz', 'facebook_link': '', 'website': ''}
+    with app.test_request_context():
+        values, errors = validate_record(IMPORT_KINDS[kind_name], record)
+    assert errors == {}
+    assert values['facebook_link'] is None
+
+
+def test_links_of_imported_records_must_be_urls(app):
+    record = {'name': 'The Empty Room', 'city': 'Oakland', 'state': 'CA', 'address': '1 Main St',
+              'genres': 'Jazz', 'facebook_link': 'not a link'}
+    with app.test_request_context():
+        values, errors = validate_record(IMPORT_KINDS['venues'], record)
+    assert values is None
+    assert 'facebook_link' in errors
+
+
+@pytest.mark.parametrize('data_format', ['csv', 'ndjson'])
+def test_an_export_can_be_imported_into_an_empty_database(make_app, data_format):
+    source = make_app(venues=20, artists=40, shows=200)
+    target = make_app()
+    columns = {kind_name: (kind.model,) + tuple(getattr(kind.model, column) for column in kind.columns)
+               for kind_name, kind in IMPORT_KINDS.items()}
+
+    exported = {}
+    with source.app_context():
+        for kind_name, (model, *selected) in columns.items():
+            exported[kind_name] = db.session.query(*selected).order_by(model.id).all()
+    client = source.test_client()
+    for kind_name in ('venues', 'artists', 'shows'):
+        with client.get('/api/v1/export/{}?format={}'.format(kind_name, data_format)) as response:
+            document = response.get_data(as_text=True)
+        with target.app_context():
+            summary = import_records(kind_name, read_records(io.StringIO(document, newline=''), data_format))
+        assert summary['rejected'] == 0, kind_name
+
+    with target.app_context():
+        for kind_name, (model, *selected) in columns.items():
+            assert db.session.query(*selected).order_by(model.id).all() == exported[kind_name], kind_name
+
+
+def test_importing_through_the_api_sends_the_visitor_to_the_primary(app, client):
+    with client.get('/api/v1/export/shows?format=csv') as response:
+        exported = response.get_data()
+    response = client.post('/api/v1/import/shows', data=exported, content_type='text/csv')
+    assert response.status_code == 200
+    assert client.get_cookie('fyyur_last_write') is not None
+
+
+def test_imports_into_a_database_without_upserts_are_refused(app, client):
+    app.config['SQLALCHEMY_DATABASE_URI'] = 'mysql://fyyur@localhost/fyyur'
+    response = client.post('/api/v1/import/shows', data='venue_id,artist_id,start_time\n', content_type='text/csv')
+    assert response.status_code == 501
+    assert 'Bulk imports need PostgreSQL or SQLite' in response.get_json()['error']
+
+    result = app.test_cli_runner().invoke(args=['import-data', 'shows', '-'], input='venue_id,artist_id,start_time\n')
+    assert result.exit_code != 0
+    assert 'Bulk imports need PostgreSQL or SQLite' in result.output
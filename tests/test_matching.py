@@ -0,0 +1,53 @@
+from datetime import datetime
+
+import pytest
+
+from cache import cache
+from matching import feature_store, matching_available
+from models import db, Artist
+
+pytestmark = pytest.mark.skipif(not matching_available(), reason='matching needs NumPy')
+
+#----------------------------------------------------------------------------#
+# Feature store.
+#----------------------------------------------------------------------------#
+
+
+def _add_artist_elsewhere(name):
+    # as another worker process would, without the sessions of this one
+    with db.engine.begin() as connection:
+        return connection.execute(Artist.__table__.insert().values(
+            name=name, city='Oakland', state='CA', genres=['Jazz'], seeking_venue=True,
+            updated_at=datetime.utcnow())).inserted_primary_key[0]
+
+
+def test_the_feature_store_is_rebuilt_once_listings_are_invalidated(make_app):
+    app = make_app(venues=5, artists=5, CACHE_BACKEND='memory')
+    with app.app_context():
+        store = feature_store()
+        artist_id = _add_artist_elsewhere('The Other Worker')
+        assert feature_store() is store
+
+        cache.invalidate('listings')
+        assert artist_id in feature_store().tables[Artist].rows
+
+
+def test_the_feature_store_is_rebuilt_once_too_old(make_app):
+    app = make_app(venues=5, artists=5, MATCHING_STORE_MAX_AGE=0)
+    with app.app_context():
+        store = feature_store()
+        artist_id = _add_artist_elsewhere('The Other Worker')
+        rebuilt = feature_store()
+    assert rebuilt is not store
+    assert artist_id in rebuilt.tables[Artist].rows
+
+
+def test_writes_through_the_session_update_the_feature_store_in_place(make_app):
+    app = make_app(venues=5, artists=5, CACHE_BACKEND='memory')
+    with app.app_context():
+        store = feature_store()
+        artist = Artist(name='The Same Worker', city='Oakland', state='CA', genres=['Jazz'], seeking_venue=True)
+        db.session.add(artist)
+        db.session.commit()
+        assert feature_store() is store
+        assert artist.id in store.tables[Artist].rows
@@ -0,0 +1,80 @@
+from datetime import datetime
+
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy import inspect
+from sqlalchemy.schema import CreateIndex, CreateTable
+
+from archive import archive_cutoff, archive_shows
+from counters import refresh_counters
+from models import db, Venue, Artist, Show, ShowArchive
+
+#----------------------------------------------------------------------------#
+# Genres.
+#----------------------------------------------------------------------------#
+
+
+def test_genres_are_gin_indexed_on_postgresql_only(app):
+    for model, name in ((Venue, 'ix_venue_genres'), (Artist, 'ix_artist_genres')):
+        index = next(index for index in model.__table__.indexes if index.name == name)
+        assert 'USING gin (genres)' in str(CreateIndex(index).compile(dialect=postgresql.dialect()))
+        with app.app_context():
+            assert name not in {index['name'] for index in inspect(db.engine).get_indexes(model.__tablename__)}
+
+#----------------------------------------------------------------------------#
+# Shows.
+#----------------------------------------------------------------------------#
+
+
+def test_shows_are_keyed_by_id_and_start_time_like_their_partitions():
+    for model in (Show, ShowArchive):
+        assert [column.name for column in model.__table__.primary_key] == ['id', 'start_time']
+        assert not model.__table__.c.start_time.nullable
+        assert 'PRIMARY KEY (id, start_time)' in str(CreateTable(model.__table__).compile(dialect=postgresql.dialect()))
+        # SQLite numbers the rows of a table keyed by its ID alone
+        assert 'PRIMARY KEY (id)' in str(CreateTable(model.__table__).compile(dialect=sqlite.dialect()))
+
+
+def test_new_shows_get_an_id_from_the_database(app):
+    with app.app_context():
+        last_id = db.session.query(db.func.max(Show.id)).scalar()
+        show = Show(venue_id=1, artist_id=1, start_time=datetime(2031, 1, 1, 20, 0))
+        db.session.add(show)
+        db.session.commit()
+        assert show.id == last_id + 1
+        assert db.session.get(Show, (show.id, show.start_time)) is show
+
+
+def test_archived_shows_keep_their_id(make_app):
+    app = make_app(venues=5, artists=5, shows=50, now=datetime(2026, 10, 1))
+    with app.app_context():
+        cutoff = archive_cutoff(datetime(2026, 10, 1), 6)
+        old = db.session.query(Show.id, Show.start_time).filter(Show.start_time < cutoff).all()
+        summary = archive_shows(archive_after_months=6, current_time=datetime(2026, 10, 1))
+        assert summary['moved'] == len(old) > 0
+        assert db.session.query(ShowArchive.id, ShowArchive.start_time).order_by(ShowArchive.start_time, ShowArchive.id).all() \
+            == sorted(old, key=lambda show: (show.start_time, show.id))
+
+
+def test_deleting_a_venue_deletes_its_shows_and_their_counts(app, client):
+    with app.app_context():
+        venue_id, = db.session.query(Show.venue_id).group_by(Show.venue_id).order_by(db.func.count().desc()).first()
+        artist_ids = {artist_id for artist_id, in db.session.query(Show.artist_id).filter(Show.venue_id == venue_id)}
+        assert artist_ids
+
+    client.delete('/venues/{}'.format(venue_id))
+    with app.app_context():
+        assert db.session.get(Venue, venue_id) is None
+        assert Show.query.filter_by(venue_id=venue_id).count() == 0
+        for artist in Artist.query.filter(Artist.id.in_(artist_ids)):
+            shows = Show.query.filter_by(artist_id=artist.id).count()
+            assert artist.upcoming_shows_count + artist.past_shows_count == shows
+
+
+def test_a_show_starting_right_now_is_counted_once(app):
+    with app.app_context():
+        show = Show.query.order_by(Show.start_time).first()
+        refresh_counters(db.session, Venue, [show.venue_id], current_time=show.start_time)
+        venue = db.session.get(Venue, show.venue_id)
+        db.session.refresh(venue)
+        shows = Show.query.filter_by(venue_id=venue.id).count() + ShowArchive.query.filter_by(venue_id=venue.id).count()
+        assert venue.upcoming_shows_count + venue.past_shows_count == shows
@@ -0,0 +1,106 @@
+import re
+from contextlib import contextmanager
+
+import pytest
+
+from sqlalchemy import event
+
+import profiler
+from models import db, Venue, Artist
+from queries import entity_detail, shows_page
+
+#----------------------------------------------------------------------------#
+# Query counts.
+#----------------------------------------------------------------------------#
+
+
+def test_venue_listing_query_count_does_not_grow_with_the_venues(make_app, query_budget):
+    counts = []
+    for venues in (10, 300):
+        client = make_app(venues=venues, artists=20, shows=venues * 3).test_client()
+        # the validator's version query, the genre facets and the venues
+        with query_budget(3) as profile:
+            response = client.get('/venues')
+        assert response.status_code == 200
+        counts.append(profile.count)
+    assert counts[0] == counts[1]
+
+
+@pytest.mark.parametrize('path, budget', [
+    ('/artists', 3),
+    ('/shows', 2),
+    ('/shows?upcoming=1', 2),
+    ('/venues/1', 5),
+    ('/artists/1', 5),
+    ('/api/v1/venues', 1),
+    ('/api/v1/shows', 1),
+])
+def test_pages_stay_within_their_query_budget(client, query_budget, path, budget):
+    with query_budget(budget):
+        response = client.get(path)
+    assert response.status_code == 200
+
+#----------------------------------------------------------------------------#
+# Query plans.
+#----------------------------------------------------------------------------#
+
+
+@contextmanager
+def show_query_plans():
+    """Collects the SQLite query plan lines of every statement over Show run inside."""
+    statements = []
+
+    def capture(connection, cursor, statement, parameters, context, executemany):
+        if '"Show"' in statement and not statement.startswith('EXPLAIN'):
+            statements.append((statement, parameters))
+
+    plans = []
+    engine = db.engine
+    event.listen(engine, 'before_cursor_execute', capture)
+    try:
+        yield plans
+    finally:
+        event.remove(engine, 'before_cursor_execute', capture)
+    with engine.connect() as connection:
+        for statement, parameters in statements:
+            plans.append([row[-1] for row in connection.exec_driver_sql('EXPLAIN QUERY PLAN ' + statement, parameters)])
+
+
+def assert_show_read_through_index(plans, index):
+    lines = [line for plan in plans for line in plan if re.match(r'(SCAN|SEARCH) Show\b', line)]
+    assert lines
+    for line in lines:
+        assert 'INDEX' in line, line
+    assert any(index in line for line in lines), lines
+
+
+def test_entity_detail_reads_shows_through_the_entity_indexes(make_app):
+    app = make_app(venues=20, artists=40, shows=400, UPCOMING_SHOWS_MAX_STALENESS=0)
+    for model, index in ((Venue, 'ix_show_venue_id_start_time'), (Artist, 'ix_show_artist_id_start_time')):
+        with app.app_context():
+            with show_query_plans() as plans:
+                assert entity_detail(model, 3) is not None
+        assert_show_read_through_index(plans, index)
+        # the upcoming and the past page are both range searches on the index
+        searches = [line for plan in plans for line in plan if index in line]
+        assert any('start_time>?' in line for line in searches), searches
+        assert any('start_time<?' in line for line in searches), searches
+
+
+def test_shows_listing_reads_shows_through_the_start_time_index(make_app):
+    app = make_app(venues=20, artists=40, shows=400, UPCOMING_SHOWS_MAX_STALENESS=0)
+    for filters in ({}, {'upcoming_only': True}):
+        with app.app_context():
+            with show_query_plans() as plans:
+                assert shows_page(**filters)['shows']
+        assert_show_read_through_index(plans, 'ix_show_start_time_id')
+
+
+def test_a_template_rendered_without_a_recorded_start_is_ignored(app):
+    outer, inner = object(), object()
+    with app.app_context(), profiler.profile_queries() as profile:
+        profiler._template_rendered(app, template=inner, context={})
+        profiler._before_render_template(app, template=outer, context={})
+        profiler._template_rendered(app, template=inner, context={})
+        profiler._template_rendered(app, template=outer, context={})
+    assert profile.templates == 1
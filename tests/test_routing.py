@@ -0,0 +1,78 @@
+import shutil
+
+from sqlalchemy.pool import StaticPool
+
+from database import MeteredQueuePool
+from models import db
+
+#----------------------------------------------------------------------------#
+# Read replicas.
+#----------------------------------------------------------------------------#
+
+
+def _replicate(app, primary, replica):
+    # a replica catching up is a copy of the primary
+    with app.app_context():
+        db.engines['replica_0'].dispose()
+    shutil.copyfile(primary, replica)
+
+
+def _venue_form(name):
+    return {'name': name, 'city': 'Oakland', 'state': 'CA', 'address': '1 Main Street', 'phone': '',
+            'website': 'https://example.com', 'image_link': '', 'facebook_link': 'https://www.facebook.com/example',
+            'genres': 'Jazz'}
+
+
+def _make_replicated_app(make_app, tmp_path, **overrides):
+    replica = tmp_path / 'replica.db'
+    app = make_app(venues=10, artists=10, shows=20, CACHE_BACKEND='memory',
+                   DATABASE_REPLICA_URIS=['sqlite:///' + str(replica)], **overrides)
+    primary = app.config['SQLALCHEMY_DATABASE_URI'][len('sqlite:///'):]
+    _replicate(app, primary, replica)
+    return app, primary, replica
+
+
+def test_reads_go_to_the_primary_after_a_write(make_app, tmp_path):
+    app, primary, replica = _make_replicated_app(make_app, tmp_path)
+    client = app.test_client()
+    assert client.get('/venues').headers['X-DB-Route'] == 'replica_0'
+
+    client.post('/venues/create', data=_venue_form('The Lagging Room'))
+    response = client.get('/venues')
+    assert response.headers['X-DB-Route'] == 'primary'
+    assert 'The Lagging Room' in response.get_data(as_text=True)
+
+
+def test_pages_read_from_a_lagging_replica_are_not_cached_after_a_write(make_app, tmp_path):
+    app, primary, replica = _make_replicated_app(make_app, tmp_path)
+    writer, reader = app.test_client(), app.test_client()
+    writer.post('/venues/create', data=_venue_form('The Lagging Room'))
+
+    # the replica has not caught up: other visitors may not see the venue yet,
+    # but the page they get must not be what everyone is served from now on
+    response = reader.get('/venues')
+    assert response.headers['X-DB-Route'] == 'replica_0'
+    assert 'The Lagging Room' not in response.get_data(as_text=True)
+    assert 'The Lagging Room' in writer.get('/venues').get_data(as_text=True)
+
+    _replicate(app, primary, replica)
+    response = reader.get('/venues')
+    assert response.headers['X-DB-Route'] == 'replica_0'
+    assert 'The Lagging Room' in response.get_data(as_text=True)
+
+
+def test_pages_read_from_a_replica_are_cached_once_the_window_has_passed(make_app, tmp_path):
+    app, primary, replica = _make_replicated_app(make_app, tmp_path, READ_YOUR_WRITES_WINDOW=0)
+    client = app.test_client()
+    assert client.get('/venues').headers['X-Cache'] == 'MISS'
+    assert client.get('/venues').headers['X-Cache'] == 'HIT'
+
+
+def test_every_replica_gets_the_pool_settings_of_its_own_database(make_app, tmp_path):
+    app = make_app(DATABASE_REPLICA_URIS=['sqlite:///' + str(tmp_path / 'replica.db'), 'sqlite://'], DB_POOL_SIZE=3)
+    with app.app_context():
+        pools = {key: engine.pool for key, engine in db.engines.items()}
+    assert isinstance(pools[None], MeteredQueuePool) and pools[None].size() == 3
+    assert isinstance(pools['replica_0'], MeteredQueuePool) and pools['replica_0'].size() == 3
+    # SQLite in memory keeps its StaticPool, which has no size to set
+    assert isinstance(pools['replica_1'], StaticPool)
@@ -0,0 +1,23 @@
+from datetime import datetime
+
+from cache import cache
+from models import db, Venue
+from search import fallback_index, search
+
+#----------------------------------------------------------------------------#
+# Search.
+#----------------------------------------------------------------------------#
+
+
+def test_the_fallback_index_is_rebuilt_once_listings_are_invalidated(make_app):
+    app = make_app(venues=5, artists=5, CACHE_BACKEND='memory')
+    with app.app_context():
+        index = fallback_index(Venue)
+        # as another worker process would, without the sessions of this one
+        with db.engine.begin() as connection:
+            connection.execute(Venue.__table__.insert().values(
+                name='The Other Worker Hall', city='Oakland', state='CA', genres=['Jazz'], updated_at=datetime.utcnow()))
+        assert fallback_index(Venue) is index
+
+        cache.invalidate('listings')
+        assert [hit['name'] for hit in search(Venue, 'other worker')['data']] == ['The Other Worker Hall']
@@ -0,0 +1,51 @@
+import os
+import time
+from datetime import datetime, timedelta
+
+import pytest
+
+from dates import format_datetime, format_datetimes
+from models import db, Venue, Show
+from queries import shows_page
+
+#----------------------------------------------------------------------------#
+# Time basis.
+#----------------------------------------------------------------------------#
+
+
+@pytest.fixture
+def pacific_time():
+    # a server clock that is not on UTC, which show times are stored in
+    previous = os.environ.get('TZ')
+    os.environ['TZ'] = 'America/Los_Angeles'
+    time.tzset()
+    yield
+    if previous is None:
+        del os.environ['TZ']
+    else:
+        os.environ['TZ'] = previous
+    time.tzset()
+
+
+def test_shows_start_by_the_utc_clock_whatever_the_server_timezone(make_app, pacific_time):
+    # the listing reads Show itself rather than the upcoming shows summary
+    app = make_app(venues=2, artists=2, UPCOMING_SHOWS_MAX_STALENESS=0)
+    with app.app_context():
+        started = Show(venue_id=1, artist_id=1, start_time=datetime.utcnow() - timedelta(minutes=30))
+        starting = Show(venue_id=2, artist_id=2, start_time=datetime.utcnow() + timedelta(minutes=30))
+        db.session.add_all([started, starting])
+        db.session.commit()
+        venue = db.session.get(Venue, 1)
+        assert (venue.upcoming_shows_count, venue.past_shows_count) == (0, 1)
+        upcoming = [(show['venue_id'], show['start_time']) for show in shows_page(upcoming_only=True)['shows']]
+        assert upcoming == [(starting.venue_id, starting.start_time)]
+
+
+def test_a_list_of_show_times_is_formatted_like_each_one_across_a_dst_change(app):
+    # Los Angeles moved its clocks forward at 10:00 UTC on March 8th 2026
+    values = [datetime(2026, 3, 8, 9, 30) + timedelta(minutes=15 * number) for number in range(8)]
+    with app.test_request_context(headers={'Cookie': 'fyyur_timezone=America/Los_Angeles; fyyur_locale=fr_FR'}):
+        formatted = format_datetimes(values, 'full')
+        assert formatted == [format_datetime(value, 'full') for value in values]
+    # the local times jump from 1:45 to 3:00 in the morning
+    assert '1:45' in formatted[1] and '3:00' in formatted[2]
@@ -0,0 +1,193 @@
+import threading
+import time
+from datetime import datetime, timedelta
+
+from flask import current_app
+from sqlalchemy import and_, delete, exists, func, insert, select, text, union
+from sqlalchemy.exc import SQLAlchemyError
+
+from database import partition_names
+from models import db, Venue, Artist, Show, UpcomingShow, SummaryRefresh
+
+#----------------------------------------------------------------------------#
+# Upcoming shows summary.
+#----------------------------------------------------------------------------#
+
+# UpcomingShow holds the shows that have not started yet, with the names of their
+# venues and artists, so the upcoming show listings read one narrow table instead
+# of joining the shows to the venues and artists. It is refreshed incrementally by
+# refresh_upcoming_shows() (see the refresh-upcoming command) rather than by the
+# app, so readers only use it while it was refreshed within
+# UPCOMING_SHOWS_MAX_STALENESS seconds and query the shows directly otherwise.
+#
+# On PostgreSQL the table is partitioned by day: the refresh keeps a partition for
+# each of the next UPCOMING_SHOWS_PARTITION_DAYS days (later shows land in the
+# default partition) and drops the partitions of days that have passed.
+
+SUMMARY_NAME = 'upcoming_shows'
+
+# key of the advisory lock that keeps two refreshes from running at the same time
+_REFRESH_LOCK_KEY = 0x66797975  # 'fyyu'
+
+# the live rows of the summary, the shows joined to their venue and artist
+_LIVE_COLUMNS = [
+    Show.id, Show.start_time, Show.venue_id, Venue.name, Venue.image_link,
+    Show.artist_id, Artist.name, Artist.image_link,
+]
+_SUMMARY_COLUMNS = ['id', 'start_time', 'venue_id', 'venue_name', 'venue_image_link',
+                    'artist_id', 'artist_name', 'artist_image_link']
+
+_state = {'checked_at': 0.0, 'refreshed_at': None}
+_state_lock = threading.Lock()
+
+
+def _live_shows(criterion):
+    # the day is the calendar day of the start time, computed by the database
+    return select(*_LIVE_COLUMNS, func.date(Show.start_time)) \
+        .join(Venue, Show.venue_id == Venue.id) \
+        .join(Artist, Show.artist_id == Artist.id) \
+        .where(criterion)
+
+
+def _copy_live_shows(connection, criterion):
+    table = UpcomingShow.__table__
+    result = connection.execute(insert(table).from_select(_SUMMARY_COLUMNS + ['day'], _live_shows(criterion)))
+    return max(result.rowcount, 0)
+
+
+def refresh_upcoming_shows(full=False, current_time=None):
+    """Brings the upcoming shows summary up to date with the shows.
+
+    An incremental refresh drops the shows that have started or were deleted, and
+    copies again the shows changed since the last refresh together with the shows of
+    venues and artists changed since then (renames). It looks back
+    UPCOMING_SHOWS_REFRESH_OVERLAP seconds further, so that changes committed while
+    the last refresh ran are not missed. The first refresh, or a full one, copies
+    every upcoming show.
+
+    The refresh runs in one transaction, so readers keep seeing the previous summary
+    until it commits.
+
+    Keyword Arguments:
+        full {boolean} -- Rebuild the summary from scratch (default: {False})
+        current_time {datetime} -- The point in time that separates upcoming from past shows (default: {now})
+
+    Returns:
+        dict -- How many rows were expired, removed and copied, or None when another refresh is running.
+    """
+    current_time = current_time or datetime.utcnow()
+    started_at = datetime.utcnow()
+    config = current_app.config
+    table = UpcomingShow.__table__
+    postgresql = db.engine.dialect.name == 'postgresql'
+
+    if postgresql and not _maintain_partitions(current_time, config['UPCOMING_SHOWS_PARTITION_DAYS']):
+        return None
+    with db.engine.begin() as connection:
+        if postgresql and not _try_lock(connection):
+            return None
+        last_refreshed_at = connection.execute(
+            select(SummaryRefresh.refreshed_at).where(SummaryRefresh.name == SUMMARY_NAME)).scalar()
+
+        summary = {'full': full or last_refreshed_at is None, 'expired': 0, 'removed': 0, 'copied': 0}
+        if summary['full']:
+            summary['removed'] = max(connection.execute(delete(table)).rowcount, 0)
+            summary['copied'] = _copy_live_shows(connection, Show.start_time > current_time)
+        else:
+            since = last_refreshed_at - timedelta(seconds=config['UPCOMING_SHOWS_REFRESH_OVERLAP'])
+            summary['expired'] = max(connection.execute(delete(table).where(table.c.start_time <= current_time)).rowcount, 0)
+            # deleted shows, including those of deleted venues and artists
+            summary['removed'] = max(connection.execute(delete(table).where(
+                ~exists().where(Show.id == table.c.id))).rowcount, 0)
+            changed = select(union(
+                select(Show.id).where(Show.updated_at > since),
+                select(Show.id).join(Venue, Show.venue_id == Venue.id)
+                .where(Venue.updated_at > since, Show.start_time > current_time),
+                select(Show.id).join(Artist, Show.artist_id == Artist.id)
+                .where(Artist.updated_at > since, Show.start_time > current_time)).subquery().c.id)
+            connection.execute(delete(table).where(table.c.id.in_(changed)))
+            summary['copied'] = _copy_live_shows(connection, and_(Show.id.in_(changed), Show.start_time > current_time))
+
+        refresh = SummaryRefresh.__table__
+        if last_refreshed_at is None:
+            connection.execute(insert(refresh).values(name=SUMMARY_NAME, refreshed_at=started_at))
+        else:
+            connection.execute(refresh.update().where(refresh.c.name == SUMMARY_NAME).values(refreshed_at=started_at))
+
+    with _state_lock:
+        _state.update(checked_at=time.monotonic(), refreshed_at=started_at)
+    return summary
+
+
+def _try_lock(connection):
+    return connection.execute(select(func.pg_try_advisory_xact_lock(_REFRESH_LOCK_KEY))).scalar()
+
+
+def _maintain_partitions(current_time, days):
+    # partitions are created and dropped in their own short transaction, as both
+    # lock the whole table for a moment
+    parent = UpcomingShow.__tablename__
+    today = current_time.date()
+    with db.engine.begin() as connection:
+        if not _try_lock(connection):
+            return False
+        existing = partition_names(connection, parent)
+        for name in sorted(existing):
+            suffix = name[len(parent) + 1:]
+            if suffix.isdigit() and datetime.strptime(suffix, '%Y%m%d').date() < today:
+                connection.execute(text('DROP TABLE "{}"'.format(name)))
+        for offset in range(days):
+            day = today + timedelta(days=offset)
+            name = '{}_{:%Y%m%d}'.format(parent, day)
+            if name in existing:
+                continue
+            # a partition cannot take over rows of its range from the default
+            # partition, so they are copied again once it exists
+            connection.execute(text('DELETE FROM "{}_default" WHERE day = :day'.format(parent)), {'day': day})
+            connection.execute(text('CREATE TABLE "{}" PARTITION OF "{}" FOR VALUES FROM (\'{}\') TO (\'{}\')'.format(
+                name, parent, day.isoformat(), (day + timedelta(days=1)).isoformat())))
+            start = datetime.combine(day, datetime.min.time())
+            _copy_live_shows(connection, and_(Show.start_time > max(start, current_time),
+                                              Show.start_time < start + timedelta(days=1)))
+    return True
+
+
+def refreshed_at():
+    """When the summary was last refreshed (UTC), re-read from the database at most every
+    UPCOMING_SHOWS_CHECK_INTERVAL seconds.
+
+    Returns:
+        datetime -- The start of the last refresh, or None when it was never refreshed.
+    """
+    now = time.monotonic()
+    with _state_lock:
+        if now - _state['checked_at'] < current_app.config['UPCOMING_SHOWS_CHECK_INTERVAL']:
+            return _state['refreshed_at']
+    try:
+        value = db.session.query(SummaryRefresh.refreshed_at).filter(SummaryRefresh.name == SUMMARY_NAME).scalar()
+    except SQLAlchemyError:
+        # e.g. the migration creating the summary has not run yet
+        db.session.rollback()
+        value = None
+    with _state_lock:
+        _state.update(checked_at=now, refreshed_at=value)
+    return value
+
+
+def summary_fresh():
+    """Whether the upcoming show listings may read the summary: it was refreshed
+    within UPCOMING_SHOWS_MAX_STALENESS seconds.
+    """
+    max_staleness = current_app.config['UPCOMING_SHOWS_MAX_STALENESS']
+    last_refresh = refreshed_at()
+    return bool(max_staleness) and last_refresh is not None and \
+        (datetime.utcnow() - last_refresh).total_seconds() <= max_staleness
+
+
+def summary_version():
+    """Identifies the summary the upcoming show listings are read from, for their validators.
+
+    Returns:
+        datetime -- The last refresh while the summary is in use, or None while the shows are queried directly.
+    """
+    return refreshed_at() if summary_fresh() else None